@@ -1,6 +1,6 @@
 import os
-from PIL import Image
-import pillow_avif
+import logging
+from convert_engine import ConvertJob, run_batch
 
 print("图片文件格式转换.")
 print("支持avif.png.jpg/jpeg.webp格式互相转换")
@@ -31,27 +31,21 @@ elif output_format == 'webp':
 elif output_format == 'avif':
     quality = int(input("请输入 AVIF 质量 (1-63，默认值为 50): ") or "50")
 
-for file in input_files:
-    # 使用Pillow打开图片
-    img = Image.open(os.path.join(input_dir, file))
-
-    # 输出为选择的格式
-    output_name = f'{os.path.splitext(file)[0]}.{output_format}'
-    output_path = os.path.join(output_dir, output_name)
-
-    # 根据选定的格式进行保存
-    if output_format == 'jpg':
-        img.save(output_path, 'JPEG', quality=quality)
-    elif output_format == 'png':
-        img.save(output_path, 'PNG', optimize=True, compress_level=compress_level)
-    elif output_format == 'webp':
-        img.save(output_path, 'WEBP', quality=quality)
-    elif output_format == 'avif':
-        img.save(output_path, 'AVIF', quality=quality)
-    else:
-        print("无法识别的格式 {}. 跳过 {} 文件.".format(output_format, file))
-        continue
-
-    print(f"{file} 已成功转换为 {output_name}")
+if output_format not in ('jpg', 'png', 'webp', 'avif'):
+    print(f"无法识别的格式 {output_format}.")
+    exit()
+
+job = ConvertJob(
+    img_format=output_format,
+    quality=quality if output_format != 'png' else 6,
+    compress=compress_level if output_format == 'png' else 6,
+    output_dir=output_dir,
+    preserve_alpha=True,
+)
+
+# 转换流程与 GUI/命令行共用 convert_engine
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+run_batch([os.path.join(input_dir, f) for f in input_files], job, logging.getLogger(__name__),
+          exts=tuple(supported_formats))
 
 print("转换完成!")
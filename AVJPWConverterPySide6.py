@@ -1,39 +1,222 @@
 import sys
 import os
+import queue
+import shutil
+import tempfile
 import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import logging
-import time
-import pillow_avif
 import warnings
-from PIL import Image, ImageEnhance
-from send2trash import send2trash
-from PySide6.QtCore import Qt, Signal, QUrl, QObject
+from PySide6.QtCore import Qt, Signal, QUrl, QObject, QTimer, QAbstractTableModel, QModelIndex
 from PySide6.QtGui import QDragEnterEvent, QDropEvent, QDesktopServices, QFont
 from PySide6.QtWidgets import (
-    QApplication, QMainWindow, QPushButton, QLineEdit, QTextEdit,
+    QApplication, QMainWindow, QPushButton, QLineEdit, QPlainTextEdit,
     QFileDialog, QVBoxLayout, QWidget, QLabel, QComboBox, QSpinBox,
-    QHBoxLayout, QFormLayout, QGroupBox, QTableWidget, QTableWidgetItem,
+    QHBoxLayout, QFormLayout, QGroupBox, QTableView,
     QDialog, QHeaderView, QCheckBox, QGridLayout, QDoubleSpinBox)
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-import psutil
 import multiprocessing
 import configparser
+import convert_pool
+import convert_engine
+from convert_engine import ConvertJob, format_eta
+from convert_targets import parse_targets, check_targets
+from convert_manifest import MANIFEST_NAME
+from convert_metrics import METRICS_NAME
+from convert_dedup import CACHE_DIR_NAME
+from file_discovery import FileStream
+from resize_plan import read_info, calc_target_size, estimate_output_bytes
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-# 自定义日志处理类
-class LogEmitter(QObject):
-    log_message = Signal(str)
+# 日志区最多保留的行数(更早的行从控件中移除，完整日志可导出)
+LOG_MAX_LINES = 5000
+# 日志/进度刷新到界面的间隔(毫秒)
+LOG_FLUSH_MS = 100
+
+class LogChannel(QObject):
+    """工作线程 -> 界面的日志和进度通道
+
+    任意线程只把日志行放入线程安全队列、把最新进度文本存入变量，不直接操作控件；
+    主线程 QTimer 每 LOG_FLUSH_MS 毫秒一次性取出全部日志追加到控件，进度只刷新最后一次。
+    界面开销只与刷新次数有关，不再随文件数增长。完整日志追加到临时文件(不占内存)，供导出。
+    """
+
+    def __init__(self, log_output, progress_label, interval=LOG_FLUSH_MS):
+        super().__init__()
+        self.log_output = log_output
+        self.progress_label = progress_label
+        self._history = tempfile.TemporaryFile('w+', encoding='utf-8')  # 关闭(或程序退出)时自动删除
+        self._queue = queue.SimpleQueue()
+        self._progress = None
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.flush)
+        self._timer.start(interval)
+
+    def put(self, msg):
+        self._queue.put(msg)
+
+    def set_progress(self, text):
+        self._progress = text  # 只保留最新的进度，刷新时显示
+
+    def flush(self):
+        lines = []
+        try:
+            while True:
+                lines.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        if lines:
+            self._history.write("\n".join(lines) + "\n")
+            # 单次刷新超过上限时只追加最后 LOG_MAX_LINES 行，其余已在临时文件中
+            self.log_output.appendPlainText("\n".join(lines[-LOG_MAX_LINES:]))
+        progress, self._progress = self._progress, None
+        if progress is not None:
+            self.progress_label.setText(progress)
+
+    def clear(self):
+        self._history.seek(0)
+        self._history.truncate()
+        self.log_output.clear()
+
+    def export(self, path):
+        """完整日志写入文件(包括已从控件中移除的行)"""
+        self.flush()
+        self._history.seek(0)
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                shutil.copyfileobj(self._history, f)
+        finally:
+            self._history.seek(0, os.SEEK_END)
 
 class TextHandler(logging.Handler):
-    def __init__(self, emitter):
+    def __init__(self, channel):
         super().__init__()
-        self.emitter = emitter
+        self.channel = channel
 
     def emit(self, record):
         msg = self.format(record)
-        self.emitter.log_message.emit(msg)
+        self.channel.put(msg)
+
+def format_bytes(size):
+    """字节数格式化为 B/KB/MB"""
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.0f} KB"
+    return f"{size / 2**20:.1f} MB"
+
+class FileListModel(QAbstractTableModel):
+    """文件列表虚拟模型：行只保存路径，与转换相同的 FileStream 流式遍历
+
+    定时器把遍历线程已发现的文件整批插入模型(队列不限长度，遍历不受刷新间隔限制)；大小/尺寸/格式/预估输出几列只在视图
+    请求显示时(即可见行)才交给后台线程读取文件头，结果缓存后按批刷新。
+    settings: dict(img_format, quality, height, width, adjust_height, adjust_width)，用于预估输出大小。
+    """
+    HEADERS = ['文件路径', '大小', '尺寸', '格式', '预估输出']
+    MAX_IN_FLIGHT = 8     # 同时读取文件头的数量
+    MAX_WANTED = 512      # 等待读取的行数上限，快速滚动时丢弃已滚出视野的旧请求
+
+    def __init__(self, input_files, settings, parent=None):
+        super().__init__(parent)
+        self.settings = settings
+        self.files = []
+        self.meta = {}  # 行号 -> (大小, 尺寸, 格式, 预估输出) 显示文本
+        self._wanted = collections.deque(maxlen=self.MAX_WANTED)  # 待读取的行，后请求(当前可见)的优先
+        self._requested = set()
+        self._in_flight = 0
+        self._results = queue.SimpleQueue()
+        self._probe = ThreadPoolExecutor(max_workers=self.MAX_IN_FLIGHT)
+        self._pending = set()  # 未完成的读取任务，关闭时取消(Python 3.8 的 shutdown 没有 cancel_futures)
+        self.stream = FileStream(input_files, maxsize=0).start()
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._flush)
+        self._timer.start(LOG_FLUSH_MS)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.files)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        row, col = index.row(), index.column()
+        if role == Qt.TextAlignmentRole and col > 0:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role != Qt.DisplayRole:
+            return None
+        if col == 0:
+            return self.files[row]
+        meta = self.meta.get(row)
+        if meta is None:
+            self._request(row)
+            return "…"
+        return meta[col - 1]
+
+    def _request(self, row):
+        if row not in self._requested:
+            if len(self._wanted) == self._wanted.maxlen:
+                # 最早的请求将被挤掉(已滚出视野)，再次可见时重新请求
+                self._requested.discard(self._wanted[0])
+            self._requested.add(row)
+            self._wanted.append(row)
+
+    def _read(self, row, path):
+        """后台线程：stat + 读文件头，结果放入队列由定时器刷新"""
+        try:
+            size = format_bytes(os.path.getsize(path))
+        except OSError:
+            size = "-"
+        info = read_info(path)
+        if info is None:
+            self._results.put((row, (size, "-", "无法读取", "-")))
+            return
+        width, height, mode, fmt = info
+        s = self.settings
+        target_size = calc_target_size(width, height, s['height'], s['width'], s['adjust_height'], s['adjust_width'])
+        out_w, out_h = target_size or (width, height)
+        estimate = estimate_output_bytes(out_w * out_h, s['img_format'], s['quality'])
+        self._results.put((row, (size, f"{width}x{height}", f"{fmt} {mode}", f"≈{format_bytes(estimate)}")))
+
+    def _flush(self):
+        # 新发现的文件按批插入
+        found = self.stream.poll()
+        if found:
+            start = len(self.files)
+            self.beginInsertRows(QModelIndex(), start, start + len(found) - 1)
+            self.files.extend(found)
+            self.endInsertRows()
+        # 已读取的文件头刷新到视图
+        changed = []
+        try:
+            while True:
+                row, meta = self._results.get_nowait()
+                self.meta[row] = meta
+                self._in_flight -= 1
+                changed.append(row)
+        except queue.Empty:
+            pass
+        if changed:
+            self.dataChanged.emit(self.index(min(changed), 1), self.index(max(changed), len(self.HEADERS) - 1))
+        while self._wanted and self._in_flight < self.MAX_IN_FLIGHT:
+            row = self._wanted.pop()
+            self._in_flight += 1
+            future = self._probe.submit(self._read, row, self.files[row])
+            self._pending.add(future)
+            future.add_done_callback(self._pending.discard)
+
+    def close(self):
+        self._timer.stop()
+        self.stream.close()
+        for future in list(self._pending):
+            future.cancel()
+        self._probe.shutdown(wait=False)
 
 log = logging.getLogger(__name__)
 
@@ -56,154 +239,36 @@ class DraggableLineEdit(QLineEdit):
         self.setText(";".join(unique_paths))
         log.info(f"拖放的文件: {';'.join(paths)}")  # 记录日志
 
-# 全局变量用来控制转换过程
-conversion_paused = threading.Event()
+# 全局变量用来控制转换过程(进程池工作进程也共享此事件)
+conversion_paused = convert_pool.new_event()
 conversion_paused.set()  # 初始为“运行”状态
 conversion_stopped = False  # 新增全局停止标志
 
-def process_file(file, output_dir, img_format, quality, compress, height, width,
-                delete_original, adjust_height, adjust_width, sharpness, 
-                preserve_metadata, log, method=None, speed=None, preserve_alpha=False, lossless=False, subsample=None, resample=None):
-    logs = []
-    try:
-        # 使用 pathlib 处理路径
-        file_path = Path(file)
-        image = Image.open(str(file_path))
-        file_name = file_path.name
-
-        # 如果是1 BPP黑白图，先转为灰度，避免细节损失
-        if image.mode == '1':
-            image = image.convert('L')
-
-        # 避免P模式(调色板图像)转换异常统一转为RGBA
-        if image.mode == 'P':
-            image = image.convert('RGBA')
-
-        # 如果导出为JPG，去掉透明度转为RGB
-        if img_format.lower() in ("jpg", "jpeg") and image.mode != 'RGB':
-            image = image.convert('RGB')
-
-        # 新增：选框决定是否保留透明通道
-        if not preserve_alpha and img_format.lower() in ("png", "webp", "avif"):
-            if image.mode in ('RGBA', 'LA'):
-                image = image.convert('RGB')
-
-        # 如果需要调整高度或宽度，则调整图像大小，保持纵横比，不放大较小的图片
-        if (adjust_height and image.height > height) or (adjust_width and image.width > width):
-            aspect_ratio = image.width / image.height
-            if adjust_height and adjust_width:
-                # 取高宽最低的那个数值为主
-                if height < width / aspect_ratio:
-                    new_height = height
-                    new_width = round(height * aspect_ratio)
-                else:
-                    new_width = width
-                    new_height = round(width / aspect_ratio)
-            elif adjust_height:
-                new_height = height
-                new_width = round(height * aspect_ratio)
-            elif adjust_width:
-                new_width = width
-                new_height = round(width / aspect_ratio)
-            # 选择重采样算法
-            resample_map = {
-                "LANCZOS": Image.LANCZOS,
-                "BICUBIC": Image.BICUBIC,
-                "BILINEAR": Image.BILINEAR,
-                "NEAREST": Image.NEAREST,
-            }
-            resample_method = resample_map.get(resample, Image.LANCZOS)
-            image = image.resize((new_width, new_height), resample_method)
-
-        # 添加锐化处理：当锐化因子不为默认值 1.0 时，进行图像锐化
-        if sharpness != 1.0:
-            enhancer = ImageEnhance.Sharpness(image)
-            image = enhancer.enhance(sharpness)
-
-        # 根据是否指定了输出目录，决定文件的输出路径
-        if output_dir:  # 如果指定了输出路径
-            output_dir_path = Path(output_dir)
-            new_file_path = output_dir_path / file_name
-            new_file_name = new_file_path.with_suffix(f'.{img_format}').name
-            new_file_path = output_dir_path / new_file_name
-        else:  # 如果未指定输出路径，使用文件的原目录
-            new_file_name = file_path.with_suffix(f'.{img_format}').name
-            file_output_dir = file_path.parent  # 使用文件的原目录作为输出目录
-            new_file_path = file_output_dir / new_file_name
-
-        # 检查输出路径是否存在，不存在则创建
-        new_file_path.parent.mkdir(parents=True, exist_ok=True)
-
-        # 变换图像并保存
-        save_kwargs = {}
-        # 色彩子采样参数
-        if subsample and img_format in ["jpg", "jpeg", "avif"]:
-            save_kwargs["subsampling"] = subsample
-        if img_format in ["jpg", "jpeg", "webp", "avif"]:
-            if img_format == "webp":
-                # 支持无损webp
-                if lossless:
-                    image.save(str(new_file_path), lossless=True, method=method if method is not None else 6)
-                else:
-                    image.save(str(new_file_path), quality=quality, method=method if method is not None else 6)
-            elif img_format == "avif":
-                # 支持AVIF无损
-                if lossless:
-                    image.save(str(new_file_path), lossless=True, speed=speed if speed is not None else 4, **save_kwargs)
-                else:
-                    image.save(str(new_file_path), quality=quality, speed=speed if speed is not None else 4, **save_kwargs)
-            else:
-                image.save(str(new_file_path), quality=quality, **save_kwargs)
-        elif img_format == "png":
-            image.save(str(new_file_path), compress_level=compress)
-
-        # 是否保留元数据
-        if preserve_metadata:
-            original_stat = file_path.stat()
-            os.utime(str(new_file_path), (original_stat.st_atime, original_stat.st_mtime))
-
-        logs.append(f"{file_path.name:<50} 成功转为{img_format}")
-
-        # 如果选择了删除原文件，则删除
-        if delete_original:
-            absolute_path = str(file_path.resolve())
-            send2trash(absolute_path)
-
-        return True, logs
-    except Exception as e:
-        logs.append(f"转换 {file} 失败。错误原因: {e}")
-        return False, logs
+def run_conversion(input_files, job, pause_event, stop_event, log, set_progress, on_finished,
+                   thread_count=None, backend="thread", incremental=False, manifest_path=None,
+                   schedule="stream", memory_budget=None, metrics_path=None, dedup_cache=None):
+    """在后台线程中执行批量转换(转换流程见 convert_engine.run_batch)
 
-def run_conversion(input_files, output_dir, img_format, quality, compress, height, width,
-                   delete_original, adjust_height, adjust_width, sharpness, pause_event,
-                   stop_event, log, progress_label, preserve_metadata, on_finished,
-                   thread_count=None, method=None, speed=None, preserve_alpha=False, lossless=False, subsample=None, resample=None):
+    set_progress(text): 更新进度文本，须线程安全(GUI 中为 LogChannel.set_progress)
+    dedup_cache: 内容去重缓存目录，None 不去重
+    """
     global conversion_stopped
     conversion_stopped = False
 
-    def set_low_priority():
-        try:
-            p = psutil.Process(os.getpid())
-            p.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
-        except Exception as e:
-            log.warning(f"无法设置低优先级: {e}")
+    def on_progress(progress):
+        text = f"转换失败: {progress['failed']} 已完成/已发现: {progress['completed']}/{progress['discovered']}"
+        if progress['eta'] is not None:
+            text += f" 预计剩余: {format_eta(progress['eta'])}"
+        set_progress(text)
 
     try:
-        set_low_priority()
+        # 不降低界面进程本身的优先级(Linux 上无法再调回)，由执行器只降低工作线程/进程
         log.info("开始转换过程：")
-        if sharpness != 1.0:
-            log.info(f"锐化因子：{sharpness}")
-
-        files = []
-        for input_path in input_files:
-            p = Path(input_path)
-            if p.is_dir():
-                files += [str(f) for f in p.rglob('*') if f.suffix.lower() in ['.png', '.jpg', '.jpeg', '.webp', '.avif', '.gif']]
-            elif p.is_file() and p.suffix.lower() in ['.png', '.jpg', '.jpeg', '.webp', '.avif', '.gif']:
-                files.append(str(p))
-
-        if output_dir:
-            log.info(f"输出路径指定为: {output_dir}")
+        if job.sharpness != 1.0:
+            log.info(f"锐化因子：{job.sharpness}")
+
+        if job.output_dir:
+            log.info(f"输出路径指定为: {job.output_dir}")
         else:
             if len(input_files) == 1:
                 p = Path(input_files[0])
@@ -214,62 +279,18 @@ def run_conversion(input_files, output_dir, img_format, quality, compress, heigh
             else:
                 log.info(f"输出路径为空，输出在原文件路径.公共路径: {os.path.commonpath(input_files)}")
 
-        total_files = len(files)
-        failed_count = 0
-        completed_count = 0
+        stats = convert_engine.run_batch(
+            input_files, job, log, workers=thread_count, backend=backend, schedule=schedule,
+            incremental=incremental, manifest_path=manifest_path,
+            pause_event=pause_event, stop_event=stop_event, on_progress=on_progress,
+            memory_budget=memory_budget, metrics_path=metrics_path,
+            dedup="bytes" if dedup_cache else None, dedup_cache=dedup_cache)
+        set_progress(f"转换失败: {stats['failed']} 已完成/已发现: {stats['completed']}/{stats['discovered']}")
 
-        if thread_count is not None:
-            max_workers = thread_count
+        if stats['stopped']:
+            log.info("转换被用户终止")
         else:
-            max_workers = multiprocessing.cpu_count()
-        max_workers = max(1, max_workers)
-        log.info(f"使用线程数: {max_workers}")
-
-        progress = [None] * total_files
-
-        def file_task(idx, file):
-            # 检查暂停/停止
-            while not pause_event.is_set():
-                if stop_event.is_set():
-                    return 'stopped', idx, file, []
-                time.sleep(0.1)
-            if stop_event.is_set():
-                return 'stopped', idx, file, []
-            try_count = 0
-            max_try = 3
-            while try_count < max_try:
-                if stop_event.is_set():
-                    return 'stopped', idx, file, []
-                try:
-                    ok, logs = process_file(
-                        file, output_dir, img_format, quality, compress, height, width,
-                        delete_original, adjust_height, adjust_width, sharpness, preserve_metadata, log,
-                        method=method, speed=speed, preserve_alpha=preserve_alpha, lossless=lossless,
-                        subsample=subsample, resample=resample
-                    )
-                    return ok, idx, file, logs
-                except Exception as e:
-                    logs = [f"转换 {file} 失败。错误原因: {e}"]
-                    try_count += 1
-                    time.sleep(1)
-            return False, idx, file, logs
-
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-
-            # --- 顺序输出日志 ---
-            results = executor.map(lambda args: file_task(*args), enumerate(files))
-            for idx, (ok, idx2, file, logs) in enumerate(results):
-                # 顺序输出日志
-                for msg in logs:
-                    log.info(msg)
-                progress[idx] = ok
-                completed_count = sum(1 for v in progress if v is True)
-                failed_count = sum(1 for v in progress if v is False)
-                progress_label.setText(f"转换失败: {failed_count} 已完成/总数: {completed_count}/{total_files}")
-                if ok == 'stopped':
-                    log.info("转换被用户终止")
-                    break
-
+            log.info(f"共发现 {stats['discovered']} 个文件")
         log.info("所有图像转换已完成！")
     except Exception as e:
         log.error(f"转换过程发生错误: {str(e)}")
@@ -358,17 +379,66 @@ class MainWindow(QMainWindow):
         self.cpu_combo.setCurrentText(str(cpu_count))
         self.cpu_combo.setFixedWidth(30)
         cpu_label = make_label("线程")
+        # 新增：多进程后端复选框
+        self.process_pool_checkbox = QCheckBox("多进程")
+        self.process_pool_checkbox.setChecked(False)
+        self.process_pool_checkbox.setToolTip("使用进程池代替线程池，绕开GIL，多核CPU满载(启动稍慢)")
+        # 新增：内存预算(0 为不限制)
+        self.memory_budget_spin = QSpinBox()
+        self.memory_budget_spin.setRange(0, 1024 * 1024)
+        self.memory_budget_spin.setSingleStep(1024)
+        self.memory_budget_spin.setSuffix(" MB")
+        self.memory_budget_spin.setSpecialValueText("不限")
+        self.memory_budget_spin.setValue(0)
+        self.memory_budget_spin.setToolTip("按文件头估算每个任务的峰值内存，同时转换的任务总和不超过预算，避免超大图片并发解码导致内存耗尽")
+        # 新增：分条处理阈值(0 为关闭)和源图像素上限(0 为 Pillow 默认)
+        self.tile_spin = QSpinBox()
+        self.tile_spin.setRange(0, 100000)
+        self.tile_spin.setSingleStep(50)
+        self.tile_spin.setSuffix(" MP")
+        self.tile_spin.setSpecialValueText("关闭")
+        self.tile_spin.setValue(0)
+        self.tile_spin.setToolTip("源图超过该像素数(百万)且需要缩小时分条处理：PNG 分条解码并缩小，JPEG 缩小解码，内存只与输出大小相关")
+        self.max_pixels_spin = QSpinBox()
+        self.max_pixels_spin.setRange(0, 100000)
+        self.max_pixels_spin.setSingleStep(100)
+        self.max_pixels_spin.setSuffix(" MP")
+        self.max_pixels_spin.setSpecialValueText("默认")
+        self.max_pixels_spin.setValue(0)
+        self.max_pixels_spin.setToolTip("源图像素上限(百万)，超过则跳过该文件；默认沿用 Pillow 的约 179 MP 保护，处理全景/扫描大图时调高")
+        # 新增：大文件优先调度复选框
+        self.largest_first_checkbox = QCheckBox("大文件优先")
+        self.largest_first_checkbox.setChecked(False)
+        self.largest_first_checkbox.setToolTip("遍历完成后读取文件头按像素数从大到小转换，缩短混合大小批次的总耗时")
         output_top_layout = QHBoxLayout()
         output_top_layout.addWidget(self.output_button)
         output_top_layout.addWidget(self.open_output_button)  # 放在选择输出路径按钮后
         output_top_layout.addStretch()
         output_top_layout.addWidget(cpu_label)
         output_top_layout.addWidget(self.cpu_combo)
+        output_top_layout.addWidget(make_label("内存"))
+        output_top_layout.addWidget(self.memory_budget_spin)
+        output_top_layout.addWidget(make_label("分条"))
+        output_top_layout.addWidget(self.tile_spin)
+        output_top_layout.addWidget(make_label("上限"))
+        output_top_layout.addWidget(self.max_pixels_spin)
+        output_top_layout.addWidget(self.process_pool_checkbox)
+        output_top_layout.addWidget(self.largest_first_checkbox)
         output_layout.addRow(output_top_layout)
         output_path_layout = QHBoxLayout()
         output_path_layout.addWidget(make_label("输出路径:"))
         output_path_layout.addWidget(self.output_line)
         output_layout.addRow(output_path_layout)
+        # 新增：附加输出(一次解码输出多种格式/尺寸)
+        self.extra_targets_line = QLineEdit()
+        self.extra_targets_line.setPlaceholderText("附加输出，如 webp:q=80;jpg:q=85,h=480,suffix=_s,dir=small")
+        self.extra_targets_line.setToolTip(
+            "格式[:键=值,...]，多个用;分隔，每个源文件只解码一次\n"
+            "键: q质量 method speed h高 w宽 suffix文件名后缀 dir子目录 subsample lossless")
+        extra_targets_layout = QHBoxLayout()
+        extra_targets_layout.addWidget(make_label("附加输出:"))
+        extra_targets_layout.addWidget(self.extra_targets_line)
+        output_layout.addRow(extra_targets_layout)
         output_group.setLayout(output_layout)
 
         # 格式选项
@@ -381,6 +451,20 @@ class MainWindow(QMainWindow):
         self.format_combo.setFixedWidth(50)
         self.quality_label = QLabel("AVIF质量")
         self.quality_spin = make_spinbox(1, 63, 63, tooltip="AVIF 质量 (1-63，默认值为 63)")
+        # 新增：目标体积(0 为不限，使用固定质量)
+        self.target_size_spin = make_spinbox(0, 100 * 1024, 0, width=75,
+                                             tooltip="AVIF/WebP/JPG 按图搜索不超过该体积的最高质量，先在缩小的代理图上试编码，完整编码最多3次")
+        self.target_size_spin.setSuffix(" KB")
+        self.target_size_spin.setSpecialValueText("不限")
+        self.target_size_spin.setSingleStep(50)
+        # 新增：目标 SSIM(0 为不限)
+        self.target_ssim_spin = QDoubleSpinBox()
+        self.target_ssim_spin.setRange(0.0, 0.999)
+        self.target_ssim_spin.setDecimals(3)
+        self.target_ssim_spin.setSingleStep(0.005)
+        self.target_ssim_spin.setSpecialValueText("不限")
+        self.target_ssim_spin.setValue(0.0)
+        self.target_ssim_spin.setToolTip("AVIF/WebP/JPG 按图搜索亮度 SSIM 不低于该值的最低质量(如 0.97)，同画质下体积更小，需要 numpy，优先于目标体积")
 
         # 新增 method/speed 下拉框
         self.method_label = QLabel("method")
@@ -406,6 +490,18 @@ class MainWindow(QMainWindow):
         self.delete_original_checkbox.setChecked(False)
         self.preserve_metadata_checkbox = QCheckBox("保留修改时间")
         self.preserve_metadata_checkbox.setChecked(True)
+        # 新增：增量转换复选框
+        self.incremental_checkbox = QCheckBox("增量转换")
+        self.incremental_checkbox.setChecked(False)
+        self.incremental_checkbox.setToolTip("跳过源文件和参数都未变化、输出已存在的文件(记录在 convert_manifest.db)")
+        # 新增：阶段计时复选框
+        self.metrics_checkbox = QCheckBox("阶段计时")
+        self.metrics_checkbox.setChecked(False)
+        self.metrics_checkbox.setToolTip("记录每个文件解码/缩放/锐化/编码等阶段耗时到 convert_metrics.jsonl，结束时日志输出汇总和最慢的文件")
+        # 新增：内容去重复选框
+        self.dedup_checkbox = QCheckBox("内容去重")
+        self.dedup_checkbox.setChecked(False)
+        self.dedup_checkbox.setToolTip("内容相同的文件只编码一次，其余复制输出；编码结果缓存在 convert_cache 目录，之后的批次直接复用")
         # 新增：保留透明通道复选框
         self.preserve_alpha_checkbox = QCheckBox("保留透明通道")
         self.preserve_alpha_checkbox.setChecked(False)  # 默认不勾选
@@ -451,12 +547,27 @@ class MainWindow(QMainWindow):
         self.resample_combo.setEnabled(False)
         self.resample_checkbox.stateChanged.connect(lambda s: self.resample_combo.setEnabled(self.resample_checkbox.isChecked()))
 
+        # 新增：快速缩小复选框
+        self.fast_downscale_checkbox = QCheckBox("快速缩小")
+        self.fast_downscale_checkbox.setChecked(False)
+        self.fast_downscale_checkbox.setToolTip("缩小时JPEG按1/2、1/4、1/8直接缩小解码，其他格式先整数倍缩小再重采样，大幅提速，画质差异极小")
+        # 新增：同格式直接复制复选框
+        self.passthrough_checkbox = QCheckBox("同格式直接复制")
+        self.passthrough_checkbox.setChecked(False)
+        self.passthrough_checkbox.setToolTip("源文件已是目标格式且无需缩放/锐化/去透明时直接复制文件，不解码、不重新编码(不会按所选质量重新压缩)")
+
         combined_layout = QHBoxLayout()
         combined_layout.addWidget(self.delete_original_checkbox)
         combined_layout.addSpacing(8)
         combined_layout.addWidget(self.preserve_metadata_checkbox)
+        combined_layout.addSpacing(8)
+        combined_layout.addWidget(self.incremental_checkbox)
+        combined_layout.addSpacing(8)
+        combined_layout.addWidget(self.metrics_checkbox)
+        combined_layout.addSpacing(8)
+        combined_layout.addWidget(self.dedup_checkbox)
         # 新增：method/speed 下拉框放到复选框右侧
-        combined_layout.addSpacing(32)
+        combined_layout.addSpacing(16)
         combined_layout.addWidget(self.method_label)
         combined_layout.addWidget(self.method_combo)
         combined_layout.addWidget(self.speed_label)
@@ -471,6 +582,8 @@ class MainWindow(QMainWindow):
         row3_layout.addWidget(self.subsample_combo) # 色彩子采样下拉框
         row3_layout.addWidget(self.resample_checkbox) # 重采样复选框
         row3_layout.addWidget(self.resample_combo) # 重采样下拉框
+        row3_layout.addWidget(self.fast_downscale_checkbox) # 快速缩小复选框
+        row3_layout.addWidget(self.passthrough_checkbox) # 同格式直接复制复选框
         row3_layout.addStretch()  # 左侧靠齐
 
         format_layout.addLayout(row3_layout, 2, 0, 1, 6, Qt.AlignLeft)
@@ -507,6 +620,10 @@ class MainWindow(QMainWindow):
         quality_layout = QHBoxLayout()
         quality_layout.addWidget(self.quality_label)
         quality_layout.addWidget(self.quality_spin)
+        quality_layout.addWidget(QLabel("目标"))
+        quality_layout.addWidget(self.target_size_spin)
+        quality_layout.addWidget(QLabel("SSIM"))
+        quality_layout.addWidget(self.target_ssim_spin)
         # 图片格式下拉框
         format_combo_layout = QHBoxLayout()
         format_combo_layout.addWidget(QLabel("图片格式"))
@@ -525,23 +642,26 @@ class MainWindow(QMainWindow):
         self.convert_button = make_btn("开始转换", self.convert_images, 70)
         self.pause_button = make_btn("暂停/继续", self.pause_conversion, 70)
         self.stop_button = make_btn("停止", self.stop_conversion, 70)
-        self.stop_event = threading.Event()
+        self.stop_event = convert_pool.new_event()  # 进程池工作进程也能读到停止信号
         self.clear_input_signal.connect(self.clear_input_line)
         self.save_settings_button = make_btn("保存设置", self.save_settings, 70)
         self.reset_settings_button = make_btn("重置设置", self.reset_settings, 70)
         self.clear_log_button = make_btn("清空日志", self.clear_log, 70)
+        self.export_log_button = make_btn("导出日志", self.export_log, 70)
         for btn in [self.convert_button, self.pause_button, self.stop_button,
-                    self.save_settings_button, self.reset_settings_button, self.clear_log_button]:
+                    self.save_settings_button, self.reset_settings_button, self.clear_log_button,
+                    self.export_log_button]:
             control_layout.addWidget(btn)
         control_group.setLayout(control_layout)
 
-        self.log_output = QTextEdit()
+        self.log_output = QPlainTextEdit()
         self.log_output.setReadOnly(True)
+        self.log_output.setMaximumBlockCount(LOG_MAX_LINES)  # 环形缓冲，超出上限丢弃最早的行
         self.log_output.setStyleSheet("background-color: #f0f0f0;")
 
         progress_layout = QHBoxLayout()
         progress_label_title = QLabel("日志输出:")
-        self.progress_label = QLabel("转换失败: 0 已完成/总数: 0/0")
+        self.progress_label = QLabel("转换失败: 0 已完成/已发现: 0/0")
         self.progress_label.setAlignment(Qt.AlignRight)
         progress_layout.addWidget(progress_label_title)
         progress_layout.addWidget(self.progress_label)
@@ -558,16 +678,19 @@ class MainWindow(QMainWindow):
         self.log = logging.getLogger()
         self.log.setLevel(logging.INFO)
 
-        self.log_emitter = LogEmitter()
-        self.log_emitter.log_message.connect(self.log_output.append)
+        # 日志和进度经队列批量刷新到界面，工作线程不直接操作控件
+        self.log_channel = LogChannel(self.log_output, self.progress_label)
 
-        handler = TextHandler(self.log_emitter)
+        handler = TextHandler(self.log_channel)
         handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s', datefmt='%H:%M:%S'))
         self.log.handlers = [handler]
 
         # 修改配置文件路径获取方式，兼容 nuitka 单文件
         self.config_path = str(Path(sys.argv[0]).parent / "config.ini")
         self.config = configparser.ConfigParser()
+        self.manifest_path = str(Path(sys.argv[0]).parent / MANIFEST_NAME)  # 增量转换清单与 config.ini 同目录
+        self.metrics_path = str(Path(sys.argv[0]).parent / METRICS_NAME)  # 阶段计时日志
+        self.dedup_cache = str(Path(sys.argv[0]).parent / CACHE_DIR_NAME)  # 内容去重缓存
         self._last_quality_fmt = self.format_combo.currentText()
         self.update_quality_label(self.format_combo.currentText())  # 初始化时同步显示
         self.load_settings()  # 启动时加载设置
@@ -708,7 +831,7 @@ class MainWindow(QMainWindow):
 
     def convert_images(self):
         if self.input_line.text() == '':
-            self.log_output.append('请选择输入文件')
+            self.log.info('请选择输入文件')
         else:
             # 优化：用 Path 处理输入输出路径
             input_files = [str(Path(f)) for f in self.input_line.text().split(";") if f]
@@ -729,6 +852,24 @@ class MainWindow(QMainWindow):
             sharpness = self.sharpness_spin.value()  # 获取锐化因子
             preserve_metadata = self.preserve_metadata_checkbox.isChecked() # 保留原数据
             thread_count = int(self.cpu_combo.currentText())
+            backend = "process" if self.process_pool_checkbox.isChecked() else "thread"
+            incremental = self.incremental_checkbox.isChecked()
+            schedule = "largest" if self.largest_first_checkbox.isChecked() else "stream"
+            fast_downscale = self.fast_downscale_checkbox.isChecked()
+            passthrough = self.passthrough_checkbox.isChecked()
+            memory_budget = self.memory_budget_spin.value() * 2**20 or None
+            tile_pixels = self.tile_spin.value() * 10**6 or None
+            max_pixels = self.max_pixels_spin.value() * 10**6 or None
+            target_bytes = self.target_size_spin.value() * 1024 or None
+            target_ssim = self.target_ssim_spin.value() or None
+            metrics_path = self.metrics_path if self.metrics_checkbox.isChecked() else None
+            dedup_cache = self.dedup_cache if self.dedup_checkbox.isChecked() else None
+            try:
+                extra_targets = parse_targets(self.extra_targets_line.text())
+                check_targets(img_format, extra_targets)
+            except ValueError as e:
+                self.log.error(str(e))
+                return
 
             # method/speed 参数
             method = int(self.method_combo.currentText()) if img_format == 'webp' else None
@@ -760,6 +901,26 @@ class MainWindow(QMainWindow):
             elif (img_format == 'avif'):
                 compress = min(compress, 63)  # 限制压缩级别最大为63
 
+            job = ConvertJob(
+                img_format=img_format, quality=quality, compress=compress,
+                height=height, width=width, adjust_height=adjust_height, adjust_width=adjust_width,
+                sharpness=sharpness, output_dir=output_dir, delete_original=delete_original,
+                preserve_metadata=preserve_metadata,
+                method=method,  # 控制webp压缩速度/质量平衡
+                speed=speed,    # 控制avif压缩速度/质量平衡
+                preserve_alpha=preserve_alpha,  # 透明通道
+                lossless=lossless,  # 无损参数
+                subsample=subsample,  # 色彩子采样
+                resample=resample,  # 重采样算法
+                fast_downscale=fast_downscale,  # 快速缩小
+                extra_targets=extra_targets,  # 附加输出
+                target_bytes=target_bytes,  # 目标体积
+                target_ssim=target_ssim,  # 目标 SSIM
+                passthrough=passthrough,  # 同格式直接复制
+                tile_pixels=tile_pixels,  # 分条处理阈值
+                max_pixels=max_pixels,  # 源图像素上限
+            )
+
             conversion_paused.set()  # 确保每次开始转换时为“运行”状态
             # 清理之前的线程
             if hasattr(self, 'convert_thread'):
@@ -774,21 +935,20 @@ class MainWindow(QMainWindow):
             # 创建并启动新线程
             self.convert_thread = threading.Thread(
                 target=run_conversion,
-                args=(input_files, output_dir, img_format, quality, compress,
-                      height, width, delete_original, adjust_height, adjust_width,
-                      sharpness, conversion_paused, self.stop_event, self.log,
-                      self.progress_label, preserve_metadata,
+                args=(input_files, job, conversion_paused, self.stop_event, self.log,
+                      self.log_channel.set_progress,
                       lambda: [
                           self.clear_input_signal.emit(),
                           delattr(self, 'convert_thread')  # 转换完成后清理线程引用
                       ],
                       thread_count,
-                      method,  # 控制webp压缩速度/质量平衡
-                      speed,   # 控制avif压缩速度/质量平衡
-                      preserve_alpha, #透明通道
-                      lossless,  # 无损参数
-                      subsample, # 色彩子采样
-                      resample   # 重采样算法
+                      backend,   # 线程池/进程池
+                      incremental,  # 增量转换
+                      self.manifest_path,
+                      schedule,  # 调度策略
+                      memory_budget,  # 内存预算
+                      metrics_path,  # 阶段计时日志
+                      dedup_cache  # 内容去重缓存
                 )
             )
             self.convert_thread.start()
@@ -797,7 +957,18 @@ class MainWindow(QMainWindow):
             self.log.info("转换已开始(点击暂停按钮可中断)")
 
     def clear_log(self):
-        self.log_output.clear()
+        self.log_channel.clear()
+
+    def export_log(self):
+        """导出完整日志(日志区只保留最近 LOG_MAX_LINES 行)"""
+        path, _ = QFileDialog.getSaveFileName(self, "导出日志", "convert_log.txt", "文本文件 (*.txt)")
+        if not path:
+            return
+        try:
+            self.log_channel.export(path)
+            self.log.info(f"日志已导出到: {path}")
+        except OSError as e:
+            self.log.error(f"导出日志失败: {e}")
 
     def pause_conversion(self):
         """线程安全的暂停/继续控制"""
@@ -808,11 +979,11 @@ class MainWindow(QMainWindow):
             if conversion_paused.is_set():
                 conversion_paused.clear()
                 self.pause_button.setText('继续')
-                self.log_emitter.log_message.emit("转换暂停中(等待线程完成当前任务)")
+                self.log.info("转换暂停中(等待线程完成当前任务)")
             else:
                 conversion_paused.set()
                 self.pause_button.setText('暂停')
-                self.log_emitter.log_message.emit("转换已恢复")
+                self.log.info("转换已恢复")
             QApplication.processEvents()
         except Exception as e:
             self.log.error(f"暂停操作出错: {str(e)}")
@@ -833,7 +1004,7 @@ class MainWindow(QMainWindow):
             
             # 仅清空输入路径
             self.clear_input_signal.emit()
-            self.progress_label.setText("转换停止中(等待线程完成)")
+            self.log_channel.set_progress("转换停止中(等待线程完成)")
             self.log.info("转换已停止(输出路径保留)")
             
             # 删除了 time.sleep(0.1) 和 self.stop_event.clear() 保持 stop_event 处于 set 状态，确保线程池中所有正在排队的任务都能读到终止信号
@@ -841,39 +1012,43 @@ class MainWindow(QMainWindow):
             self.log.error(f"停止出错: {str(e)}")
 
     def show_file_list(self):
-        input_files = self.input_line.text().split(";")
+        input_files = [str(Path(f)) for f in self.input_line.text().split(";") if f]
         if not input_files:
             self.log.info('未选择输入文件或文件夹')
             return
 
-        files = []
-        if len(input_files) == 1 and Path(input_files[0]).is_dir():  # 输入是目录
-            for filename in Path(input_files[0]).iterdir():
-                if filename.suffix.lower() in (".png", ".jpg", ".jpeg", ".webp", ".avif"):
-                    files.append(str(filename))
-        else:  # 输入是单个文件或多个文件
-            files = input_files
-
-        if not files:
-            self.log.info('未找到可转换的文件')
-            return
+        # 与转换相同的递归流式遍历，边发现边显示；其余列只为可见行读取文件头
+        model = FileListModel(input_files, dict(
+            img_format=self.format_combo.currentText(), quality=self.quality_spin.value(),
+            height=self.height_spin.value(), width=self.width_spin.value(),
+            adjust_height=self.height_checkbox.isChecked(), adjust_width=self.width_checkbox.isChecked()))
 
         file_list_dialog = QDialog()
         file_list_dialog.setWindowTitle('文件列表')
-        file_list_dialog.setGeometry(200, 200, 700, 500)
+        file_list_dialog.setGeometry(200, 200, 900, 500)
 
         layout = QVBoxLayout()
-        table = QTableWidget()
-        table.setColumnCount(1)
-        table.setHorizontalHeaderLabels(['文件路径'])
-        table.setRowCount(len(files))
-        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)  # 自动调整列宽
-
-        for i, file in enumerate(files):
-            item = QTableWidgetItem(file)
-            table.setItem(i, 0, item)
+        table = QTableView()
+        table.setModel(model)
+        table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)  # 固定行高，不逐行计算
+        table.verticalHeader().setDefaultSectionSize(table.fontMetrics().height() + 6)
+        header = table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.Stretch)  # 路径列自动拉伸
+        for col, width in enumerate((80, 90, 110, 80), start=1):
+            header.setSectionResizeMode(col, QHeaderView.Interactive)
+            header.resizeSection(col, width)
         layout.addWidget(table)
         file_list_dialog.setLayout(layout)
+
+        def update_title():
+            state = "共" if model.stream.exhausted else "已发现"
+            file_list_dialog.setWindowTitle(f'文件列表({state} {len(model.files)} 个)')
+            if model.stream.exhausted and not model.files:
+                file_list_dialog.setWindowTitle('文件列表(未找到可转换的文件)')
+        title_timer = QTimer(file_list_dialog)
+        title_timer.timeout.connect(update_title)
+        title_timer.start(200)
+        file_list_dialog.finished.connect(lambda _: model.close())
         file_list_dialog.exec_()
 
     def save_settings(self):
@@ -882,6 +1057,8 @@ class MainWindow(QMainWindow):
         self.config['Main'] = {
             'format': self.format_combo.currentText(),
             'quality': str(self.quality_spin.value()),
+            'target_size_kb': str(self.target_size_spin.value()),
+            'target_ssim': str(self.target_ssim_spin.value()),
             'height': str(self.height_spin.value()),
             'width': str(self.width_spin.value()),
             'height_checked': str(self.height_checkbox.isChecked()),
@@ -889,7 +1066,15 @@ class MainWindow(QMainWindow):
             'sharpness': str(self.sharpness_spin.value()),
             'delete_original': str(self.delete_original_checkbox.isChecked()),
             'preserve_metadata': str(self.preserve_metadata_checkbox.isChecked()),
+            'incremental': str(self.incremental_checkbox.isChecked()),
+            'metrics': str(self.metrics_checkbox.isChecked()),
+            'dedup': str(self.dedup_checkbox.isChecked()),
             'cpu_threads': self.cpu_combo.currentText(),
+            'memory_budget_mb': str(self.memory_budget_spin.value()),
+            'tile_mp': str(self.tile_spin.value()),
+            'max_pixels_mp': str(self.max_pixels_spin.value()),
+            'process_pool': str(self.process_pool_checkbox.isChecked()),
+            'largest_first': str(self.largest_first_checkbox.isChecked()),
             'method': self.method_combo.currentText(),
             'speed': self.speed_combo.currentText(),
             'preserve_alpha': str(self.preserve_alpha_checkbox.isChecked()),
@@ -899,6 +1084,9 @@ class MainWindow(QMainWindow):
             'subsample_index': str(self.subsample_combo.currentIndex()),
             'resample_checked': str(self.resample_checkbox.isChecked()),
             'resample_index': str(self.resample_combo.currentIndex()),
+            'fast_downscale': str(self.fast_downscale_checkbox.isChecked()),
+            'passthrough': str(self.passthrough_checkbox.isChecked()),
+            'extra_targets': self.extra_targets_line.text(),
         }
         # 保存窗口坐标
         x = self.x()
@@ -923,6 +1111,8 @@ class MainWindow(QMainWindow):
             if idx >= 0:
                 self.format_combo.setCurrentIndex(idx)
             self.quality_spin.setValue(int(s.get('quality', self.quality_spin.value())))
+            self.target_size_spin.setValue(int(s.get('target_size_kb', '0')))
+            self.target_ssim_spin.setValue(float(s.get('target_ssim', '0')))
             self.height_spin.setValue(int(s.get('height', self.height_spin.value())))
             self.width_spin.setValue(int(s.get('width', self.width_spin.value())))
             self.height_checkbox.setChecked(s.get('height_checked', 'True') == 'True')
@@ -930,9 +1120,17 @@ class MainWindow(QMainWindow):
             self.sharpness_spin.setValue(float(s.get('sharpness', self.sharpness_spin.value())))
             self.delete_original_checkbox.setChecked(s.get('delete_original', 'False') == 'True')
             self.preserve_metadata_checkbox.setChecked(s.get('preserve_metadata', 'True') == 'True')
+            self.incremental_checkbox.setChecked(s.get('incremental', 'False') == 'True')
+            self.metrics_checkbox.setChecked(s.get('metrics', 'False') == 'True')
+            self.dedup_checkbox.setChecked(s.get('dedup', 'False') == 'True')
             cpu_idx = self.cpu_combo.findText(s.get('cpu_threads', self.cpu_combo.currentText()))
             if cpu_idx >= 0:
                 self.cpu_combo.setCurrentIndex(cpu_idx)
+            self.memory_budget_spin.setValue(int(s.get('memory_budget_mb', '0')))
+            self.tile_spin.setValue(int(s.get('tile_mp', '0')))
+            self.max_pixels_spin.setValue(int(s.get('max_pixels_mp', '0')))
+            self.process_pool_checkbox.setChecked(s.get('process_pool', 'False') == 'True')
+            self.largest_first_checkbox.setChecked(s.get('largest_first', 'False') == 'True')
             self.method_combo.setCurrentText(s.get('method', '6'))
             self.speed_combo.setCurrentText(s.get('speed', '4'))
             self.preserve_alpha_checkbox.setChecked(s.get('preserve_alpha', 'False') == 'True')
@@ -942,6 +1140,9 @@ class MainWindow(QMainWindow):
             self.subsample_combo.setCurrentIndex(int(s.get('subsample_index', '0')))
             self.resample_checkbox.setChecked(s.get('resample_checked', 'False') == 'True')
             self.resample_combo.setCurrentIndex(int(s.get('resample_index', '0')))
+            self.fast_downscale_checkbox.setChecked(s.get('fast_downscale', 'False') == 'True')
+            self.passthrough_checkbox.setChecked(s.get('passthrough', 'False') == 'True')
+            self.extra_targets_line.setText(s.get('extra_targets', ''))
         # 恢复窗口坐标
         if 'Window' in self.config:
             w = self.config['Window']
@@ -960,6 +1161,8 @@ class MainWindow(QMainWindow):
         self.output_line.clear()
         self.format_combo.setCurrentText('avif')
         self.quality_spin.setValue(63)
+        self.target_size_spin.setValue(0)
+        self.target_ssim_spin.setValue(0.0)
         self.height_spin.setValue(768)
         self.width_spin.setValue(1500)
         self.height_checkbox.setChecked(True)
@@ -967,14 +1170,26 @@ class MainWindow(QMainWindow):
         self.sharpness_spin.setValue(1.0)
         self.delete_original_checkbox.setChecked(False)
         self.preserve_metadata_checkbox.setChecked(True)
+        self.incremental_checkbox.setChecked(False)
+        self.metrics_checkbox.setChecked(False)
+        self.dedup_checkbox.setChecked(False)
         self.cpu_combo.setCurrentText(str(multiprocessing.cpu_count()))
+        self.memory_budget_spin.setValue(0)
+        self.tile_spin.setValue(0)
+        self.max_pixels_spin.setValue(0)
+        self.process_pool_checkbox.setChecked(False)
+        self.largest_first_checkbox.setChecked(False)
         self.method_combo.setCurrentText("6")
         self.speed_combo.setCurrentText("4")
         self.preserve_alpha_checkbox.setChecked(False)
         self.lossless_checkbox.setChecked(False)
+        self.fast_downscale_checkbox.setChecked(False)
+        self.passthrough_checkbox.setChecked(False)
+        self.extra_targets_line.clear()
         self.log.info("设置已重置为默认值")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包为exe后进程池需要
     app = QApplication([])
     window = MainWindow()
     window.show()
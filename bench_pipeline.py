@@ -0,0 +1,341 @@
+"""转换流程基准：用可复现的合成图库测量各编码参数组合的吞吐、分阶段延迟、峰值内存和输出体积
+
+用法: python bench_pipeline.py [--corpus bench_corpus] [--kinds photo,lineart,alpha,palette,scan]
+                              [--sizes thumb,1mp,12mp] [--formats avif,webp,jpg,png] [--quality 63,80]
+                              [--speed 4,6] [--method 4,6] [--height 768] [--repeat 3]
+                              [--batch thread,process] [--json result.json] [--compare old.json]
+
+图库按 (类型, 尺寸, 种子) 确定性生成并缓存在 --corpus 目录，相同参数每次得到逐字节相同的源文件。
+每个 格式/质量/speed/method 组合对每张图运行 --repeat 次，分别计时与 process_file 相同的四个阶段：
+decode(打开并解码)、transform(模式转换/缩放/锐化)、encode(编码到内存)、write(写入输出文件)，
+输出 图片/秒、MB/秒(源文件字节)、各阶段 p50/p95、峰值 RSS 和输出总字节。
+--batch 另外用 convert_engine.run_batch 以指定后端整批转换图库，测量线程池/进程池的实际吞吐。
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import itertools
+import threading
+from PIL import Image, ImageChops, ImageDraw, ImageFilter
+
+from convert_engine import ConvertJob, transform, run_batch
+from convert_targets import save_image, load_codec, DEFAULT_QUALITY
+
+# 尺寸名 -> (宽, 高)，从缩略图到 1 亿像素
+SIZES = {
+    'thumb': (320, 240),
+    '1mp': (1280, 800),
+    '12mp': (4000, 3000),
+    '24mp': (6000, 4000),
+    '100mp': (12288, 8192),
+}
+
+# 合成图类型 -> 源文件格式
+KINDS = {
+    'photo': 'jpg',      # 渐变 + 噪声的类照片 RGB
+    'lineart': 'png',    # 白底细线条(漫画/CG 线稿)
+    'alpha': 'png',      # 带渐变透明通道的 RGBA
+    'palette': 'gif',    # 64 色调色板 + 透明色
+    'scan': 'png',       # 1 位黑白扫描件
+}
+
+STAGES = ('decode', 'transform', 'encode', 'write')
+
+
+def _noise(size, seed, scale=4):
+    """确定性噪声(Image.effect_noise 不可设种子)：低分辨率随机字节放大到目标尺寸"""
+    small = (max(1, size[0] // scale), max(1, size[1] // scale))
+    n = small[0] * small[1]
+    # 与 Random.randbytes(3.9+) 生成的字节相同，兼容 Python 3.8
+    data = random.Random(seed).getrandbits(8 * n).to_bytes(n, 'little')
+    return Image.frombytes('L', small, data).resize(size, Image.BICUBIC)
+
+
+def make_photo(size, seed):
+    gradient = Image.linear_gradient('L').resize(size)
+    r = ImageChops.add(gradient, _noise(size, seed), scale=2.0)
+    g = gradient.rotate(90).resize(size)
+    b = Image.radial_gradient('L').resize(size)
+    return Image.merge('RGB', (r, g, b)).filter(ImageFilter.GaussianBlur(1.5))
+
+
+def make_lineart(size, seed):
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    width = max(1, min(size) // 400)
+    for _ in range(max(50, size[0] * size[1] // 20000)):
+        points = [(rng.randrange(size[0]), rng.randrange(size[1])) for _ in range(rng.randint(2, 5))]
+        color = tuple(rng.randrange(120) for _ in range(3))
+        draw.line(points, fill=color, width=width)
+    return image
+
+
+def make_alpha(size, seed):
+    image = make_photo(size, seed)
+    image.putalpha(Image.radial_gradient('L').resize(size))
+    return image
+
+
+def make_palette(size, seed):
+    image = make_alpha(size, seed).convert('P', palette=Image.ADAPTIVE, colors=64)
+    image.info['transparency'] = 0
+    return image
+
+
+def make_scan(size, seed):
+    return make_lineart(size, seed).convert('L').point(lambda v: 255 if v > 200 else 0).convert('1')
+
+
+MAKERS = dict(photo=make_photo, lineart=make_lineart, alpha=make_alpha, palette=make_palette, scan=make_scan)
+
+
+def build_corpus(directory, kinds, sizes, seed=0):
+    """生成(或复用已缓存的)合成图库，返回 [(路径, 类型, 尺寸名)]"""
+    os.makedirs(directory, exist_ok=True)
+    corpus = []
+    for kind, size_name in itertools.product(kinds, sizes):
+        path = os.path.join(directory, f"{kind}_{size_name}_s{seed}.{KINDS[kind]}")
+        if not os.path.exists(path):
+            image = MAKERS[kind](SIZES[size_name], seed)
+            tmp = path + '.tmp'
+            if KINDS[kind] == 'jpg':
+                image.save(tmp, 'JPEG', quality=92)
+            elif KINDS[kind] == 'gif':
+                image.save(tmp, 'GIF')
+            else:
+                image.save(tmp, 'PNG', compress_level=1)
+            os.replace(tmp, path)
+        corpus.append((path, kind, size_name))
+    return corpus
+
+
+def current_rss():
+    """当前进程常驻内存(字节)，无法获取时返回 None"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RssSampler:
+    """后台线程定时采样 RSS，记录一个用例期间的峰值"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss()
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+
+def convert_staged(path, job, out_path, timings):
+    """按 process_file 的步骤转换一张图，各阶段耗时追加到 timings，返回输出字节数"""
+    start = time.perf_counter()
+    load_codec(os.path.splitext(path)[1])
+    image = Image.open(path)
+    image.load()
+    t_decode = time.perf_counter()
+    image, _ = transform(image, job)
+    t_transform = time.perf_counter()
+    buf = io.BytesIO()
+    save_image(image, buf, job.img_format, quality=job.quality, compress=job.compress,
+               method=job.method, speed=job.speed, lossless=job.lossless, subsample=job.subsample)
+    t_encode = time.perf_counter()
+    with open(out_path, 'wb') as f:
+        f.write(buf.getbuffer())
+    t_write = time.perf_counter()
+    for stage, seconds in zip(STAGES, (t_decode - start, t_transform - t_decode,
+                                       t_encode - t_transform, t_write - t_encode)):
+        timings[stage].append(seconds)
+    return buf.getbuffer().nbytes
+
+
+def combos(formats, qualities, speeds, methods):
+    """格式/质量/speed/method 组合：speed 只对 avif、method 只对 webp 展开"""
+    for fmt in formats:
+        for quality in qualities or [DEFAULT_QUALITY[fmt]]:
+            if fmt == 'png':
+                quality = min(quality, 9)
+            for speed in (speeds if fmt == 'avif' else [None]):
+                for method in (methods if fmt == 'webp' else [None]):
+                    yield dict(format=fmt, quality=quality, speed=speed, method=method)
+
+
+def case_name(combo):
+    name = f"{combo['format']} q={combo['quality']}"
+    if combo['speed'] is not None:
+        name += f" speed={combo['speed']}"
+    if combo['method'] is not None:
+        name += f" method={combo['method']}"
+    return name
+
+
+def make_job(combo, height, preserve_alpha):
+    return ConvertJob(img_format=combo['format'], quality=combo['quality'], compress=min(combo['quality'], 9),
+                      height=height or 0, adjust_height=bool(height), speed=combo['speed'],
+                      method=combo['method'], preserve_alpha=preserve_alpha)
+
+
+def bench_case(corpus, combo, height, repeat, out_dir, preserve_alpha):
+    """一个参数组合跑遍整个图库"""
+    job = make_job(combo, height, preserve_alpha)
+    timings = {stage: [] for stage in STAGES}
+    out_bytes = 0
+    src_bytes = 0
+    images = 0
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        for path, kind, size_name in corpus:
+            out_path = os.path.join(out_dir, f"{kind}_{size_name}.{combo['format']}")
+            for _ in range(repeat):
+                size = convert_staged(path, job, out_path, timings)
+                images += 1
+                src_bytes += os.path.getsize(path)
+            out_bytes += size
+        wall = time.perf_counter() - start
+    return dict(
+        images_per_sec=images / wall,
+        mb_per_sec=src_bytes / 2**20 / wall,
+        stages={stage: dict(p50_ms=percentile(v, 0.5) * 1000, p95_ms=percentile(v, 0.95) * 1000,
+                            total_s=sum(v)) for stage, v in timings.items()},
+        peak_rss_mb=rss.peak / 2**20 if rss.peak else None,
+        output_bytes=out_bytes,
+        wall_s=wall,
+    )
+
+
+def bench_batch(corpus_dir, combo, height, backend, workers, preserve_alpha):
+    """run_batch 整批转换图库，测量执行器/调度的实际吞吐"""
+    out_dir = tempfile.mkdtemp(prefix="bench_batch_")
+    log = logging.getLogger("bench_pipeline.batch")
+    log.addHandler(logging.NullHandler())
+    log.propagate = False
+    try:
+        job = make_job(combo, height, preserve_alpha)
+        job.output_dir = out_dir
+        with RssSampler() as rss:
+            stats = run_batch([corpus_dir], job, log, workers=workers, backend=backend)
+        out_bytes = sum(entry.stat().st_size for entry in os.scandir(out_dir))
+        return dict(images_per_sec=stats['completed'] / stats['wall_time'] if stats['wall_time'] else None,
+                    completed=stats['completed'], failed=stats['failed'], wall_s=stats['wall_time'],
+                    peak_rss_mb=rss.peak / 2**20 if rss.peak else None, output_bytes=out_bytes)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def report(name, result, baseline=None):
+    line = (f"[{name}] {result['images_per_sec']:.2f} 张/s  {result['mb_per_sec']:.1f} MB/s  "
+            f"输出 {result['output_bytes'] / 1024:.0f} KB")
+    if result['peak_rss_mb'] is not None:
+        line += f"  峰值 RSS {result['peak_rss_mb']:.0f} MB"
+    if baseline:
+        line += f"  对比基线 {result['images_per_sec'] / baseline['images_per_sec']:.2f}x"
+    print(line)
+    print("    " + "  ".join(f"{stage} p50 {s['p50_ms']:.1f}/p95 {s['p95_ms']:.1f} ms"
+                            for stage, s in result['stages'].items()))
+
+
+def report_batch(name, result, baseline=None):
+    if not result['images_per_sec']:
+        print(f"[{name}] 无已完成任务(失败 {result['failed']})")
+        return
+    line = (f"[{name}] {result['images_per_sec']:.2f} 张/s  完成 {result['completed']} 失败 {result['failed']}  "
+            f"耗时 {result['wall_s']:.1f}s")
+    if result['peak_rss_mb'] is not None:
+        line += f"  峰值 RSS {result['peak_rss_mb']:.0f} MB"
+    if baseline and baseline.get('images_per_sec'):
+        line += f"  对比基线 {result['images_per_sec'] / baseline['images_per_sec']:.2f}x"
+    print(line)
+
+
+def split_list(text, cast=str):
+    return [cast(v) for v in text.split(',') if v.strip()] if text else []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="转换流程基准")
+    parser.add_argument("--corpus", default="bench_corpus", help="合成图库目录(已存在的图直接复用)，默认 bench_corpus")
+    parser.add_argument("--seed", type=int, default=0, help="图库随机种子，默认 0")
+    parser.add_argument("--kinds", default=",".join(KINDS), help=f"图库类型，可选 {','.join(KINDS)}")
+    parser.add_argument("--sizes", default="thumb,1mp,12mp", help=f"图库尺寸，可选 {','.join(SIZES)}，默认 thumb,1mp,12mp")
+    parser.add_argument("--formats", default="avif,webp,jpg,png", help="输出格式，默认 avif,webp,jpg,png")
+    parser.add_argument("--quality", default="", help="质量列表(png 为压缩等级)，默认各格式默认值")
+    parser.add_argument("--speed", default="4", help="AVIF speed 列表，默认 4")
+    parser.add_argument("--method", default="6", help="WebP method 列表，默认 6")
+    parser.add_argument("--height", type=int, default=768, help="缩放目标高度(0 不缩放)，默认 768")
+    parser.add_argument("--preserve-alpha", action="store_true", help="保留透明通道")
+    parser.add_argument("--repeat", type=int, default=3, help="每张图重复次数，默认 3")
+    parser.add_argument("--batch", default="", help="另用 run_batch 整批测量的后端，如 thread,process")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="--batch 工作数，默认 CPU 核心数")
+    parser.add_argument("--json", help="结果另存为 JSON")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比吞吐")
+    args = parser.parse_args()
+
+    kinds = split_list(args.kinds)
+    sizes = split_list(args.sizes)
+    for name, valid in ((kinds, KINDS), (sizes, SIZES)):
+        unknown = [v for v in name if v not in valid]
+        if unknown:
+            parser.error(f"未知取值: {', '.join(unknown)}")
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+
+    print(f"生成图库: {len(kinds)} 类 x {len(sizes)} 种尺寸 -> {args.corpus}")
+    corpus = build_corpus(args.corpus, kinds, sizes, args.seed)
+    results = {}
+    out_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        for combo in combos(split_list(args.formats), split_list(args.quality, int),
+                            split_list(args.speed, int), split_list(args.method, int)):
+            name = case_name(combo)
+            results[name] = bench_case(corpus, combo, args.height, max(1, args.repeat), out_dir, args.preserve_alpha)
+            report(name, results[name], baseline.get(name))
+            for backend in split_list(args.batch):
+                batch_name = f"{name} batch={backend}x{args.workers}"
+                results[batch_name] = bench_batch(args.corpus, combo, args.height, backend, args.workers,
+                                                  args.preserve_alpha)
+                report_batch(batch_name, results[batch_name], baseline.get(batch_name))
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(dict(python=sys.version.split()[0], platform=platform.platform(),
+                           corpus=dict(kinds=kinds, sizes=sizes, seed=args.seed), height=args.height,
+                           repeat=args.repeat, results=results), f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.json}")
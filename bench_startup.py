@@ -0,0 +1,107 @@
+"""启动耗时基准：在全新解释器中测量命令行/GUI 的冷启动耗时和导入开销
+
+用法: python bench_startup.py [--repeat 5] [--top 8] [--cmd "dist/image_converter.exe --help"] [--json startup.json]
+
+每个场景运行 --repeat 次取中位数，再用 -X importtime 统计导入总耗时、自身耗时最高的模块，
+以及加载了哪些本应按需导入的重量级模块(Pillow、numpy、sqlite3、pillow_avif、psutil、send2trash)。
+"""
+import os
+import sys
+import json
+import shlex
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# 场景名 -> 解释器参数
+SCENARIOS = {
+    "空解释器": ["-c", "pass"],
+    "cli --help": ["image_converter.py", "--help"],
+    "import convert_engine": ["-c", "import convert_engine"],
+    "import image_converter": ["-c", "import image_converter"],
+    "import GUI": ["-c", "import AVJPWConverterPySide6"],
+}
+
+# 只应在用到时才导入的模块(顶层包名)
+HEAVY = ("PIL", "numpy", "sqlite3", "pillow_avif", "psutil", "send2trash")
+
+
+def run_once(argv):
+    """运行一次，返回 (耗时秒数, 退出码, stderr)"""
+    start = time.perf_counter()
+    proc = subprocess.run(argv, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          text=True, errors='replace')
+    return time.perf_counter() - start, proc.returncode, proc.stderr
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 [(模块名, 自身微秒, 累计微秒)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # 表头
+        rows.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+    return rows
+
+
+def bench(argv, repeat, top, importtime=True):
+    times = []
+    for _ in range(repeat):
+        elapsed, code, err = run_once(argv)
+        if code != 0:
+            return dict(error=err.strip().splitlines()[-1] if err.strip() else f"退出码 {code}")
+        times.append(elapsed)
+    result = dict(median_ms=statistics.median(times) * 1000, min_ms=min(times) * 1000)
+    if importtime:
+        _, _, err = run_once([argv[0], "-X", "importtime"] + argv[1:])
+        rows = parse_importtime(err)
+        loaded = {name.split('.')[0] for name, _, _ in rows}
+        result.update(
+            import_ms=sum(r[1] for r in rows) / 1000,
+            heavy=[name for name in HEAVY if name in loaded],
+            top=[(name, self_us / 1000) for name, self_us, _ in sorted(rows, key=lambda r: r[1], reverse=True)[:top]],
+        )
+    return result
+
+
+def report(name, result):
+    if 'error' in result:
+        print(f"[{name}] 跳过: {result['error']}")
+        return
+    line = f"[{name}] 中位 {result['median_ms']:.0f} ms (最快 {result['min_ms']:.0f} ms)"
+    if 'import_ms' in result:
+        line += f"，导入 {result['import_ms']:.0f} ms，重量级模块: {', '.join(result['heavy']) or '无'}"
+    print(line)
+    if result.get('top'):
+        print("    自身耗时最高: " + ", ".join(f"{n} {ms:.1f} ms" for n, ms in result['top']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--repeat", type=int, default=5, help="每个场景运行次数(取中位数)，默认 5")
+    parser.add_argument("--top", type=int, default=8, help="列出自身导入耗时最高的模块数，默认 8")
+    parser.add_argument("--cmd", action="append", default=[],
+                        help="额外测量的命令(可重复)，如 nuitka 编译的 exe，只统计总耗时")
+    parser.add_argument("--json", help="结果另存为 JSON，便于跟踪各版本的启动耗时")
+    args = parser.parse_args()
+
+    results = {}
+    for name, argv in SCENARIOS.items():
+        results[name] = bench([sys.executable] + argv, args.repeat, args.top)
+        report(name, results[name])
+    for cmd in args.cmd:
+        results[cmd] = bench(shlex.split(cmd), args.repeat, args.top, importtime=False)
+        report(cmd, results[cmd])
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(dict(python=sys.version.split()[0], platform=platform.platform(), results=results),
+                      f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.json}")
@@ -0,0 +1,135 @@
+"""图像变换微基准：对比不同处理路径的耗时与画质(PSNR)
+
+用法: python bench_transform.py [--size 6000x4000] [--height 768] [--repeat 3] [--sharpness 1.5]
+"""
+import io
+import math
+import time
+import argparse
+from PIL import Image, ImageChops, ImageStat, ImageFilter, ImageEnhance
+
+from convert_engine import ConvertJob, transform
+
+
+def make_photo(size, seed=0):
+    """生成确定性的类照片测试图：渐变 + 噪声 + 轻微模糊，编码为 JPEG 字节"""
+    width, height = size
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 40 + seed)
+    r = ImageChops.add(gradient, noise, scale=2.0)
+    g = gradient.rotate(90).resize(size)
+    b = Image.radial_gradient('L').resize(size)
+    image = Image.merge('RGB', (r, g, b)).filter(ImageFilter.GaussianBlur(1.5))
+    buf = io.BytesIO()
+    image.save(buf, 'JPEG', quality=92)
+    return buf.getvalue()
+
+
+def psnr(a, b):
+    """两张同尺寸 RGB 图的峰值信噪比(dB)"""
+    diff = ImageChops.difference(a.convert('RGB'), b.convert('RGB'))
+    mse = sum(v * v for v in ImageStat.Stat(diff).rms) / 3
+    return float('inf') if mse == 0 else 10 * math.log10(255 * 255 / mse)
+
+
+def max_diff(a, b):
+    """逐像素最大差值(所有通道)"""
+    extrema = ImageChops.difference(a, b).getextrema()
+    if not isinstance(extrema[0], tuple):  # 单通道
+        extrema = [extrema]
+    return max(hi for _, hi in extrema)
+
+
+def make_sources(size):
+    """转换链需要覆盖的各类输入：照片 RGB、带透明 PNG、调色板透明图、灰度图、1 位扫描件"""
+    photo = Image.open(io.BytesIO(make_photo(size)))
+    photo.load()
+    alpha = photo.copy()
+    alpha.putalpha(Image.radial_gradient('L').resize(size))
+    palette = alpha.convert('P', palette=Image.ADAPTIVE, colors=64)
+    palette.info['transparency'] = 0
+    return {
+        'RGB': photo,
+        'RGBA': alpha,
+        'P': palette,
+        'L': photo.convert('L'),
+        '1': photo.convert('1'),
+    }
+
+
+def legacy_transform(image, job, target_size):
+    """改动前 process_file 的处理顺序：逐步模式转换，缩放，ImageEnhance 锐化"""
+    if image.mode == '1':
+        image = image.convert('L')
+    if image.mode == 'P':
+        image = image.convert('RGBA')
+    if job.img_format in ("jpg", "jpeg") and image.mode != 'RGB':
+        image = image.convert('RGB')
+    if not job.preserve_alpha and job.img_format in ("png", "webp", "avif"):
+        if image.mode in ('RGBA', 'LA'):
+            image = image.convert('RGB')
+    if target_size:
+        image = image.resize(target_size, Image.LANCZOS)
+    if job.sharpness != 1.0:
+        image = ImageEnhance.Sharpness(image).enhance(job.sharpness)
+    return image
+
+
+def bench_chain(size, target_height, sharpness, repeat):
+    """改动前的逐步处理 与 转换链(合并模式转换、缩小后扩展通道、单次卷积锐化) 对比，验证输出一致"""
+    for mode, source in make_sources(size).items():
+        for img_format, preserve_alpha in (("jpg", False), ("webp", False), ("png", True)):
+            job = ConvertJob(img_format=img_format, height=target_height, adjust_height=True,
+                             sharpness=sharpness, preserve_alpha=preserve_alpha)
+            target_size = (round(source.width * target_height / source.height), target_height)
+            t_old, ref = timed(lambda: legacy_transform(source.copy(), job, target_size), repeat)
+            t_new, (out, _) = timed(lambda: transform(source.copy(), job, target_size, planned=True), repeat)
+            diff = max_diff(ref, out) if ref.mode == out.mode else None
+            result = f"最大差值 {diff}  PSNR {psnr(ref, out):.1f} dB" if diff is not None else f"模式不一致 {ref.mode}/{out.mode}"
+            print(f"[chain] {mode:>4} -> {img_format:<4} 改动前: {t_old * 1000:.0f} ms  转换链: {t_new * 1000:.0f} ms  "
+                  f"提速 {t_old / t_new:.1f}x  {result}")
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_downscale(data, target_height, repeat):
+    """完整解码 + LANCZOS 缩放 与 draft/reduce 快速缩小 对比"""
+    def target_of(image):
+        return round(image.width * target_height / image.height), target_height
+
+    def normal():
+        image = Image.open(io.BytesIO(data))
+        return image.resize(target_of(image), Image.LANCZOS)
+
+    def fast():
+        image = Image.open(io.BytesIO(data))
+        size = target_of(image)
+        image.draft(None, (size[0] * 2, size[1] * 2))
+        return image.resize(size, Image.LANCZOS, reducing_gap=2.0)
+
+    t_normal, ref = timed(normal, repeat)
+    t_fast, out = timed(fast, repeat)
+    print(f"[downscale] 完整解码: {t_normal * 1000:.0f} ms  快速缩小: {t_fast * 1000:.0f} ms  "
+          f"提速 {t_normal / t_fast:.1f}x  PSNR {psnr(ref, out):.1f} dB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="图像变换微基准")
+    parser.add_argument("--size", default="6000x4000", help="测试图尺寸，默认 6000x4000")
+    parser.add_argument("--height", type=int, default=768, help="缩放目标高度，默认 768")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数(取最快一次)，默认 3")
+    parser.add_argument("--sharpness", type=float, default=1.5, help="转换链对比使用的锐化因子，默认 1.5")
+    args = parser.parse_args()
+
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+    data = make_photo(size)
+    bench_downscale(data, args.height, args.repeat)
+    bench_chain(size, args.height, args.sharpness, args.repeat)
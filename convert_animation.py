@@ -0,0 +1,129 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from resize_plan import calc_target_size, image_bytes, mode_bytes
+from convert_targets import save_image, sharpen, target_mode, resample_filter
+from convert_tiles import pillow_unlimited
+
+# Pillow 在首次用到时才导入(见 convert_targets)
+
+# 可输出动画的格式；JPG/PNG 输出只保留第一帧
+ANIMATED_FORMATS = ('webp', 'avif')
+
+# 单个动画并行缩放/锐化的帧线程数(Pillow 缩放和滤波时释放 GIL)；在途帧数不超过其 2 倍
+FRAME_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def frame_workers_for(pool_workers):
+    """线程池/进程池中每个任务可用的帧线程数：池已占满各核时为 1，避免 工作数×帧线程数 个线程争抢 CPU"""
+    return max(1, min(FRAME_WORKERS, (os.cpu_count() or 1) // max(1, pool_workers)))
+
+
+def is_animated(image):
+    """多帧 GIF/WebP/AVIF"""
+    return bool(getattr(image, 'is_animated', False)) and getattr(image, 'n_frames', 1) > 1
+
+
+def loop_count(image):
+    """循环次数：GIF 没有 NETSCAPE 循环扩展时只播放一次；WebP/AVIF 的循环次数 0 表示无限循环"""
+    if 'loop' in image.info:
+        return image.info['loop']
+    return 1 if image.format == 'GIF' else 0
+
+
+def animation_mode(image, img_format, preserve_alpha):
+    """所有帧统一的输出模式：有透明(含调色板透明色)时为 RGBA，再按输出格式/是否保留透明通道决定"""
+    has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+    return target_mode('RGBA' if has_alpha else 'RGB', img_format, preserve_alpha)
+
+
+def iter_frames(image, mode, target_size=None, resample=None, sharpness=1.0, workers=FRAME_WORKERS,
+                durations=None):
+    """按顺序产出处理后的各帧
+
+    解码必须逐帧进行(GIF/WebP 的帧按处置方式叠加在前一帧上，seek 得到的是合成后的整帧)，
+    主线程解码并转为统一模式后交给线程池缩放/锐化；在途帧数不超过 2×workers，内存与总帧数无关。
+    durations 为列表时按解码顺序追加各帧时长(毫秒)：WebP/AVIF 插件在 load 时才填入本帧 duration，
+    只 seek 不解码读到的是 0。
+    """
+    def finish(frame):
+        if target_size:
+            frame = frame.resize(target_size, resample)
+        if sharpness != 1.0:
+            frame = sharpen(frame, sharpness)
+        return frame
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        for index in range(image.n_frames):
+            # 像素上限已在打开时按 job.max_pixels 检查；GIF 切换帧时 Pillow 会按默认上限再次检查
+            with pillow_unlimited():
+                image.seek(index)
+            # convert 先 load 本帧，总是返回新图像，不受之后 seek 影响
+            frame = image.convert(mode)
+            if durations is not None:
+                durations.append(image.info.get('duration', 0))
+            pending.append(pool.submit(finish, frame))
+            if len(pending) >= 2 * max(1, workers):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class FrameStream:
+    """编码器 append_images 用的惰性帧序列：编码器 seek(i) 时才取下一帧，其他属性转给当前帧
+
+    编码器逐帧读取像素后即交给动画编码器，任意时刻只持有当前帧(和线程池中在途的几帧)。
+    """
+
+    def __init__(self, frames, n_frames):
+        self._frames = frames
+        self._frame = None
+        self._index = -1
+        self.n_frames = n_frames
+
+    def seek(self, index):
+        while self._index < index:
+            self._frame = next(self._frames)
+            self._index += 1
+
+    def tell(self):
+        return self._index
+
+    def __getattr__(self, name):
+        return getattr(self._frame, name)
+
+
+def save_animation(image, path, job, target_size=None, planned=False, stats=None, workers=None):
+    """已打开的动画逐帧缩放/锐化并编码为动画 WebP/AVIF，保留每帧时长和循环次数，返回帧数
+
+    各帧均为处置/叠加后的完整画面，输出的播放效果与源动画一致(由动画编码器重新计算差异区域)。
+    workers 为帧线程数，默认 job.frame_workers(未设置时为 FRAME_WORKERS)；
+    stats 为 dict 时写入 peak_bytes：在途帧的像素缓冲区估算。
+    """
+    workers = workers or job.frame_workers or FRAME_WORKERS
+    img_format = job.img_format.lower()
+    if not planned:
+        target_size = calc_target_size(image.width, image.height, job.height, job.width,
+                                       job.adjust_height, job.adjust_width)
+    mode = animation_mode(image, img_format, job.preserve_alpha)
+    loop = loop_count(image)
+    # 时长随解码逐帧追加：编码器取第 i 帧(即已解码)之后才读 duration[i]，无需为读时长预先解码一遍
+    durations = []
+    n_frames = image.n_frames
+    frames = iter_frames(image, mode, target_size, resample_filter(job.resample), job.sharpness, workers,
+                         durations)
+    try:
+        first = next(frames)
+        if stats is not None:
+            # 在途帧和编码器当前帧 + 解码中的源帧及其模式转换结果
+            stats['peak_bytes'] = ((2 * max(1, workers) + 1) * image_bytes(first)
+                                   + 2 * image.width * image.height * mode_bytes(mode))
+        save_image(first, path, img_format, quality=job.quality, compress=job.compress, method=job.method,
+                   speed=job.speed, lossless=job.lossless, subsample=job.subsample,
+                   save_all=True, append_images=[FrameStream(frames, n_frames - 1)],
+                   duration=durations, loop=loop)
+    finally:
+        frames.close()
+    return n_frames
@@ -0,0 +1,92 @@
+import os
+import sys
+import shutil
+from pathlib import Path
+
+from convert_writer import temp_path
+
+# Linux FICLONE ioctl(btrfs/xfs 等支持写时复制的文件系统)
+_FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """写时复制克隆，文件系统不支持时返回 False"""
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        return True
+    except OSError:
+        try:
+            os.unlink(dst)
+        except OSError:
+            pass
+        return False
+
+
+def kernel_copy(src, dst):
+    """在内核中复制文件内容(copy_file_range，数据不经过用户态缓冲)
+
+    不支持时(跨文件系统的旧内核、非 Linux 等)退回 shutil.copyfile，
+    它在 Linux 上使用 sendfile，在 macOS 上使用 fcopyfile。
+    """
+    copy_range = getattr(os, 'copy_file_range', None)
+    if copy_range is not None:
+        try:
+            with open(src, 'rb') as s, open(dst, 'wb') as d:
+                remaining = os.fstat(s.fileno()).st_size
+                while remaining > 0:
+                    n = copy_range(s.fileno(), d.fileno(), remaining)
+                    if n == 0:
+                        break
+                    remaining -= n
+            if remaining <= 0:
+                return
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+
+
+def clone_file(src, dst, allow_hardlink=False):
+    """按 reflink、硬链接(允许时)、内核复制 的顺序复制文件，返回实际使用的方式
+
+    目标已存在时先删除，不会通过已有的硬链接改写其他文件。
+    """
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists():
+        dst.unlink()
+    if _reflink(src, dst):
+        return 'reflink'
+    if allow_hardlink:
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    kernel_copy(src, dst)
+    return 'copy'
+
+
+def atomic_copy(src, dst, times=None, copy=kernel_copy):
+    """用 copy(src, 临时文件) 复制到 dst 同目录的临时文件，设置修改时间后原子重命名为 dst
+
+    中途失败或停止不会留下不完整的 dst；返回 copy 的返回值(如 clone_file 实际使用的方式)。
+    """
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = temp_path(dst)
+    try:
+        how = copy(src, tmp)
+        if times is not None:
+            os.utime(tmp, times)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return how
@@ -0,0 +1,189 @@
+import os
+import hashlib
+from functools import partial
+from pathlib import Path
+
+from convert_manifest import file_hash
+from convert_copy import clone_file, atomic_copy
+
+# 去重方式：bytes 按文件内容哈希，pixels 按解码后的像素哈希(不同容器/元数据的同一图像也能识别)
+DEDUP_MODES = ("bytes", "pixels")
+CACHE_DIR_NAME = "convert_cache"
+
+
+def pixel_hash(path, max_pixels=None):
+    """解码后像素的哈希(含模式和尺寸)，像素上限与转换相同(见 convert_tiles.open_limited)"""
+    from convert_targets import load_codec
+    from convert_tiles import open_limited
+    load_codec(os.path.splitext(str(path))[1])
+    h = hashlib.blake2b(digest_size=16)
+    with open_limited(path, max_pixels) as image:
+        image.load()
+        h.update(f"{image.mode} {image.size}".encode('utf-8'))
+        h.update(image.tobytes())
+    return h.hexdigest()
+
+
+class ContentCache:
+    """持久的内容寻址缓存：键为 源内容哈希 + 编码参数指纹，值为编码结果文件
+
+    缓存文件只用 reflink 或复制与输出文件相互复制，不用硬链接，
+    以免之后改写输出文件时连带改写缓存。
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, key, img_format):
+        return self.directory / key[:2] / f"{key}.{img_format}"
+
+    def lookup(self, key, img_format):
+        path = self.path(key, img_format)
+        return path if path.is_file() else None
+
+    def contains(self, path):
+        """path 是否为缓存中的文件"""
+        return Path(path).resolve().parent.parent == self.directory.resolve()
+
+    def store(self, key, img_format, src):
+        path = self.path(key, img_format)
+        if path.exists():
+            return
+        tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+        try:
+            clone_file(src, tmp)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
+class Deduplicator:
+    """批内去重与跨批次缓存查询(只在调度线程中调用，无需加锁)
+
+    未启用缓存时只对大小(bytes)或文件头尺寸/模式(pixels)相同的文件计算哈希，
+    大部分文件无需读取全部内容。同一内容的第一个文件正常转换，其余文件等它完成后复制其输出。
+    """
+
+    def __init__(self, mode, fingerprint, img_format, cache_dir=None, max_pixels=None):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"去重方式无效: {mode}")
+        self.mode = mode
+        self.fingerprint = fingerprint
+        self.img_format = img_format
+        self.cache = ContentCache(cache_dir) if cache_dir else None
+        self.max_pixels = max_pixels
+        self._groups = {}    # 分组键 -> 组内首个文件(尚未计算哈希)
+        self._keys = {}      # 文件 -> 内容键
+        self._leaders = {}   # 内容键 -> 负责转换的文件
+        self._outputs = {}   # 已完成的文件 -> 输出路径
+        self._waiting = {}   # 负责转换的文件 -> 等待复用其输出的文件列表
+        self._failed = set()  # 转换失败的文件，不再作为任何内容的首个文件
+        self.batch_saved = 0
+        self.cache_saved = 0
+
+    def _group(self, path):
+        if self.mode == "bytes":
+            return os.path.getsize(path)
+        from resize_plan import read_header
+        return read_header(path)
+
+    def _key(self, path):
+        if path not in self._keys:
+            digest = file_hash(path) if self.mode == "bytes" else pixel_hash(path, self.max_pixels)
+            self._keys[path] = f"{digest}-{self.fingerprint}"
+        return self._keys[path]
+
+    def _lead(self, path):
+        """path 为该内容的第一个文件；输出已在缓存中时返回缓存文件"""
+        key = self._key(path)
+        self._leaders[key] = path
+        if self.cache is not None:
+            return self.cache.lookup(key, self.img_format)
+        return None
+
+    def classify(self, path):
+        """返回 (动作, 来源)：('encode', None) 正常转换，('copy', 输出路径) 直接复制，('wait', None) 等待首个文件"""
+        try:
+            if self.cache is not None:
+                key = self._key(path)
+            else:
+                group = self._group(path)
+                first = self._groups.setdefault(group, path)
+                if first == path:
+                    return 'encode', None  # 目前唯一，暂不计算哈希
+                if first not in self._keys and first not in self._failed:
+                    self._lead(first)
+                key = self._key(path)
+        except Exception:
+            return 'encode', None  # 读取/解码失败交给转换流程记录错误
+        leader = self._leaders.get(key)
+        if leader is None:
+            cached = self._lead(path)
+            if cached is not None:
+                # 登记为已完成，之后同内容的文件直接复制缓存，不再等待
+                self._outputs[path] = cached
+                self.cache_saved += 1
+                return 'copy', cached
+            return 'encode', None
+        self.batch_saved += 1
+        if leader in self._outputs:
+            return 'copy', self._outputs[leader]
+        self._waiting.setdefault(leader, []).append(path)
+        return 'wait', None
+
+    def completed(self, path, output_path):
+        """首个文件转换完成：登记输出(并存入缓存)，返回等待复制其输出的文件"""
+        self._outputs[path] = output_path
+        key = self._keys.get(path)
+        if self.cache is not None and key is not None:
+            self.cache.store(key, self.img_format, output_path)
+        return self._waiting.pop(path, [])
+
+    def failed(self, path):
+        """首个文件转换失败：之后相同内容的文件重新选出首个文件，返回正在等待的文件(由调用方各自重新转换)"""
+        self._failed.add(path)
+        key = self._keys.get(path)
+        if key is not None and self._leaders.get(key) == path:
+            del self._leaders[key]
+        waiting = self._waiting.pop(path, [])
+        self.batch_saved -= len(waiting)
+        return waiting
+
+    def is_cached(self, path):
+        """path 是否为缓存文件(复制它作为输出时不能用硬链接)"""
+        return self.cache is not None and self.cache.contains(path)
+
+    def summary(self):
+        text = f"去重：{self.batch_saved + self.cache_saved} 个文件复用已有编码结果(批内 {self.batch_saved}"
+        if self.cache is not None:
+            text += f"，缓存 {self.cache_saved}"
+        return text + ")，省去同样次数的编码"
+
+
+def serve_duplicate(file, src, dst, job, allow_hardlink=True):
+    """用已有编码结果 src 作为 file 的输出 dst，按 job 保留修改时间/删除原文件，返回 (是否成功, 日志)
+
+    allow_hardlink: src 为缓存文件时须为 False，否则之后改写输出会连带改写缓存
+    """
+    file_path = Path(file)
+    try:
+        times = None
+        if job.preserve_metadata:
+            st = file_path.stat()
+            times = (st.st_atime, st.st_mtime)
+        how = 'same'
+        if Path(src).resolve() != Path(dst).resolve():
+            # 复制到临时文件后原子重命名；保留修改时间时各输出需要各自的时间戳，不能共用硬链接
+            how = atomic_copy(src, dst, times,
+                              partial(clone_file, allow_hardlink=allow_hardlink and not job.preserve_metadata))
+        elif times is not None:
+            os.utime(str(dst), times)
+        if job.delete_original:
+            from send2trash import send2trash
+            send2trash(str(file_path.resolve()))
+        return True, f"{file_path.name:<50} 内容重复，复用 {Path(src).name}({how})"
+    except Exception as e:
+        return False, f"转换 {file} 失败。错误原因: {e}"
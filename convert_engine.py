@@ -0,0 +1,728 @@
+"""无界面批量转换引擎
+
+GUI(AVJPWConverterPySide6.py)、命令行(image_converter.py)和交互脚本(AVJPWConverter.py)
+共用同一套转换流程；导入本模块不会加载 PySide6。
+"""
+import io
+import os
+import json
+import time
+import itertools
+from collections import deque
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import List, Optional
+
+import convert_pool
+import resize_plan
+from resize_plan import calc_target_size, image_bytes, read_header, read_info
+from convert_targets import (ResizeCache, save_image, render_targets, resample_filter, load_codec,
+                             sharpen, target_mode, check_targets, PIL_FORMATS)
+from convert_copy import atomic_copy
+from convert_animation import is_animated, save_animation, frame_workers_for, ANIMATED_FORMATS
+from convert_tiles import open_image, use_tiles, strip_decodable, resize_strips, task_peak_bytes
+from file_discovery import FileStream, IMAGE_EXTS
+from convert_manifest import ConvertManifest, params_fingerprint, MANIFEST_NAME
+from convert_metrics import StageTimer, MetricsLog
+from convert_quality import search_encode, supports_search
+from convert_dedup import Deduplicator, serve_duplicate
+from convert_writer import OutputWriter
+
+# 各编码参数的实测吞吐量(输出像素/秒)，预扫描后用于在编码开始前给出预计耗时；
+# 同时保存在清单同目录的 THROUGHPUT_NAME 中，下次启动(命令行每次都是新进程)仍可使用
+_throughput_cache = {}
+THROUGHPUT_NAME = "convert_throughput.json"
+
+
+@dataclass
+class ConvertJob:
+    """一批转换共用的参数(可 pickle，线程/进程两种后端通用)"""
+    img_format: str = 'avif'
+    quality: int = 63
+    compress: int = 6                   # PNG 压缩等级
+    height: int = 768
+    width: int = 1500
+    adjust_height: bool = False         # 按高度缩放(不放大)
+    adjust_width: bool = False          # 按宽度缩放(不放大)
+    sharpness: float = 1.0              # 1.0 不处理
+    output_dir: Optional[str] = None    # None 输出到原文件目录
+    delete_original: bool = False       # 转换后移入回收站
+    preserve_metadata: bool = True      # 保留修改时间
+    method: Optional[int] = None        # WebP method
+    speed: Optional[int] = None         # AVIF speed
+    preserve_alpha: bool = False
+    lossless: bool = False
+    subsample: Optional[str] = None     # 色彩子采样 4:2:0/4:4:4/4:2:2
+    resample: Optional[str] = None      # 重采样算法名，默认 LANCZOS
+    fast_downscale: bool = False        # JPEG draft / reduce 快速缩小
+    extra_targets: List[dict] = field(default_factory=list)  # 附加输出，见 convert_targets.parse_target
+    collect_metrics: bool = False       # 记录分阶段耗时和输入/输出字节数(见 convert_metrics)
+    target_bytes: Optional[int] = None  # 目标体积(字节)：AVIF/WebP/JPG 按图搜索不超过该体积的最高质量
+    target_ssim: Optional[float] = None  # 目标 SSIM：按图搜索亮度 SSIM 不低于该值的最低质量(优先于目标体积)
+    passthrough: bool = False           # 源文件已符合目标(同格式、无需缩放/锐化/模式转换)时直接复制，不重新编码
+    tile_pixels: Optional[int] = None   # 源图超过该像素数且需要缩小时分条处理(PNG 分条解码，JPEG 缩小解码)
+    max_pixels: Optional[int] = None    # 源图像素上限(代替 Pillow 的解压炸弹保护，0 不限制)，None 沿用 Pillow 默认
+    deferred_write: bool = False        # 只编码到内存，写文件、保留修改时间、删除原文件交给写出阶段(见 convert_writer)
+    frame_workers: Optional[int] = None  # 动画帧线程数，None 为 FRAME_WORKERS；批量转换时按工作数分配(见 frame_workers_for)
+
+    def fingerprint(self):
+        """编码参数指纹(不含输出目录、删除原文件等与编码结果无关的选项)"""
+        return params_fingerprint(
+            format=self.img_format, quality=None if self.lossless else self.quality,
+            compress=self.compress, method=self.method, speed=self.speed,
+            subsample=self.subsample, resample=self.resample,
+            height=self.height if self.adjust_height else None,
+            width=self.width if self.adjust_width else None,
+            sharpness=self.sharpness, preserve_alpha=self.preserve_alpha, lossless=self.lossless,
+            fast_downscale=self.fast_downscale, extra_targets=self.extra_targets,
+            target_bytes=self.target_bytes if self.quality_search() else None,
+            target_ssim=self.target_ssim if self.quality_search() else None,
+            passthrough=self.passthrough, tile_pixels=self.tile_pixels)
+
+    def quality_search(self):
+        """是否按目标体积/感知质量逐图搜索质量(无损和 PNG 不支持)"""
+        return bool(self.target_bytes or self.target_ssim) and supports_search(self.img_format, self.lossless)
+
+
+def get_output_path(file_path, output_dir, img_format):
+    """根据是否指定了输出目录，决定文件的输出路径"""
+    file_path = Path(file_path)
+    new_file_name = file_path.with_suffix(f'.{img_format}').name
+    if output_dir:  # 如果指定了输出路径
+        return Path(output_dir) / new_file_name
+    return file_path.parent / new_file_name  # 未指定输出路径，使用文件的原目录
+
+
+def format_eta(seconds):
+    """秒数格式化为 h:mm:ss / mm:ss"""
+    seconds = int(max(0, seconds))
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+def load_throughput(path, key):
+    """读取保存的吞吐量，没有记录或文件损坏时返回 None"""
+    if key not in _throughput_cache:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f).get(json.dumps(key))
+        except (OSError, ValueError, AttributeError):
+            value = None
+        if value:
+            _throughput_cache[key] = float(value)
+    return _throughput_cache.get(key)
+
+
+def save_throughput(path, key, value):
+    """记录吞吐量(写临时文件后替换，失败时只保留本进程内的记录)"""
+    _throughput_cache[key] = value
+    try:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        saved[json.dumps(key)] = value
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(saved, f)
+        os.replace(tmp, path)
+    except (OSError, AttributeError):
+        pass
+
+
+class _BufferPeak:
+    """统计处理过程中同时存活的像素缓冲区，记录峰值字节数"""
+
+    def __init__(self):
+        self.live = {}
+        self.keep = set()  # 仍被引用(附加输出缓存)的图像
+        self.peak = 0
+
+    def step(self, old, new):
+        """new 由 old 生成，old 不再被引用时随即释放"""
+        if new is old:
+            return new
+        self.live[id(new)] = image_bytes(new)
+        self.peak = max(self.peak, sum(self.live.values()))
+        if id(old) not in self.keep:
+            self.live.pop(id(old), None)
+        return new
+
+
+def transform(image, job, target_size=None, planned=False, stats=None, timer=None):
+    """已打开(尚未解码)的图像按 job 做模式转换、缩放和锐化
+
+    返回 (输出图像, 附加输出共享缓存)，无附加输出时缓存为 None。
+    stats 为 dict 时写入 peak_bytes：处理过程中同时存活的像素缓冲区峰值。
+    timer 为 StageTimer 时分别记录 decode/resize/sharpen 阶段耗时(先显式解码，再计后续步骤)。
+    分条模式(见 convert_tiles)下 PNG 边解码边缩小，解码和缩放合计为 decode 阶段。
+    """
+    img_format = job.img_format
+    mem = _BufferPeak()
+
+    # 只读文件头即可得到尺寸，先算出缩放目标(预扫描已算好则直接使用)
+    if not planned:
+        target_size = calc_target_size(image.width, image.height, job.height, job.width,
+                                       job.adjust_height, job.adjust_width)
+
+    # 快速缩小：JPEG 用 draft 按 1/2、1/4、1/8 直接缩小解码，保留 2 倍余量给最终的高质量重采样
+    # (其他格式 draft 无效果，由下方 resize 的 reducing_gap 先整数倍 reduce 再重采样)
+    # 有附加输出时各输出尺寸不同，不缩小解码；超大图的分条模式下 JPEG 同样缩小解码
+    tiled = use_tiles(image, job, target_size)
+    if (job.fast_downscale or tiled) and target_size and not job.extra_targets:
+        image.draft(None, (target_size[0] * 2, target_size[1] * 2))
+    # 分条模式下 PNG 不整图解码，像素缓冲区只有输出图和几条源数据
+    strips = tiled and strip_decodable(image)
+    if not strips:
+        mem.step(None, image)
+        if timer is not None:
+            image.load()
+            timer.lap('decode')
+
+    # 转换链：先规划好最终模式，多次模式转换合并为一次
+    # 1 BPP黑白图先转为灰度、P模式(调色板图像)先转为RGBA，附加输出共用这一归一化后的解码结果
+    base_mode = 'L' if image.mode == '1' else 'RGBA' if image.mode == 'P' else image.mode
+    # 导出JPG去掉透明度转为RGB；未勾选保留透明通道时去掉透明通道
+    final_mode = target_mode(base_mode, img_format.lower(), job.preserve_alpha)
+    # 缩放前的模式：1/P 无法直接高质量重采样必须先转换；L→RGB 只是复制通道，缩小后再转换更省
+    resize_mode = 'L' if target_size and base_mode == 'L' and final_mode == 'RGB' else final_mode
+
+    # 附加输出共用这一份解码结果；没有附加输出时不保留，模式转换后原图即可释放
+    source = None
+    if job.extra_targets:
+        if image.mode != base_mode:
+            image = mem.step(image, image.convert(base_mode))
+        source = image
+        mem.keep.add(id(source))
+
+    # 选择重采样算法
+    resample_method = resample_filter(job.resample)
+    if strips:
+        tile_stats = {}
+        image = mem.step(None, resize_strips(image, target_size, resize_mode, job.resample, stats=tile_stats))
+        mem.peak = max(mem.peak, tile_stats['peak_bytes'])
+        if timer is not None:
+            timer.lap('decode')
+    else:
+        if image.mode != resize_mode:
+            image = mem.step(image, image.convert(resize_mode))
+
+        # 如果需要调整高度或宽度，则调整图像大小，保持纵横比，不放大较小的图片
+        if target_size:
+            image = mem.step(image, image.resize(target_size, resample_method,
+                                                 reducing_gap=2.0 if job.fast_downscale else None))
+    if image.mode != final_mode:
+        image = mem.step(image, image.convert(final_mode))
+
+    # 主输出的缩放结果登记到共享缓存，附加输出尺寸/模式相同时直接复用
+    cache = None
+    if job.extra_targets:
+        cache = ResizeCache(source, resample_method)
+        cache.put(image)
+        mem.keep.add(id(image))
+    if timer is not None:
+        timer.lap('resize')
+
+    # 添加锐化处理：当锐化因子不为默认值 1.0 时，进行图像锐化(单次卷积)
+    if job.sharpness != 1.0:
+        image = mem.step(image, sharpen(image, job.sharpness))
+        if timer is not None:
+            timer.lap('sharpen')
+    if stats is not None:
+        stats['peak_bytes'] = mem.peak
+    return image, cache
+
+
+def passthrough_ok(info, job, target_size=None, planned=False):
+    """只看文件头判断能否直接复制源文件：同格式、无需缩放、不锐化、模式(含透明通道)不变
+
+    info 为 read_info 的结果；有附加输出或按目标体积/感知质量搜索时总是重新编码。
+    """
+    if not job.passthrough or info is None or job.extra_targets or job.quality_search():
+        return False
+    width, height, mode, fmt = info
+    img_format = job.img_format.lower()
+    if fmt != PIL_FORMATS.get(img_format) or job.sharpness != 1.0 or mode in ('1', 'P'):
+        return False
+    if target_mode(mode, img_format, job.preserve_alpha) != mode:
+        return False
+    if not planned:
+        target_size = calc_target_size(width, height, job.height, job.width, job.adjust_height, job.adjust_width)
+    return not target_size
+
+
+def copy_through(file_path, new_file_path, job, metrics=None, timer=None):
+    """直接复制源文件作为输出(内核复制到临时文件后原子重命名)，同样保留修改时间、删除原文件，返回日志"""
+    same = file_path.resolve() == new_file_path.resolve()
+    if not same:
+        times = None
+        if job.preserve_metadata:
+            original_stat = file_path.stat()
+            times = (original_stat.st_atime, original_stat.st_mtime)
+        atomic_copy(file_path, new_file_path, times)
+        if timer is not None:
+            timer.lap('encode')  # 修改时间在重命名前设置，计入复制
+    if metrics is not None:
+        metrics['bytes_in'] = metrics['bytes_out'] = file_path.stat().st_size
+        timer.lap('metadata')
+    # 输出就是源文件本身时不能删除
+    if job.delete_original and not same:
+        from send2trash import send2trash
+        send2trash(str(file_path.resolve()))
+        if timer is not None:
+            timer.lap('trash')
+    if same:
+        return f"{file_path.name:<50} 已是{job.img_format}，无需转换"
+    return f"{file_path.name:<50} 已是{job.img_format}，直接复制"
+
+
+def process_file(file, job, target_size=None, planned=False, output_path=None, peak_bytes=None, metrics=None,
+                 writes=None):
+    """转换单个文件，返回 (是否成功, 日志列表)
+
+    target_size/planned: 预扫描已算好的缩放尺寸；output_path: 指定输出路径(默认按 job.output_dir 计算)
+    peak_bytes: 调度时预估的峰值内存，给出时日志附带实际/预估峰值内存(内存预算模式)
+    metrics: dict 时写入分阶段耗时 stages 和输入/输出字节数 bytes_in/bytes_out，None 时不计时
+    writes: 列表时各输出只编码到内存，(输出路径, bytes) 追加到 writes，不创建目录、不写文件，
+    保留修改时间和删除原文件也由调用方在写出后处理(见 convert_writer)
+    """
+    logs = []
+    img_format = job.img_format
+    timer = StageTimer(metrics) if metrics is not None else None
+    try:
+        # 使用 pathlib 处理路径
+        file_path = Path(file)
+        new_file_path = Path(output_path) if output_path else get_output_path(file_path, job.output_dir, img_format)
+        # 源文件已符合目标时只读文件头即可确定，跳过解码和重新编码
+        if job.passthrough and passthrough_ok(read_info(file_path), job, target_size, planned):
+            logs.append(copy_through(file_path, new_file_path, job, metrics, timer))
+            return True, logs
+        # Pillow 在首个任务时才导入；源文件是 AVIF 时才加载 AVIF 插件
+        load_codec(file_path.suffix)
+        stats = {}
+        source = open_image(str(file_path), job)
+        animated = is_animated(source)
+        image = cache = None
+        if not (animated and img_format.lower() in ANIMATED_FORMATS):
+            image, cache = transform(source, job, target_size, planned, stats, timer)
+
+        # 检查输出路径是否存在，不存在则创建(交给写出阶段时由其创建)
+        if writes is None:
+            new_file_path.parent.mkdir(parents=True, exist_ok=True)
+        target = io.BytesIO() if writes is not None else new_file_path
+
+        # 变换图像并保存
+        note = ''
+        if image is None:
+            # 动画：逐帧解码、并行缩放/锐化，流式交给动画编码器(解码/缩放计入编码阶段)
+            note = f"(动画 {save_animation(source, target, job, target_size, planned, stats)} 帧)"
+        elif job.quality_search():
+            # 目标体积/感知质量模式：逐图搜索质量，编码结果直接写入
+            data, note = search_encode(image, job)
+            if writes is None:
+                new_file_path.write_bytes(data)
+            else:
+                target = io.BytesIO(data)
+        else:
+            save_image(image, target, img_format, quality=job.quality, compress=job.compress,
+                       method=job.method, speed=job.speed, lossless=job.lossless, subsample=job.subsample)
+            if animated:
+                note = "(动画只保留第一帧)"
+        if writes is not None:
+            writes.append((new_file_path, target.getvalue()))
+        output_paths = [new_file_path]
+        if timer is not None:
+            timer.lap('encode')
+        if peak_bytes is None:
+            logs.append(f"{file_path.name:<50} 成功转为{img_format}{note}")
+        else:
+            logs.append(f"{file_path.name:<50} 成功转为{img_format}{note} 峰值内存 {stats['peak_bytes'] / 2**20:.0f} MB"
+                        f"(预估 {peak_bytes / 2**20:.0f} MB)")
+
+        # 附加输出：同一份解码结果生成其他格式/尺寸
+        all_ok = True
+        if job.extra_targets and cache is None:
+            logs.append(f"{file_path.name:<50} 动画不生成附加输出")
+        elif job.extra_targets:
+            for path, ok, msg in render_targets(cache, file_path, new_file_path.parent, job.extra_targets,
+                                                job.sharpness, job.preserve_alpha, writes):
+                logs.append(msg)
+                if ok:
+                    output_paths.append(path)
+                all_ok = all_ok and ok
+            if timer is not None:
+                timer.lap('targets')
+
+        if writes is not None:
+            # 写文件、修改时间和删除原文件由写出阶段在输出落盘后处理
+            if metrics is not None:
+                metrics['bytes_in'] = file_path.stat().st_size
+                metrics['bytes_out'] = sum(len(data) for _, data in writes)
+            return all_ok, logs
+
+        # 是否保留元数据
+        if job.preserve_metadata:
+            original_stat = file_path.stat()
+            for path in output_paths:
+                os.utime(str(path), (original_stat.st_atime, original_stat.st_mtime))
+        if metrics is not None:
+            metrics['bytes_in'] = file_path.stat().st_size
+            metrics['bytes_out'] = sum(os.path.getsize(path) for path in output_paths)
+            timer.lap('metadata')  # stat 开销计入元数据阶段
+
+        if not all_ok:
+            return False, logs
+
+        # 如果选择了删除原文件，则删除(移入回收站)
+        if job.delete_original:
+            from send2trash import send2trash
+            send2trash(str(file_path.resolve()))
+            if timer is not None:
+                timer.lap('trash')
+
+        return True, logs
+    except Exception as e:
+        logs.append(f"转换 {file} 失败。错误原因: {e}")
+        return False, logs
+
+
+def _as_reader(data):
+    """bytes/bytearray/memoryview 包装为只读文件对象(bytes 与 BytesIO 共享内存，不复制)"""
+    if hasattr(data, 'read'):
+        return data
+    if isinstance(data, memoryview) and isinstance(data.obj, bytes) and data.nbytes == len(data.obj):
+        data = data.obj  # 覆盖整个 bytes 的视图直接用原对象
+    return io.BytesIO(data)
+
+
+def convert_bytes(data, job, out=None):
+    """内存接口：编码前的处理流程与 process_file 相同，全程不落盘
+
+    data: bytes/bytearray/memoryview 或可读文件对象；out: 可写文件对象(如 BytesIO、上传流)，
+    给出时直接编码写入并返回 out，否则返回编码后的 bytes。
+    不支持附加输出(job.extra_targets)、删除原文件和保留修改时间等与文件相关的选项。
+    """
+    if job.extra_targets:
+        raise ValueError("内存接口不支持附加输出")
+    load_codec('avif')  # 无文件名可判断输入格式，AVIF 插件按需加载
+    source = open_image(_as_reader(data), job)
+    if is_animated(source) and job.img_format.lower() in ANIMATED_FORMATS:
+        buf = out if out is not None else io.BytesIO()
+        save_animation(source, buf, job)
+        return out if out is not None else buf.getvalue()
+    image, _ = transform(source, job)
+    if job.quality_search():
+        encoded, _ = search_encode(image, job)
+        if out is None:
+            return encoded
+        out.write(encoded)
+        return out
+    buf = out if out is not None else io.BytesIO()
+    save_image(image, buf, job.img_format, quality=job.quality, compress=job.compress,
+               method=job.method, speed=job.speed, lossless=job.lossless, subsample=job.subsample)
+    # BytesIO.getvalue() 在未被其他对象引用缓冲区时直接交出内部 bytes，不再复制
+    return out if out is not None else buf.getvalue()
+
+
+def warm_up(formats=('avif',)):
+    """预先导入 Pillow 及编解码插件(常驻服务启动时在每个工作进程中调用)，返回进程号"""
+    from PIL import Image
+    Image.init()
+    for fmt in formats:
+        load_codec(fmt)
+    return os.getpid()
+
+
+def file_task(idx, file, job, extra=None):
+    """单文件任务(模块级函数，可被进程池 pickle)，带暂停/停止检查和重试
+
+    extra 为该文件独有的参数(如预扫描算好的 target_size)，传给 process_file。
+    返回 (结果, 序号, 文件, 日志, 耗时秒数, 指标, 待写出)，job.collect_metrics 未开启时指标为 None，
+    job.deferred_write 开启时待写出为 [(输出路径, bytes)]，否则为 None
+    """
+    # 检查暂停/停止
+    if not convert_pool.wait_if_paused():
+        return 'stopped', idx, file, [], 0.0, None, None
+    start = time.perf_counter()
+    try_count = 0
+    max_try = 3
+    logs = []
+    metrics = None
+    while try_count < max_try:
+        if convert_pool.is_stopped():
+            return 'stopped', idx, file, [], 0.0, None, None
+        metrics = {} if job.collect_metrics else None
+        writes = [] if job.deferred_write else None
+        try:
+            ok, logs = process_file(file, job, metrics=metrics, writes=writes, **(extra or {}))
+            return ok, idx, file, logs, time.perf_counter() - start, metrics, writes
+        except Exception as e:
+            logs = [f"转换 {file} 失败。错误原因: {e}"]
+            try_count += 1
+            time.sleep(1)
+    return False, idx, file, logs, time.perf_counter() - start, metrics, None
+
+
+def run_batch(input_files, job, log, workers=None, backend="thread", schedule="stream",
+              incremental=False, manifest_path=None, use_hash=False,
+              pause_event=None, stop_event=None, on_progress=None, exts=IMAGE_EXTS, memory_budget=None,
+              metrics_path=None, metrics_top=10, dedup=None, dedup_cache=None, async_write=True, fsync=True):
+    """批量转换输入文件/目录
+
+    log: logging.Logger 风格对象；on_progress(progress): 每个结果后回调，
+    manifest_path: 增量转换清单路径，预扫描用的实测吞吐量也保存在其所在目录(THROUGHPUT_NAME)；
+    memory_budget: 内存预算(字节)，按文件头估算每个任务的峰值内存，在途任务之和不超过预算；
+    metrics_path: 指标日志路径(.csv 为 CSV，否则 JSON lines)，给出时记录每个文件的分阶段耗时，
+    结束时输出各阶段汇总和最慢的 metrics_top 个文件；
+    dedup: 内容去重方式('bytes'/'pixels'，见 convert_dedup)，内容相同的文件只编码一次，其余复制输出；
+    dedup_cache: 去重缓存目录，给出时编码结果跨批次复用；
+    async_write: 工作线程/进程只编码到内存，由写出阶段(convert_writer)写临时文件后原子重命名，
+    输出设备慢时编码不必等待写入；fsync: 写出阶段批量 fsync 后再重命名(输出落盘后才算完成)；
+    progress 为 dict(failed, completed, discovered, eta)，eta 为预计剩余秒数(未知为 None)。
+    返回统计 dict(completed, failed, skipped, discovered, stopped, wall_time)。
+    """
+    manifest = None
+    metrics_log = None
+    deduper = None
+    writer = None
+    stats = dict(completed=0, failed=0, skipped=0, discovered=0, stopped=False, wall_time=0.0)
+    check_targets(job.img_format, job.extra_targets)
+    try:
+        # 增量模式：跳过输出已是最新的文件(只做 stat，不打开图片)
+        fingerprint = job.fingerprint()
+        if incremental:
+            manifest = ConvertManifest(manifest_path or MANIFEST_NAME, use_hash=use_hash)
+        if metrics_path:
+            metrics_log = MetricsLog(metrics_path, top=metrics_top)
+            job = replace(job, collect_metrics=True)
+        if dedup:
+            if job.extra_targets:
+                log.info("附加输出模式下不做内容去重")
+            else:
+                deduper = Deduplicator(dedup, fingerprint, job.img_format, dedup_cache, job.max_pixels)
+        if async_write:
+            job = replace(job, deferred_write=True)
+            writer = OutputWriter(fsync=fsync)
+
+        max_workers = max(1, workers or os.cpu_count() or 1)
+        # 每个工作线程/进程内的动画帧线程数，总线程数不超过核数(工作数已占满各核时不再开帧线程)
+        job = replace(job, frame_workers=frame_workers_for(max_workers))
+        if backend == "process":
+            log.info(f"使用进程数: {max_workers}")
+        else:
+            log.info(f"使用线程数: {max_workers}")
+        if job.extra_targets:
+            log.info(f"附加输出：{len(job.extra_targets)} 个(每个源文件只解码一次)")
+        if memory_budget:
+            log.info(f"内存预算: {memory_budget / 2**20:.0f} MB(按文件头估算每个任务的峰值内存)")
+
+        # 边遍历边转换：后台线程 os.scandir 遍历目录，发现第一个文件就开始提交
+        stream = FileStream(input_files, exts=exts, stop_event=stop_event).start()
+
+        durations = []
+        # 预扫描模式下按输出像素计算进度和剩余时间，比按文件数准确
+        throughput_key = (job.img_format, job.quality, job.method, job.speed, job.lossless)
+        throughput_path = os.path.join(os.path.dirname(os.path.abspath(manifest_path or MANIFEST_NAME)),
+                                       THROUGHPUT_NAME)
+        planned_pixels = {}
+        eta_state = {'total': 0, 'done': 0, 'start': None}
+        # 去重：等待首个文件的文件(及其预扫描结果)，首个文件失败后转入 retries 重新提交
+        parked = {}
+        retries = deque()
+        next_idx = itertools.count()
+
+        def handle_result(result):
+            ok, idx, file, logs, elapsed, metrics, writes = result
+            if writes and ok is True:
+                # 编码结果交给写出阶段，落盘后再记录结果(写出跟不上时在此阻塞，减慢提交)；
+                # 有附加输出失败的文件整体记为失败，已编码的输出不写出
+                times = None
+                if job.preserve_metadata:
+                    try:
+                        st = os.stat(file)
+                        times = (st.st_atime, st.st_mtime)
+                    except OSError:
+                        pass
+                writer.submit(result[:6], writes, times)
+                drain_writes()
+            else:
+                finish(result[:6])
+
+        def drain_writes():
+            for token, error in writer.completed():
+                finish(token, written=True, error=error)
+
+        def finish(result, written=False, error=None):
+            ok, idx, file, logs, elapsed, metrics = result
+            for msg in logs:
+                log.info(msg)
+            if error:
+                log.info(error)
+                ok = False
+            elif written and ok and job.delete_original:
+                # 输出已落盘，删除(移入回收站)原文件
+                try:
+                    from send2trash import send2trash
+                    send2trash(str(Path(file).resolve()))
+                except Exception as e:
+                    log.info(f"转换 {file} 失败。错误原因: {e}")
+                    ok = False
+            if ok == 'stopped':
+                stats['stopped'] = True
+                return
+            if idx is not None:
+                durations.append(elapsed)  # 去重复制在调度线程完成，不计入工作线程耗时
+            if metrics_log is not None and metrics is not None:
+                metrics_log.record(file, ok, elapsed, metrics)
+            if ok:
+                stats['completed'] += 1
+                output_path = get_output_path(file, job.output_dir, job.img_format)
+                if manifest is not None:
+                    manifest.record(file, output_path, fingerprint)
+            else:
+                stats['failed'] += 1
+            eta = None
+            if planned_pixels:
+                eta_state['done'] += planned_pixels.pop(idx, 0)
+                spent = time.perf_counter() - eta_state['start']
+                if eta_state['done'] and spent > 0:
+                    eta = (eta_state['total'] - eta_state['done']) / (eta_state['done'] / spent)
+            if on_progress is not None:
+                on_progress(dict(failed=stats['failed'], completed=stats['completed'],
+                                 discovered=stream.discovered, eta=eta))
+            if deduper is not None and idx is not None:
+                # 首个文件完成后处理等待复用其输出的同内容文件
+                if ok:
+                    for dup in deduper.completed(file, output_path):
+                        handle_result(serve(dup, output_path))
+                else:
+                    for dup in deduper.failed(file):
+                        log.info(f"{Path(dup).name} 与转换失败的 {Path(file).name} 内容相同，重新单独转换")
+                        retries.append((dup, parked.pop(dup, None)))
+
+        def serve(file, src):
+            started = time.perf_counter()
+            ok, msg = serve_duplicate(file, src, get_output_path(file, job.output_dir, job.img_format), job,
+                                      allow_hardlink=not deduper.is_cached(src))
+            return ok, None, file, [msg], time.perf_counter() - started, None, None
+
+        def is_current(file):
+            """增量模式下输出已是最新(只做 stat)，计入跳过数"""
+            if manifest is not None and manifest.is_current(
+                    file, get_output_path(file, job.output_dir, job.img_format), fingerprint):
+                stats['skipped'] += 1
+                return True
+            return False
+
+        def iter_jobs():
+            # 先按清单过滤，预扫描不必再读已是最新的文件的文件头
+            jobs = ((file, None) for file in stream if not is_current(file))
+            if schedule == "largest":
+                # 预扫描：等遍历结束，只读文件头一次性算出整批缩放计划，按代价从大到小提交
+                plan = resize_plan.build_plan([file for file, _ in jobs], job.height, job.width, job.adjust_height,
+                                              job.adjust_width, job.img_format, job.preserve_alpha,
+                                              job.sharpness, max_workers,
+                                              None if job.extra_targets else job.tile_pixels)
+                log.info(f"预扫描完成：{len(plan.entries)} 个文件，源 {plan.source_pixels / 1e6:.1f} MP，"
+                         f"预计输出 {plan.output_pixels / 1e6:.1f} MP")
+                throughput = load_throughput(throughput_path, throughput_key)
+                if throughput:
+                    log.info(f"预计耗时: {format_eta(plan.output_pixels / throughput)}")
+                eta_state['total'] = plan.output_pixels
+                eta_state['start'] = time.perf_counter()
+                jobs = [(e['path'], e) for e in plan.largest_first()] + [(f, None) for f in plan.unreadable]
+            for file, entry in jobs:
+                yield from retry_jobs()
+                if deduper is not None:
+                    action, src = deduper.classify(file)
+                    if action != 'encode':
+                        if entry is not None:
+                            eta_state['total'] -= entry['out_pixels']
+                        if action == 'copy':
+                            handle_result(serve(file, src))
+                        else:
+                            parked[file] = entry
+                        continue
+                yield prepare(file, entry)
+            yield from retry_jobs()
+
+        def retry_jobs():
+            while retries:
+                file, entry = retries.popleft()
+                if entry is not None:
+                    eta_state['total'] += entry['out_pixels']
+                yield prepare(file, entry)
+
+        def prepare(file, entry):
+            """组装单个任务的参数：预扫描算好的尺寸、预估峰值内存"""
+            idx = next(next_idx)
+            extra = None
+            if entry is not None:
+                planned_pixels[idx] = entry['out_pixels']
+                extra = dict(target_size=entry['target_size'], planned=True)
+            if memory_budget:
+                extra = dict(extra or {}, peak_bytes=estimate_memory(file, entry))
+                if extra['peak_bytes'] > memory_budget:
+                    log.info(f"{Path(file).name} 预估峰值内存 {extra['peak_bytes'] / 2**20:.0f} MB 超过预算，将单独运行")
+            return idx, file, job, extra
+
+        def estimate_memory(file, entry):
+            """预估单个任务峰值内存：预扫描已读过文件头则直接使用，否则只读文件头估算"""
+            if entry is not None:
+                return entry['peak_bytes']
+            header = read_header(file)
+            if header is None:
+                return 0  # 无法读取的文件很快会失败，不占预算
+            width, height, mode = header
+            target_size = calc_target_size(width, height, job.height, job.width,
+                                           job.adjust_height, job.adjust_width)
+            return task_peak_bytes((width, height), mode, target_size, job.img_format, job.preserve_alpha,
+                                   job.sharpness, None if job.extra_targets else job.tile_pixels)
+
+        def job_memory(args):
+            return (args[3] or {}).get('peak_bytes', 0)
+
+        with convert_pool.create_executor(backend, max_workers, pause_event, stop_event) as executor:
+            start_time = time.perf_counter()
+            # 在途任务不超过 2×工作数，按完成顺序输出日志
+            jobs = iter_jobs()
+            while True:
+                for result in convert_pool.run_bounded(executor, file_task, jobs, max_workers * 2,
+                                                       pause_event, stop_event, memory_budget, job_memory):
+                    handle_result(result)
+                if writer is not None:
+                    writer.flush()
+                    drain_writes()
+                # 最后一批首个文件失败时，等待它们的文件在提交结束后才转入 retries，再提交一轮
+                if not retries or (stop_event is not None and stop_event.is_set()):
+                    break
+                jobs = retry_jobs()
+            stream.close()
+            if writer is not None:
+                writer.close()
+                drain_writes()
+            stats['wall_time'] = time.perf_counter() - start_time
+        stats['discovered'] = stream.discovered
+        if stop_event is not None and stop_event.is_set():
+            stats['stopped'] = True
+        if eta_state['done'] and not stats['stopped']:
+            save_throughput(throughput_path, throughput_key,
+                            eta_state['done'] / (time.perf_counter() - eta_state['start']))
+        log.info(convert_pool.makespan_report(durations, stats['wall_time'], max_workers))
+        if manifest is not None:
+            log.info(f"增量转换：跳过 {stats['skipped']} 个已是最新的文件")
+        if deduper is not None:
+            log.info(deduper.summary())
+        if metrics_log is not None:
+            for line in metrics_log.summary():
+                log.info(line)
+        return stats
+    finally:
+        if writer is not None:
+            writer.close()
+        if manifest is not None:
+            manifest.close()
+        if metrics_log is not None:
+            metrics_log.close()
@@ -0,0 +1,114 @@
+import os
+import json
+import hashlib
+import threading
+
+MANIFEST_NAME = "convert_manifest.db"
+
+
+def params_fingerprint(**params):
+    """编码参数指纹：参数任意变化都会使旧的输出失效"""
+    raw = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """流式计算文件内容哈希(blake2b)"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ConvertManifest:
+    """增量转换清单(SQLite)
+
+    以源文件路径为键，记录源文件大小、修改时间、可选内容哈希、编码参数指纹
+    以及输出文件路径/大小。源文件和参数都未变且输出文件仍在时视为最新，可跳过。
+    """
+
+    def __init__(self, path, use_hash=False, batch_size=500):
+        self.path = str(path)
+        self.use_hash = use_hash
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        import sqlite3  # 只有增量转换才用到，延迟导入
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " src TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT,"
+            " params TEXT, dst TEXT, dst_size INTEGER)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def is_current(self, src, dst, fingerprint):
+        """输出是否为最新(只做 stat，必要时计算哈希，不解码图片)"""
+        try:
+            st = os.stat(src)
+            dst_size = os.stat(dst).st_size
+        except OSError:
+            return False
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, hash, params, dst, dst_size FROM files WHERE src=?",
+                (self._key(src),)).fetchone()
+        if row is None:
+            return False
+        size, mtime_ns, content_hash, params, old_dst, old_dst_size = row
+        if params != fingerprint or old_dst != self._key(dst) or old_dst_size != dst_size:
+            return False
+        if size == st.st_size and mtime_ns == st.st_mtime_ns:
+            return True
+        # 修改时间变化但内容可能未变(复制、解压等)：比较内容哈希
+        if self.use_hash and content_hash and size == st.st_size:
+            if file_hash(src) == content_hash:
+                self.record(src, dst, fingerprint, content_hash=content_hash)
+                return True
+        return False
+
+    def record(self, src, dst, fingerprint, content_hash=None):
+        """记录一次成功的转换，批量写入"""
+        try:
+            st = os.stat(src)
+            dst_size = os.stat(dst).st_size
+            if self.use_hash and content_hash is None:
+                content_hash = file_hash(src)
+        except OSError:
+            return  # 源文件已删除(转换后删除原文件)等情况无需记录
+        with self._lock:
+            self._pending.append((self._key(src), st.st_size, st.st_mtime_ns, content_hash,
+                                  fingerprint, self._key(dst), dst_size))
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._pending:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", self._pending)
+            self.conn.commit()
+            self._pending = []
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
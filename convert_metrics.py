@@ -0,0 +1,108 @@
+import csv
+import json
+import time
+import heapq
+from pathlib import Path
+
+METRICS_NAME = "convert_metrics.jsonl"
+
+# 单文件处理阶段(按执行顺序)：解码、模式转换+缩放、锐化、编码写入、附加输出、保留修改时间、移入回收站
+STAGES = ('decode', 'resize', 'sharpen', 'encode', 'targets', 'metadata', 'trash')
+
+
+def percentile(values, p):
+    """已排序列表的分位数，空列表返回 None"""
+    return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+
+class StageTimer:
+    """分阶段计时：每次 lap(stage) 记录距上一次 lap 的耗时(秒)，写入 record['stages']
+
+    只在开启指标日志时创建，关闭时调用方传 None，处理流程不做任何计时。
+    """
+
+    def __init__(self, record):
+        self.stages = record.setdefault('stages', {})
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._last
+        self._last = now
+
+
+class MetricsLog:
+    """结构化指标日志：每个文件一行(JSON lines，路径以 .csv 结尾时为 CSV)，以追加方式写入
+
+    同时累计各阶段耗时，结束时由 summary() 给出各阶段合计/分位数和最慢的 top 个文件。
+    """
+
+    def __init__(self, path, top=10):
+        self.path = str(path)
+        self.csv = self.path.lower().endswith('.csv')
+        self.top = top
+        self.count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._stages = {stage: [] for stage in STAGES}
+        self._slowest = []  # (耗时, 序号, 文件) 小顶堆
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8', newline='')
+        self._writer = None
+        if self.csv:
+            self._writer = csv.writer(self._file)
+            if self._file.tell() == 0:
+                self._writer.writerow(['file', 'ok', 'total_ms', 'bytes_in', 'bytes_out']
+                                      + [f"{stage}_ms" for stage in STAGES])
+
+    def record(self, file, ok, elapsed, metrics):
+        """记录一个文件：elapsed 为总耗时(秒)，metrics 为 process_file 填写的 dict(stages, bytes_in, bytes_out)"""
+        stages = metrics.get('stages', {})
+        bytes_in = metrics.get('bytes_in', 0)
+        bytes_out = metrics.get('bytes_out', 0)
+        if self.csv:
+            self._writer.writerow([str(file), int(bool(ok)), round(elapsed * 1000, 3), bytes_in, bytes_out]
+                                  + [round(stages[s] * 1000, 3) if s in stages else '' for s in STAGES])
+        else:
+            self._file.write(json.dumps(dict(
+                file=str(file), ok=bool(ok), total_ms=round(elapsed * 1000, 3), bytes_in=bytes_in,
+                bytes_out=bytes_out, stages={s: round(v * 1000, 3) for s, v in stages.items()}),
+                ensure_ascii=False) + '\n')
+        self.count += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        for stage, seconds in stages.items():
+            self._stages.setdefault(stage, []).append(seconds)
+        item = (elapsed, self.count, str(file))
+        if len(self._slowest) < self.top:
+            heapq.heappush(self._slowest, item)
+        elif self.top:
+            heapq.heappushpop(self._slowest, item)
+
+    def summary(self):
+        """结束时的汇总表，返回日志行列表"""
+        if not self.count:
+            return []
+        lines = [f"阶段耗时统计(共 {self.count} 个文件，输入 {self.bytes_in / 2**20:.1f} MB，"
+                 f"输出 {self.bytes_out / 2**20:.1f} MB)："]
+        for stage, values in self._stages.items():
+            if not values:
+                continue
+            values.sort()
+            lines.append(f"  {stage:<8} 合计 {sum(values):8.2f}s  p50 {percentile(values, 0.5) * 1000:8.1f} ms  "
+                         f"p95 {percentile(values, 0.95) * 1000:8.1f} ms  最大 {values[-1] * 1000:8.1f} ms")
+        if self._slowest:
+            lines.append(f"最慢的 {len(self._slowest)} 个文件：")
+            for elapsed, _, file in sorted(self._slowest, reverse=True):
+                lines.append(f"  {elapsed * 1000:8.0f} ms  {file}")
+        lines.append(f"指标日志: {self.path}")
+        return lines
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
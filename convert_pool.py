@@ -0,0 +1,169 @@
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# 可选执行后端：thread 线程池(默认)，process 进程池(绕开GIL，多核满载)
+BACKENDS = ("thread", "process")
+# 调度策略：stream 按发现顺序边遍历边转换(默认)，largest 预读文件头后大文件优先
+SCHEDULES = ("stream", "largest")
+
+# 统一使用 spawn 上下文(Windows 默认，也避免 Linux 下 fork 带着 Qt 线程状态)
+_mp_context = multiprocessing.get_context("spawn")
+
+# 工作进程/线程内共享的暂停/停止事件，由 init_worker 设置
+_pause_event = None
+_stop_event = None
+
+
+def set_low_priority():
+    """将当前进程优先级设置为较低"""
+    try:
+        if sys.platform.startswith('win'):
+            import psutil
+            p = psutil.Process(os.getpid())
+            p.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+        elif os.nice(0) < 10:  # 已降低过则不再叠加
+            os.nice(10 - os.nice(0))
+    except Exception as e:
+        print(f"警告：无法设置低优先级: {e}", file=sys.stderr)
+
+
+def set_thread_low_priority():
+    """只降低当前线程的优先级(线程池工作线程用，不影响同进程的界面线程)
+
+    Linux 的 nice 值按线程生效；Windows 用 SetThreadPriority；其他系统不处理。
+    """
+    try:
+        if sys.platform.startswith('win'):
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), -1)  # THREAD_PRIORITY_BELOW_NORMAL
+        elif sys.platform.startswith('linux'):
+            import threading
+            tid = threading.get_native_id()
+            if os.getpriority(os.PRIO_PROCESS, tid) < 10:
+                os.setpriority(os.PRIO_PROCESS, tid, 10)
+    except Exception as e:
+        print(f"警告：无法设置低优先级: {e}", file=sys.stderr)
+
+
+def init_worker(pause_event=None, stop_event=None, low_priority=True):
+    """工作进程初始化：保存暂停/停止事件，降低优先级(AVIF 插件在首次用到时加载，见 convert_targets.load_codec)"""
+    global _pause_event, _stop_event
+    _pause_event = pause_event
+    _stop_event = stop_event
+    if multiprocessing.parent_process() is not None:
+        # 工作进程忽略 Ctrl+C，由主进程通过 stop_event/关闭执行器统一结束
+        import signal
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if low_priority:
+        set_low_priority()
+
+
+def wait_if_paused():
+    """暂停时阻塞等待，返回 False 表示已被停止"""
+    while _pause_event is not None and not _pause_event.is_set():
+        if is_stopped():
+            return False
+        time.sleep(0.1)
+    return not is_stopped()
+
+
+def is_stopped():
+    return _stop_event is not None and _stop_event.is_set()
+
+
+def new_event():
+    """创建可在线程和工作进程间共享的事件(需与进程池同一上下文)"""
+    return _mp_context.Event()
+
+
+def create_executor(backend, max_workers, pause_event=None, stop_event=None, low_priority=True):
+    """创建执行器
+
+    进程池模式下 pause_event/stop_event 必须由 new_event() 创建，
+    通过 initializer 传给每个工作进程，任务参数必须可 pickle。
+    low_priority 时进程池降低各工作进程的优先级，线程池只降低各工作线程的优先级(见 set_thread_low_priority)，
+    调用方(如界面)所在的线程不受影响。
+    """
+    max_workers = max(1, max_workers)
+    if backend == "process":
+        from concurrent.futures import ProcessPoolExecutor  # 只在进程池模式下导入
+        return ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=_mp_context,
+            initializer=init_worker,
+            initargs=(pause_event, stop_event, low_priority),
+        )
+    init_worker(pause_event, stop_event, low_priority=False)
+    return ThreadPoolExecutor(max_workers=max_workers,
+                              initializer=set_thread_low_priority if low_priority else None)
+
+
+def run_bounded(executor, fn, jobs, window, pause_event=None, stop_event=None,
+                memory_budget=None, job_memory=None):
+    """有界窗口调度：边提交边收取，按完成顺序产出 fn(*args) 的结果
+
+    jobs 为参数元组的迭代器(可以是流式遍历的生成器)，同时在途的任务不超过 window 个，
+    不会为整批文件预先创建 Future；一个慢任务也不会挡住其后已完成任务的结果。
+    暂停时不再提交新任务，停止时取消尚未开始的任务。
+    memory_budget(字节)与 job_memory(args) 给出时，在途任务的预计峰值内存之和不超过预算；
+    单个任务超过预算时等其他任务全部结束后单独运行。
+    """
+    window = max(1, window)
+    pending = set()
+    costs = {}  # 在途任务 -> 预计峰值内存
+
+    def over_budget(cost):
+        return bool(memory_budget) and bool(pending) and sum(costs[f] for f in pending) + cost > memory_budget
+
+    def stopped():
+        return stop_event is not None and stop_event.is_set()
+
+    def paused():
+        return pause_event is not None and not pause_event.is_set()
+
+    for args in jobs:
+        cost = job_memory(args) if memory_budget and job_memory else 0
+        # 窗口已满、内存预算不足或暂停中：等待并产出已完成的结果
+        while (len(pending) >= window or over_budget(cost) or paused()) and not stopped():
+            if not pending:
+                time.sleep(0.1)
+                continue
+            done, pending = wait(pending, timeout=0.1 if paused() else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                costs.pop(future, None)
+                yield future.result()
+        if stopped():
+            break
+        future = executor.submit(fn, *args)
+        costs[future] = cost
+        pending.add(future)
+        # 顺手收取已完成的结果，遍历较慢时日志和进度也能及时更新
+        done, pending = wait(pending, timeout=0)
+        for future in done:
+            costs.pop(future, None)
+            yield future.result()
+
+    if stopped():
+        for future in pending:
+            future.cancel()
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if not future.cancelled():
+                yield future.result()
+
+
+def makespan_report(durations, wall_time, workers):
+    """对比实际总耗时与理想下界 max(总工作量/工作数, 最长任务)"""
+    if not durations or wall_time <= 0:
+        return "无已完成任务，无法统计调度效率"
+    total = sum(durations)
+    longest = max(durations)
+    ideal = max(total / max(1, workers), longest)
+    return (f"实际耗时 {wall_time:.1f}s，理想下界 {ideal:.1f}s"
+            f"(总工作量 {total:.1f}s / {workers} 工作数，最长任务 {longest:.1f}s)，"
+            f"调度效率 {ideal / wall_time:.0%}")
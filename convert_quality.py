@@ -0,0 +1,250 @@
+import io
+import math
+
+from convert_targets import save_image
+
+# Pillow 及编解码插件在首次用到时才导入(见 convert_targets)
+
+# 支持按目标体积/感知质量搜索质量的格式及其质量范围(与界面质量框范围一致)
+QUALITY_RANGE = {'jpg': (1, 100), 'jpeg': (1, 100), 'webp': (0, 100), 'avif': (1, 63)}
+
+# 试编码代理图的最大像素数：先在代理图上二分，再用少量完整编码校正
+PROXY_PIXELS = 512 * 512
+
+# 内容类别 -> (上次选定的质量, 完整编码/代理预测 体积比)，同类图片从更接近的位置开始搜索
+_class_cache = {}
+# 内容类别 -> (上次满足感知质量目标的最低质量, 完整图结果相对代理图结果的质量偏移)
+_ssim_cache = {}
+
+# SSIM 窗口边长(均值窗口，积分图计算)和分条计算的行数
+SSIM_WINDOW = 7
+SSIM_STRIP_ROWS = 256
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+
+def supports_search(img_format, lossless=False):
+    """是否支持按目标体积/感知质量搜索质量(无损和 PNG 不支持)"""
+    return not lossless and img_format.lower() in QUALITY_RANGE
+
+
+def encode_bytes(image, job, quality):
+    """按 job 的编码参数(质量除外)编码到内存，返回 bytes"""
+    buf = io.BytesIO()
+    save_image(image, buf, job.img_format, quality=quality, compress=job.compress, method=job.method,
+               speed=job.speed, lossless=False, subsample=job.subsample)
+    return buf.getvalue()
+
+
+def make_proxy(image, max_pixels=PROXY_PIXELS):
+    """缩小的代理图(像素数不超过 max_pixels)，返回 (代理图, 原图/代理图 像素比)"""
+    pixels = image.width * image.height
+    if pixels <= max_pixels:
+        return image, 1.0
+    from PIL import Image
+    scale = math.sqrt(max_pixels / pixels)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    proxy = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    return proxy, pixels / (size[0] * size[1])
+
+
+def content_class(image, job):
+    """内容类别：格式/编码参数、模式、输出像素量级和细节量(缩略图边缘强度)"""
+    from PIL import ImageFilter, ImageStat
+    thumb = image.convert('L') if image.mode != 'L' else image
+    thumb = thumb.resize((64, 64))
+    detail = ImageStat.Stat(thumb.filter(ImageFilter.FIND_EDGES)).mean[0]
+    return (job.img_format.lower(), job.speed, job.method, job.subsample, image.mode,
+            int(math.log2(max(1, image.width * image.height))), int(math.log2(1 + detail) * 2))
+
+
+def encode_to_size(image, job, target_bytes=None, max_full=3):
+    """搜索不超过目标体积的最高质量并编码
+
+    先在代理图上二分(代理体积 × 像素比 × 校正比 预测完整体积)，再做完整编码核对；
+    每次完整编码都记录该质量的实测校正比(其他质量按实测值插值)并缩小搜索区间，完整编码最多 max_full 次。
+    返回 (质量, 编码结果 bytes, 是否达到目标)；均超过目标时返回体积最小的一次。
+    """
+    target_bytes = target_bytes or job.target_bytes
+    lo, hi = QUALITY_RANGE[job.img_format.lower()]
+    key = content_class(image, job)
+    guess, ratio = _class_cache.get(key, (None, 1.0))
+    proxy, scale = make_proxy(image)
+    proxy_sizes = {}
+    small = {}  # 图像本身不超过代理尺寸时，试编码结果即完整编码结果
+
+    def proxy_size(q):
+        if q not in proxy_sizes:
+            data = encode_bytes(proxy, job, q)
+            proxy_sizes[q] = len(data)
+            if proxy is image:
+                small[q] = data
+        return proxy_sizes[q]
+
+    ratios = {}  # 已完整编码的质量 -> 实测校正比
+
+    def ratio_at(q):
+        """按已实测的校正比在质量上线性插值(区间外取最近的实测值)，尚无实测时用同类图片的校正比"""
+        if not ratios:
+            return ratio
+        below = max((k for k in ratios if k <= q), default=None)
+        above = min((k for k in ratios if k >= q), default=None)
+        if below is None or above is None or below == above:
+            return ratios[below if above is None else above]
+        t = (q - below) / (above - below)
+        return ratios[below] + (ratios[above] - ratios[below]) * t
+
+    def predicted(q):
+        return proxy_size(q) * scale * ratio_at(q)
+
+    def highest_fitting(lo, hi):
+        """代理图上二分：区间内预测不超过目标的最高质量，都超过时返回 lo"""
+        best = lo
+        # 同类图片上次的质量作为第一个试探点
+        probe = guess if guess is not None and lo <= guess <= hi else (lo + hi) // 2
+        while lo <= hi:
+            if predicted(probe) <= target_bytes:
+                best, lo = probe, probe + 1
+            else:
+                hi = probe - 1
+            probe = (lo + hi) // 2
+        return best
+
+    fitted = None    # 已验证不超过目标的最高质量结果
+    smallest = None  # 体积最小的结果(均超过目标时使用)
+    for _ in range(max(1, max_full)):
+        if lo > hi:
+            break
+        q = highest_fitting(lo, hi)
+        if fitted and predicted(q) > target_bytes:
+            break  # 按校正后的预测，比已验证结果更高的质量都会超过目标
+        data = small[q] if q in small else encode_bytes(image, job, q)
+        ratios[q] = len(data) / (proxy_size(q) * scale)
+        if len(data) <= target_bytes:
+            fitted = (q, data)
+            lo = q + 1
+        else:
+            if smallest is None or len(data) < len(smallest[1]):
+                smallest = (q, data)
+            hi = q - 1
+
+    quality, data = fitted or smallest
+    _class_cache[key] = (quality, ratios[quality])
+    return quality, data, fitted is not None
+
+
+def _numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        raise RuntimeError("感知质量模式需要安装 numpy")
+
+
+def luma(image):
+    """图像亮度通道转为 float64 数组(透明通道不参与比较)"""
+    np = _numpy()
+    return np.asarray(image.convert('L') if image.mode != 'L' else image, dtype=np.float64)
+
+
+def _box(a, w):
+    """积分图求 w×w 均值窗口(只取完整窗口，不补边)"""
+    np = _numpy()
+    s = np.zeros((a.shape[0] + 1, a.shape[1] + 1))
+    np.cumsum(a, axis=0, out=s[1:, 1:])
+    np.cumsum(s[1:, 1:], axis=1, out=s[1:, 1:])
+    return (s[w:, w:] - s[:-w, w:] - s[w:, :-w] + s[:-w, :-w]) / (w * w)
+
+
+def ssim(ref, test, target=None, window=SSIM_WINDOW, strip_rows=SSIM_STRIP_ROWS):
+    """两张同尺寸亮度数组的平均 SSIM(NumPy 向量化，按行分条计算以限制内存)
+
+    相邻条重叠 window-1 行，每个完整窗口恰好计算一次。给出 target 时提前结束：
+    已算部分加上其余窗口全按 1.0 计仍达不到 target 时立即返回(此时返回值是上界)。
+    """
+    height, width = ref.shape
+    if height < window or width < window:
+        window = max(1, min(height, width))
+    rows = height - window + 1
+    total = rows * (width - window + 1)
+    acc = 0.0
+    step = max(1, strip_rows)
+    for top in range(0, rows, step):
+        x = ref[top:top + step + window - 1]
+        y = test[top:top + step + window - 1]
+        mx, my = _box(x, window), _box(y, window)
+        sxx = _box(x * x, window) - mx * mx
+        syy = _box(y * y, window) - my * my
+        sxy = _box(x * y, window) - mx * my
+        score = ((2 * mx * my + _C1) * (2 * sxy + _C2)) / ((mx * mx + my * my + _C1) * (sxx + syy + _C2))
+        acc += float(score.sum())
+        done = (top + score.shape[0]) * score.shape[1]
+        if target is not None and (acc + (total - done)) / total < target:
+            return (acc + (total - done)) / total
+    return acc / total
+
+
+def _decoded_luma(data):
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as decoded:
+        return luma(decoded)
+
+
+def encode_to_ssim(image, job, target_ssim=None, max_full=4):
+    """搜索 SSIM 不低于目标的最低质量并编码
+
+    先在代理图上二分得到起点(同类图片上次的结果作为第一个试探点，并加上同类图片
+    完整图相对代理图的质量偏移)，再在完整图上以逐次减半的步长校正，完整编码+解码+SSIM 最多 max_full 次。
+    返回 (质量, 编码结果 bytes, SSIM, 是否达到目标)；均未达到时返回质量最高的一次。
+    """
+    target_ssim = target_ssim or job.target_ssim
+    lo, hi = QUALITY_RANGE[job.img_format.lower()]
+    key = content_class(image, job)
+    guess, offset = _ssim_cache.get(key, (None, 0))
+    proxy, _ = make_proxy(image)
+    proxy_ref = luma(proxy)
+
+    # 代理图上二分：满足目标的最低质量
+    start, a, b = hi, lo, hi
+    probe = guess if guess is not None and lo <= guess <= hi else (lo + hi) // 2
+    while a <= b:
+        if ssim(proxy_ref, _decoded_luma(encode_bytes(proxy, job, probe)), target_ssim) >= target_ssim:
+            start, b = probe, probe - 1
+        else:
+            a = probe + 1
+        probe = (a + b) // 2
+
+    ref = luma(image) if proxy is not image else proxy_ref
+    passed = None  # 达到目标的最低质量 (质量, 数据, SSIM)
+    failed = None  # 未达到目标的最高质量
+    q, step = min(max(start + offset, lo), hi), 8
+    for _ in range(max(1, max_full)):
+        data = encode_bytes(image, job, q)
+        score = ssim(ref, _decoded_luma(data), target_ssim)
+        if score >= target_ssim:
+            passed = (q, data, score)
+            hi = q - 1
+            q -= step
+        else:
+            if failed is None or q > failed[0]:
+                failed = (q, data, score)
+            lo = q + 1
+            q += step
+        if lo > hi:
+            break
+        q = min(max(q, lo), hi)
+        step = max(1, step // 2)
+
+    quality, data, score = passed or failed
+    _ssim_cache[key] = (quality, quality - start)
+    return quality, data, score, passed is not None
+
+
+def search_encode(image, job):
+    """目标体积/感知质量模式编码，返回 (编码结果 bytes, 日志附注)；同时设置时以感知质量为准"""
+    if job.target_ssim:
+        quality, data, score, met = encode_to_ssim(image, job)
+        return data, (f" 质量 {quality} SSIM {score:.4f} {len(data) / 1024:.0f} KB"
+                      + ('' if met else '(未达到目标 SSIM)'))
+    quality, data, met = encode_to_size(image, job)
+    return data, f" 质量 {quality} {len(data) / 1024:.0f} KB" + ('' if met else '(超过目标体积)')
@@ -0,0 +1,423 @@
+"""常驻转换服务：本地 HTTP 接口 + 预热的工作进程池
+
+用法: python convert_server.py [--port 8765] [--workers N] [--backend process] [--max-pending 256]
+
+只监听 127.0.0.1，文件路径为本机路径。每次启动生成随机令牌并写入 TOKEN_NAME(仅当前用户可读)，
+POST 请求须带 X-Convert-Token 头，网页等其他本机程序无法冒用接口。接口:
+  POST /convert  Content-Type: application/json
+                 {"files": [...], "job": {编码参数}, "output_paths": [...](可选)}
+                 一个请求可携带一批文件；返回每个文件的结果、转换耗时和总延迟
+  POST /encode   请求体为图片字节，X-Convert-Job 头为 job 的 JSON，响应体为编码结果(不落盘)
+job 只接受 JOB_FIELDS 中的编码参数，不接受删除原文件；输出位置由 output_paths 指定(默认在原文件目录)。
+  GET  /stats    累计请求数/文件数/失败数/拒绝数和延迟分位数
+  GET  /health   存活检查
+命令行加 --server http://127.0.0.1:8765 即把转换交给本服务，省去每次启动解释器、加载插件、创建进程池。
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import secrets
+import logging
+import argparse
+import threading
+import collections
+import multiprocessing
+from concurrent.futures import CancelledError
+from dataclasses import asdict, replace
+
+import convert_pool
+import convert_engine
+from convert_engine import ConvertJob, get_output_path
+from convert_targets import check_targets, parse_target
+from convert_animation import frame_workers_for
+from file_discovery import iter_image_files, IMAGE_EXTS
+
+DEFAULT_PORT = 8765
+DEFAULT_URL = f"http://127.0.0.1:{DEFAULT_PORT}"
+# 令牌文件(程序同目录)，服务启动时写入，退出时删除
+TOKEN_NAME = "convert_server.token"
+TOKEN_HEADER = "X-Convert-Token"
+
+# 请求可指定的 ConvertJob 字段：只有编码参数和保留修改时间；
+# 输出目录由客户端换算为 output_paths，删除原文件、指标、写出阶段等批处理选项不经服务设置
+JOB_FIELDS = ('img_format', 'quality', 'compress', 'height', 'width', 'adjust_height', 'adjust_width',
+              'sharpness', 'preserve_metadata', 'method', 'speed', 'preserve_alpha', 'lossless', 'subsample',
+              'resample', 'fast_downscale', 'extra_targets', 'target_bytes', 'target_ssim', 'passthrough',
+              'tile_pixels', 'max_pixels')
+
+log = logging.getLogger(__name__)
+
+
+def default_token_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), TOKEN_NAME)
+
+
+def write_token(path):
+    """生成本次启动的令牌，写入仅当前用户可读写的文件"""
+    token = secrets.token_urlsafe(32)
+    if os.path.exists(path):
+        os.unlink(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token)
+    return token
+
+
+def read_token(path=None):
+    """读取服务令牌，服务未启动(文件不存在)时抛出 RuntimeError"""
+    path = path or default_token_path()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError as e:
+        raise RuntimeError(f"无法读取转换服务令牌 {path}(服务是否已启动？): {e}")
+
+
+def target_from_dict(data):
+    """请求中的一个附加输出转为 parse_target 的结构：字段不全的按默认值补齐，
+    后缀不能含路径分隔符，子目录只能是输出目录下的相对路径"""
+    if not isinstance(data, dict) or not isinstance(data.get('format'), str):
+        raise ValueError("附加输出应为含 format 的对象")
+    target = parse_target(data['format'])
+    unknown = set(data) - set(target)
+    if unknown:
+        raise ValueError(f"附加输出参数无效: {', '.join(sorted(unknown))}")
+    target.update(data)
+    suffix, subdir = str(target['suffix']), str(target['subdir'])
+    parts = subdir.replace('\\', '/').split('/')
+    if ('/' in suffix or '\\' in suffix or os.path.isabs(subdir) or os.path.splitdrive(subdir)[0]
+            or '..' in parts):
+        raise ValueError(f"附加输出 {target['format']} 的 suffix/dir 不能指向输出目录之外")
+    return target
+
+
+def job_from_dict(data):
+    """请求中的 job 字段转为 ConvertJob 并检查附加输出，含不接受的参数时抛出 ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError("job 应为对象")
+    if 'delete_original' in data:
+        raise ValueError("服务不接受删除原文件(delete_original)")
+    unknown = set(data) - set(JOB_FIELDS)
+    if unknown:
+        raise ValueError(f"不接受的参数: {', '.join(sorted(unknown))}")
+    job = ConvertJob(**data)
+    job.extra_targets = [target_from_dict(t) for t in job.extra_targets or []]
+    check_targets(job.img_format, job.extra_targets)
+    return job
+
+
+def job_to_dict(job):
+    """客户端：ConvertJob 转为请求中的 job 字段(只含 JOB_FIELDS)"""
+    if job.delete_original:
+        raise ValueError("常驻服务模式不支持删除原文件")
+    data = asdict(job)
+    return {name: data[name] for name in JOB_FIELDS}
+
+
+class ConvertService:
+    """持有预热的执行器，负责准入(背压)和延迟统计
+
+    在途文件数不超过 max_pending，超出时请求线程最多等待 queue_timeout 秒，
+    仍无空位的文件直接返回“服务繁忙”，全部被拒时接口返回 503。
+    """
+
+    def __init__(self, workers, backend="process", max_pending=256, queue_timeout=30.0):
+        self.workers = max(1, workers)
+        self.backend = backend
+        self.executor = convert_pool.create_executor(backend, self.workers, low_priority=False)
+        self.slots = threading.BoundedSemaphore(max(1, max_pending))
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._futures = set()  # 未完成的任务，关闭时取消排队中的(Python 3.8 的 shutdown 没有 cancel_futures)
+        self.latencies = collections.deque(maxlen=1000)  # 最近的单文件延迟(毫秒)
+        self.counters = dict(requests=0, files=0, failed=0, rejected=0)
+        # 预热：让工作进程提前启动并导入 Pillow/AVIF 插件，首个请求不再付出这部分开销
+        warm = [self.executor.submit(convert_engine.warm_up) for _ in range(self.workers)]
+        pids = {f.result() for f in warm}
+        log.info(f"已预热 {len(pids)} 个工作{'进程' if backend == 'process' else '线程'}")
+
+    def _submit(self, fn, *args):
+        future = self.executor.submit(fn, *args)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def convert(self, files, job, output_paths=None):
+        """转换一批文件，返回 dict(results, completed, failed, rejected, latency_ms)"""
+        job = replace(job, frame_workers=frame_workers_for(self.workers))
+        start = time.perf_counter()
+        results = [None] * len(files)
+        done_at = {}
+        pending = []
+
+        def on_done(idx):
+            def callback(_future):
+                done_at[idx] = time.perf_counter()
+                self.slots.release()
+            return callback
+
+        for idx, file in enumerate(files):
+            if not self.slots.acquire(timeout=self.queue_timeout):
+                results[idx] = dict(file=file, ok=False, logs=["服务繁忙，请稍后重试"], rejected=True)
+                continue
+            extra = dict(output_path=output_paths[idx]) if output_paths else None
+            submitted = time.perf_counter()
+            future = self._submit(convert_engine.file_task, idx, file, job, extra)
+            future.add_done_callback(on_done(idx))
+            pending.append((idx, file, submitted, future))
+
+        for idx, file, submitted, future in pending:
+            try:
+                ok, _, _, logs, elapsed, _, _ = future.result()
+            except CancelledError:
+                ok, logs, elapsed = False, [f"转换 {file} 失败。错误原因: 服务正在关闭，任务已取消"], 0.0
+            except Exception as e:  # 工作进程崩溃等
+                ok, logs, elapsed = False, [f"转换 {file} 失败。错误原因: {e}"], 0.0
+            results[idx] = dict(file=file, ok=ok is True, logs=logs, convert_ms=elapsed * 1000,
+                                latency_ms=(done_at.get(idx, time.perf_counter()) - submitted) * 1000)
+
+        completed = sum(1 for r in results if r['ok'])
+        rejected = sum(1 for r in results if r.get('rejected'))
+        with self._lock:
+            self.counters['requests'] += 1
+            self.counters['files'] += len(files)
+            self.counters['failed'] += len(files) - completed - rejected
+            self.counters['rejected'] += rejected
+            self.latencies.extend(r['latency_ms'] for r in results if 'latency_ms' in r)
+        return dict(results=results, completed=completed, failed=len(files) - completed - rejected,
+                    rejected=rejected, latency_ms=(time.perf_counter() - start) * 1000)
+
+    def encode(self, data, job):
+        """内存转换一张图(请求体 -> 编码结果)，无空位时抛出 TimeoutError"""
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.counters['rejected'] += 1
+            raise TimeoutError("服务繁忙，请稍后重试")
+        start = time.perf_counter()
+        ok = False
+        job = replace(job, frame_workers=frame_workers_for(self.workers))
+        try:
+            result = self._submit(convert_engine.convert_bytes, data, job).result()
+            ok = True
+            return result
+        finally:
+            self.slots.release()
+            with self._lock:
+                self.counters['requests'] += 1
+                self.counters['files'] += 1
+                self.counters['failed'] += not ok
+                self.latencies.append((time.perf_counter() - start) * 1000)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            counters = dict(self.counters)
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else None
+
+        return dict(counters, workers=self.workers, backend=self.backend,
+                    p50_ms=pct(0.5), p95_ms=pct(0.95), max_ms=latencies[-1] if latencies else None)
+
+    def close(self):
+        with self._lock:
+            pending = list(self._futures)
+        for future in pending:
+            future.cancel()  # 只能取消尚未开始的任务，运行中的等待完成
+        self.executor.shutdown(wait=True)
+
+
+def serve(service, token, port=DEFAULT_PORT, host="127.0.0.1"):
+    """启动 HTTP 服务(阻塞直到 Ctrl+C)，POST 请求须带 token"""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            if code == 503:
+                self.send_header('Retry-After', '1')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send(200, dict(ok=True))
+            elif self.path == '/stats':
+                self._send(200, service.stats())
+            else:
+                self._send(404, dict(error="未知接口"))
+
+        def _authorized(self):
+            """校验令牌；失败时已发送 403"""
+            if hmac.compare_digest(self.headers.get(TOKEN_HEADER, '').encode('utf-8'), token.encode('utf-8')):
+                return True
+            self._send(403, dict(error=f"缺少或错误的 {TOKEN_HEADER}"))
+            return False
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            if self.path == '/encode':
+                self._encode()
+                return
+            if self.path != '/convert':
+                self._send(404, dict(error="未知接口"))
+                return
+            if self.headers.get_content_type() != 'application/json':
+                self._send(415, dict(error="请求体须为 application/json"))
+                return
+            try:
+                data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                files = [str(f) for f in data.get('files', [])]
+                job = job_from_dict(data.get('job', {}))
+                output_paths = data.get('output_paths')
+                if output_paths is not None and len(output_paths) != len(files):
+                    raise ValueError("output_paths 与 files 数量不一致")
+            except (ValueError, TypeError, AttributeError) as e:
+                self._send(400, dict(error=f"请求无效: {e}"))
+                return
+            result = service.convert(files, job, output_paths)
+            log.info(f"请求 {len(files)} 个文件：成功 {result['completed']} 失败 {result['failed']} "
+                     f"拒绝 {result['rejected']}，用时 {result['latency_ms']:.0f} ms")
+            self._send(503 if files and result['rejected'] == len(files) else 200, result)
+
+        def _encode(self):
+            try:
+                job = job_from_dict(json.loads(self.headers.get('X-Convert-Job') or '{}'))
+                data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            except (ValueError, TypeError) as e:
+                self._send(400, dict(error=f"请求无效: {e}"))
+                return
+            try:
+                body = service.encode(data, job)
+            except TimeoutError as e:
+                self._send(503, dict(error=str(e)))
+                return
+            except Exception as e:
+                self._send(422, dict(error=f"转换失败: {e}"))
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', f"image/{'jpeg' if job.img_format == 'jpg' else job.img_format}")
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            log.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    log.info(f"转换服务已启动: http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        log.info("转换服务已停止")
+
+
+def submit(url, files, job, output_paths=None, retries=3, timeout=None, token=None):
+    """把一批文件提交给常驻服务，返回服务端结果 dict；服务繁忙(503)时稍后重试
+
+    token 默认读取服务写入的令牌文件(见 read_token)。
+    """
+    import http.client
+    from urllib.parse import urlsplit
+    parts = urlsplit(url if '://' in url else f"http://{url}")
+    headers = {'Content-Type': 'application/json', TOKEN_HEADER: token or read_token()}
+    body = json.dumps(dict(files=list(files), job=job_to_dict(job), output_paths=output_paths),
+                      ensure_ascii=False).encode('utf-8')
+    for attempt in range(retries):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or DEFAULT_PORT, timeout=timeout)
+        try:
+            conn.request('POST', '/convert', body, headers)
+            response = conn.getresponse()
+            result = json.loads(response.read() or b'{}')
+        finally:
+            conn.close()
+        if response.status == 503 and attempt < retries - 1:
+            time.sleep(float(response.getheader('Retry-After', 1)))
+            continue
+        if response.status not in (200, 503):
+            raise RuntimeError(result.get('error', f"HTTP {response.status}"))
+        return result
+
+
+def run_remote(url, input_files, job, log, exts=IMAGE_EXTS, batch_size=64, token=None):
+    """命令行客户端：遍历输入，按批提交给常驻服务，返回与 run_batch 相同结构的统计
+
+    输出目录在客户端换算为每个文件的输出路径；token 为 None 时读取令牌文件。
+    """
+    stats = dict(completed=0, failed=0, skipped=0, discovered=0, stopped=False, wall_time=0.0)
+    start = time.perf_counter()
+    token = token or read_token()
+    latencies = []
+    batch = []
+
+    def flush():
+        output_paths = [str(get_output_path(file, job.output_dir, job.img_format)) for file in batch]
+        result = submit(url, batch, job, output_paths, token=token)
+        for item in result['results']:
+            for msg in item['logs']:
+                log.info(msg)
+            if item['ok']:
+                stats['completed'] += 1
+                latencies.append(item['latency_ms'])
+            else:
+                stats['failed'] += 1
+        batch.clear()
+
+    # 服务端与客户端工作目录不同，统一用绝对路径
+    for file in iter_image_files(input_files, exts):
+        stats['discovered'] += 1
+        batch.append(os.path.abspath(file))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    stats['wall_time'] = time.perf_counter() - start
+    if latencies:
+        latencies.sort()
+        log.info(f"服务端单文件延迟：中位 {latencies[len(latencies) // 2]:.0f} ms，"
+                 f"最大 {latencies[-1]:.0f} ms，总耗时 {stats['wall_time']:.1f}s")
+    return stats
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包为exe后进程池需要
+    parser = argparse.ArgumentParser(description="常驻图片转换服务(本地 HTTP)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"监听端口，默认 {DEFAULT_PORT}")
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count() or 1,
+                        help="工作进程数，默认等于 CPU 核心数")
+    parser.add_argument("--backend", default="process", choices=convert_pool.BACKENDS,
+                        help="并发后端：process 进程池(默认)，thread 线程池")
+    parser.add_argument("--max-pending", type=int, default=256,
+                        help="在途文件数上限(背压)，超出时请求等待，默认 256")
+    parser.add_argument("--queue-timeout", type=float, default=30.0,
+                        help="在途已满时单个文件最多等待秒数，超时返回服务繁忙，默认 30")
+    parser.add_argument("--token-file", default=default_token_path(),
+                        help=f"本次启动的访问令牌写入的文件，默认程序同目录的 {TOKEN_NAME}")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', stream=sys.stdout)
+    convert_pool.set_low_priority()
+    service = ConvertService(args.workers, args.backend, args.max_pending, args.queue_timeout)
+    try:
+        serve(service, write_token(args.token_file), args.port)
+    finally:
+        service.close()
+        try:
+            os.unlink(args.token_file)
+        except OSError:
+            pass
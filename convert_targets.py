@@ -0,0 +1,227 @@
+import io
+from pathlib import Path
+
+from resize_plan import calc_target_size
+
+# Pillow 及编解码插件均在首次用到时才导入，命令行 --help、GUI 窗口显示不必等待其加载
+
+# 各格式默认质量(png 为压缩等级)
+DEFAULT_QUALITY = {'jpg': 90, 'jpeg': 90, 'png': 6, 'webp': 80, 'avif': 63}
+
+# 输出格式对应的 Pillow 编码器名
+PIL_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP', 'avif': 'AVIF'}
+
+# 可选重采样算法(对应 PIL.Image 上的同名常量)
+RESAMPLE_NAMES = ("LANCZOS", "BICUBIC", "BILINEAR", "NEAREST")
+
+
+def resample_filter(name):
+    """重采样算法名转为 Pillow 常量，未知名称使用 LANCZOS"""
+    from PIL import Image
+    return getattr(Image, name if name in RESAMPLE_NAMES else "LANCZOS")
+
+
+def load_codec(img_format):
+    """按需加载编解码插件：只有 AVIF 需要 pillow_avif，其他格式由 Pillow 自行注册"""
+    if img_format.lower().lstrip('.') == 'avif':
+        try:
+            import pillow_avif  # noqa: F401 注册AVIF编解码器
+        except ImportError:
+            pass
+
+
+def save_image(image, path, img_format, quality=None, compress=6, method=None, speed=None,
+               lossless=False, subsample=None, **options):
+    """按格式参数编码保存，path 可以是路径或可写的文件对象(如 BytesIO)
+
+    options 原样传给 Image.save(如动画的 save_all/append_images/duration/loop)
+    """
+    img_format = img_format.lower()
+    if img_format not in PIL_FORMATS:
+        raise ValueError(f"不支持的输出格式 {img_format}")
+    load_codec(img_format)
+    if quality is None:
+        quality = DEFAULT_QUALITY.get(img_format, 80)
+    # 文件对象没有扩展名，须显式指定编码格式
+    target = path if hasattr(path, 'write') else str(path)
+    save_kwargs = dict(options, format=PIL_FORMATS[img_format])
+    # 色彩子采样参数
+    if subsample and img_format in ["jpg", "jpeg", "avif"]:
+        save_kwargs["subsampling"] = subsample
+    if img_format == "webp":
+        # 支持无损webp
+        if lossless:
+            image.save(target, lossless=True, method=method if method is not None else 6, **save_kwargs)
+        else:
+            image.save(target, quality=quality, method=method if method is not None else 6, **save_kwargs)
+    elif img_format == "avif":
+        # 支持AVIF无损
+        if lossless:
+            image.save(target, lossless=True, speed=speed if speed is not None else 4, **save_kwargs)
+        else:
+            image.save(target, quality=quality, speed=speed if speed is not None else 4, **save_kwargs)
+    elif img_format in ["jpg", "jpeg"]:
+        image.save(target, quality=quality, **save_kwargs)
+    else:
+        image.save(target, compress_level=compress, **save_kwargs)
+
+
+def parse_target(spec):
+    """解析附加输出规格
+
+    格式: 格式[:键=值,...]，例如 "webp:q=80,h=768,suffix=_s,dir=small"
+    键: q/quality 质量(png 为压缩等级)，method，speed，h/height，w/width 缩放框，
+        suffix 文件名后缀，dir 输出子目录，subsample 色彩子采样，lossless 无损
+    """
+    fmt, _, opts = spec.strip().partition(':')
+    fmt = fmt.strip().lower()
+    if fmt not in DEFAULT_QUALITY:
+        raise ValueError(f"附加输出格式无效: {spec}")
+    target = dict(format=fmt, quality=DEFAULT_QUALITY[fmt], method=None, speed=None,
+                  height=None, width=None, suffix='', subdir='', subsample=None, lossless=False)
+    aliases = {'q': 'quality', 'h': 'height', 'w': 'width', 'dir': 'subdir'}
+    for item in filter(None, (o.strip() for o in opts.split(','))):
+        key, eq, value = item.partition('=')
+        key = aliases.get(key.strip().lower(), key.strip().lower())
+        value = value.strip()
+        if key == 'lossless':
+            target['lossless'] = not eq or value.lower() in ('1', 'true', 'yes')
+        elif key in ('quality', 'method', 'speed', 'height', 'width'):
+            try:
+                target[key] = int(value)
+            except ValueError:
+                raise ValueError(f"附加输出参数 {key} 需要整数: {spec}")
+        elif key in ('suffix', 'subdir', 'subsample'):
+            target[key] = value
+        else:
+            raise ValueError(f"附加输出参数无效 {key}: {spec}")
+    return target
+
+
+def parse_targets(text):
+    """解析以 ; 分隔的多个附加输出规格"""
+    return [parse_target(spec) for spec in text.split(';') if spec.strip()]
+
+
+def check_targets(img_format, targets):
+    """附加输出与主输出、或附加输出之间的路径相同时报错(否则后写的会覆盖先写的)
+
+    文件名按不区分大小写比较(Windows 默认文件系统不区分大小写)
+    """
+    import os
+    seen = {('.', '', img_format.lower()): "主输出"}
+    for target in targets:
+        key = (os.path.normcase(os.path.normpath(target['subdir'] or '.')).lower(),
+               target['suffix'].lower(), target['format'])
+        if key in seen:
+            raise ValueError(f"附加输出 {target['format']} 的路径与{seen[key]}相同，请设置 suffix 或 dir")
+        seen[key] = f"附加输出 {target['format']} "
+
+
+def target_output_path(file_path, output_dir, target):
+    """附加输出路径：输出目录(未指定则原目录)/子目录/原文件名+后缀.格式"""
+    file_path = Path(file_path)
+    base_dir = Path(output_dir) if output_dir else file_path.parent
+    if target['subdir']:
+        base_dir = base_dir / target['subdir']
+    return base_dir / f"{file_path.stem}{target['suffix']}.{target['format']}"
+
+
+class ResizeCache:
+    """同一源图多个输出共享的中间结果缓存
+
+    按 (尺寸, 模式) 缓存缩放/模式转换后的图像；缩小时优先从不小于目标 2 倍的
+    已缓存中间图继续缩小，而不是每次都从原图重采样。
+    """
+
+    def __init__(self, source, resample=None):
+        self.source = source
+        self.resample = resample if resample is not None else resample_filter("LANCZOS")
+        self._cache = {(source.size, source.mode): source}
+
+    def put(self, image):
+        self._cache.setdefault((image.size, image.mode), image)
+
+    def get(self, size, mode):
+        key = (size, mode)
+        if key in self._cache:
+            return self._cache[key]
+        # 选择面积最小、且两边都不小于目标 2 倍的同模式中间图作为缩放起点
+        base = self.source
+        for (cached_size, cached_mode), image in self._cache.items():
+            if (cached_mode == mode and cached_size[0] >= size[0] * 2 and cached_size[1] >= size[1] * 2
+                    and cached_size[0] * cached_size[1] < base.width * base.height):
+                base = image
+        if base.mode != mode:
+            base = self._convert(base, mode)
+        image = base if base.size == size else base.resize(size, self.resample)
+        self._cache[key] = image
+        return image
+
+    def _convert(self, image, mode):
+        key = (image.size, mode)
+        if key not in self._cache:
+            self._cache[key] = image.convert(mode)
+        return self._cache[key]
+
+
+def sharpen(image, factor):
+    """锐化，结果与 ImageEnhance.Sharpness(image).enhance(factor) 一致(取整误差不超过 1)
+
+    Sharpness 是原图与 SMOOTH 平滑图的混合 f*I + (1-f)*SMOOTH(I)，两者都是线性运算，
+    合并为一个 3x3 卷积核只需一次滤波，省去平滑副本和混合结果两次整图分配。
+    """
+    from PIL import ImageFilter
+    # SMOOTH 核为 [1 1 1; 1 5 1; 1 1 1] / 13
+    edge = (1 - factor) / 13
+    kernel = ImageFilter.Kernel((3, 3), [edge] * 4 + [factor + 5 * edge] + [edge] * 4, scale=1)
+    result = image.filter(kernel)
+    if 'A' in image.getbands():
+        # 与 ImageEnhance 一致，透明通道不参与锐化
+        result.putalpha(image.getchannel('A'))
+    return result
+
+
+def target_mode(mode, img_format, preserve_alpha):
+    """输出格式所需的模式：JPG 去透明转 RGB，未勾选保留透明时去掉透明通道"""
+    if img_format in ("jpg", "jpeg") and mode != 'RGB':
+        return 'RGB'
+    if not preserve_alpha and mode in ('RGBA', 'LA'):
+        return 'RGB'
+    return mode
+
+
+def render_targets(cache, file_path, output_dir, targets, sharpness=1.0, preserve_alpha=False, writes=None):
+    """由同一份解码结果生成所有附加输出，返回 [(输出路径, 是否成功, 日志)]
+
+    writes 为列表时只编码到内存，(输出路径, bytes) 追加到 writes 交给写出阶段(见 convert_writer)
+    """
+    results = []
+    source = cache.source
+    sharpened = {}
+    for target in targets:
+        try:
+            size = calc_target_size(source.width, source.height,
+                                    target['height'] or 0, target['width'] or 0,
+                                    target['height'] is not None, target['width'] is not None)
+            size = size or source.size
+            mode = target_mode(source.mode, target['format'], preserve_alpha)
+            image = cache.get(size, mode)
+            if sharpness != 1.0:
+                # 锐化结果同样按 (尺寸, 模式) 共享
+                if (size, mode) not in sharpened:
+                    sharpened[(size, mode)] = sharpen(image, sharpness)
+                image = sharpened[(size, mode)]
+            path = target_output_path(file_path, output_dir, target)
+            if writes is None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+            buf = io.BytesIO() if writes is not None else path
+            save_image(image, buf, target['format'], quality=target['quality'],
+                       compress=min(target['quality'], 9), method=target['method'],
+                       speed=target['speed'], lossless=target['lossless'], subsample=target['subsample'])
+            if writes is not None:
+                writes.append((path, buf.getvalue()))
+            results.append((path, True, f"{path.name:<50} 成功转为{target['format']}"))
+        except Exception as e:
+            results.append((None, False, f"附加输出 {target['format']} 失败。错误原因: {e}"))
+    return results
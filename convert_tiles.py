@@ -0,0 +1,248 @@
+import math
+import zlib
+import struct
+import threading
+from contextlib import contextmanager
+
+# Pillow 在首次用到时才导入(见 convert_targets)
+
+# 分条解码时每条的源图行数
+TILE_ROWS = 256
+
+# 可分条解码的 PNG 原始格式(8 位、每像素整字节)及每像素字节数；其余 PNG(16 位、1/2/4 位、隔行扫描)整图解码
+_PNG_RAWMODES = {'L': 1, 'LA': 2, 'RGB': 3, 'RGBA': 4, 'P': 1}
+
+# 未指定像素上限时的默认上限，与 Pillow 报 DecompressionBombError 的阈值(2 × MAX_IMAGE_PIXELS 默认值)相同
+DEFAULT_MAX_PIXELS = 2 * 89478485
+
+# 重采样滤波器的支撑半径(源像素，按缩小倍数放大)，与 Pillow Resample.c 一致
+_SUPPORT = {'NEAREST': 0.5, 'BOX': 0.5, 'BILINEAR': 1.0, 'HAMMING': 1.0, 'BICUBIC': 2.0, 'LANCZOS': 3.0}
+
+
+_unlimited = threading.local()
+_hook_lock = threading.Lock()
+
+
+def _install_check_hook():
+    """把 Pillow 的解压炸弹检查换成按线程判断的包装(只装一次)
+
+    Pillow 的检查读取全局 Image.MAX_IMAGE_PIXELS，没有按次关闭的参数，修改全局值会影响其他线程
+    同时打开的图像；包装后只有处于 pillow_unlimited() 中的线程跳过检查，其余线程照常检查。
+    Pillow 没有该函数时不安装，超大图仍按 Pillow 默认报错。
+    """
+    from PIL import Image
+    with _hook_lock:
+        check = getattr(Image, '_decompression_bomb_check', None)
+        if check is None or getattr(check, 'per_thread', False):
+            return
+
+        def per_thread_check(size):
+            if not getattr(_unlimited, 'active', False):
+                check(size)
+
+        per_thread_check.per_thread = True
+        Image._decompression_bomb_check = per_thread_check
+
+
+@contextmanager
+def pillow_unlimited():
+    """当前线程内跳过 Pillow 的解压炸弹检查(打开文件头、超大动画切换帧)，其他线程不受影响"""
+    _install_check_hook()
+    saved = getattr(_unlimited, 'active', False)
+    _unlimited.active = True
+    try:
+        yield
+    finally:
+        _unlimited.active = saved
+
+
+def open_header(fp):
+    """打开图像只读文件头，不做 Pillow 的像素数检查(预扫描、内存预算估算、文件列表也能读出超大图的尺寸)"""
+    from PIL import Image
+    with pillow_unlimited():
+        return Image.open(fp)
+
+
+def _check_pixels(image, limit):
+    if limit and image.width * image.height > limit:
+        image.close()
+        raise ValueError(f"图像 {image.width}×{image.height} 超过像素上限 {limit / 1e6:.0f} MP")
+    return image
+
+
+def open_limited(fp, max_pixels=None):
+    """打开图像(只读文件头)，以 max_pixels 代替 Pillow 的解压炸弹保护
+
+    max_pixels 为 0 不限制，None 为 Pillow 默认的约 1.79 亿像素；超过上限时抛出 ValueError。
+    """
+    return _check_pixels(open_header(fp), DEFAULT_MAX_PIXELS if max_pixels is None else max_pixels)
+
+
+def open_image(fp, job):
+    """按 job.max_pixels 打开待转换的图像，见 open_limited
+
+    未指定上限时，分条处理后峰值内存只与输出尺寸和源图宽度相关的图像(分条解码的 PNG、缩小解码的 JPEG)
+    不受默认上限限制，其余图像仍按默认上限检查。
+    """
+    if job.max_pixels is not None:
+        return open_limited(fp, job.max_pixels)
+    image = open_header(fp)
+    if image.width * image.height > DEFAULT_MAX_PIXELS and tiles_bound_memory(image, job):
+        return image
+    return _check_pixels(image, DEFAULT_MAX_PIXELS)
+
+
+def tiles_bound_memory(image, job):
+    """该图像是否会按分条模式处理且不整图解码"""
+    from resize_plan import calc_target_size
+    target_size = calc_target_size(image.width, image.height, job.height, job.width,
+                                   job.adjust_height, job.adjust_width)
+    return use_tiles(image, job, target_size) and (image.format == 'JPEG' or bool(strip_decodable(image)))
+
+
+def use_tiles(image, job, target_size):
+    """是否按分条模式处理：源图超过 job.tile_pixels 且需要缩小(附加输出共用整图解码结果，不分条)"""
+    return bool(job.tile_pixels and target_size and not job.extra_targets
+                and image.width * image.height > job.tile_pixels)
+
+
+def strip_decodable(image):
+    """能否分条解码：非隔行扫描的 8 位 PNG 文件(JPEG 用 draft 缩小解码，无需分条)"""
+    if image.format != 'PNG' or image.info.get('interlace') or len(image.tile) != 1:
+        return False
+    name, _, _, rawmode = image.tile[0]
+    return name == 'zip' and rawmode in _PNG_RAWMODES and getattr(image, 'filename', None)
+
+
+def task_peak_bytes(src_size, mode, target_size, img_format, preserve_alpha, sharpness, tile_pixels=None):
+    """单个任务的峰值内存估算：需要缩小且超过 tile_pixels 时按分条模式估算，否则按整图估算"""
+    from resize_plan import estimate_peak_bytes
+    if tile_pixels and target_size and src_size[0] * src_size[1] > tile_pixels:
+        return tiled_peak_bytes(src_size[0], target_size)
+    return estimate_peak_bytes(src_size, mode, target_size, img_format, preserve_alpha, sharpness)
+
+
+def tiled_peak_bytes(src_width, target_size):
+    """分条模式的像素缓冲区峰值估算：一条源数据(连同解压/重新包装的缓冲区) + 窗口 + 输出图 + 编码器工作区"""
+    return src_width * TILE_ROWS * 4 * 3 + target_size[0] * target_size[1] * 4 * 3
+
+
+def _idat_chunks(fp):
+    """依次读出 PNG 的 IDAT 数据块(拼接起来即完整的 zlib 流)"""
+    fp.seek(8)
+    while True:
+        head = fp.read(8)
+        if len(head) < 8:
+            return
+        length, ctype = struct.unpack('>I4s', head)
+        if ctype == b'IDAT':
+            yield fp.read(length)
+            fp.seek(4, 1)
+        elif ctype == b'IEND':
+            return
+        else:
+            fp.seek(length + 4, 1)
+
+
+def iter_png_strips(image, rows=TILE_ROWS):
+    """按行条依次解码 PNG，产出 (起始行, 条图像)，任意时刻只持有一条
+
+    zlib 流式解压得到带过滤字节的行数据；每条之前补上一条最后一行的原始数据(过滤类型 0)，
+    以存储方式重新包装成 zlib 流交给 Pillow 的 PNG 解码器做反过滤，解码后去掉补的那一行。
+    """
+    from PIL import Image
+    mode = image.mode
+    rawmode = image.tile[0][3]
+    width, height = image.size
+    row_bytes = 1 + width * _PNG_RAWMODES[rawmode]
+    inflate = zlib.decompressobj()
+    prev_raw = None
+    with open(image.filename, 'rb') as fp:
+        chunks = _idat_chunks(fp)
+        for top in range(0, height, rows):
+            count = min(rows, height - top)
+            need = count * row_bytes
+            data = bytearray()
+            if prev_raw is not None:
+                data += b'\0' + prev_raw
+            filtered = len(data)
+            while len(data) - filtered < need:
+                chunk = inflate.unconsumed_tail or next(chunks, None)
+                if chunk is None:
+                    raise OSError("PNG 数据不完整")
+                data += inflate.decompress(chunk, need - (len(data) - filtered))
+            lines = count + (prev_raw is not None)
+            strip = Image.new(mode, (width, lines), None)
+            decoder = Image._getdecoder(mode, 'zip', rawmode)
+            decoder.setimage(strip.im, (0, 0, width, lines))
+            _, err = decoder.decode(zlib.compress(data, 0))
+            del data
+            decoder.cleanup()
+            if err < 0:
+                raise OSError(f"PNG 解码失败(错误码 {err})")
+            if mode == 'P':
+                strip.palette = image.palette.copy()
+            strip.info = dict(image.info)
+            prev_raw = strip.crop((0, lines - 1, width, lines)).tobytes('raw', rawmode)
+            if lines > count:
+                strip = strip.crop((0, 1, width, lines))
+            yield top, strip
+
+
+def resize_strips(image, target_size, mode, resample_name=None, rows=TILE_ROWS, stats=None):
+    """分条解码并缩小到 target_size(模式 mode)，结果与整图 resize 相差不超过 1 级
+
+    各段用 box 重采样时滤波器中心和权重的浮点值与整图略有不同，定点化取整后个别像素差 1；
+    RGBA/LA 的差异在预乘透明度的颜色上(透明度差不超过 1)，几乎全透明的像素还原颜色时会被放大
+    (透明度 16 时最多约 16 级)，这类像素本身不可见。
+
+    与 Pillow 相同按两遍可分离重采样：每条解码后先只做水平缩小(行之间互不影响，与整图完全一致)，
+    再按输出行分段做垂直缩小；每段所需的源行范围向上下各扩展滤波器支撑半径，用 resize 的 box 参数
+    只对这一窗口重采样。RGBA/LA 与 Pillow 一样在预乘透明度的模式下完成两遍。
+    像素缓冲区只有输出图、一条源数据和约 rows + 2×支撑半径 行已水平缩小的窗口，与源图高度无关。
+    stats 为 dict 时写入 peak_bytes：同时存活的像素缓冲区峰值。
+    """
+    from PIL import Image
+    from convert_targets import resample_filter, RESAMPLE_NAMES
+    from resize_plan import image_bytes
+    resample_name = resample_name if resample_name in RESAMPLE_NAMES else 'LANCZOS'
+    resample = resample_filter(resample_name)
+    premultiplied = {'RGBA': 'RGBa', 'LA': 'La'}.get(mode) if resample_name != 'NEAREST' else None
+    work_mode = premultiplied or mode
+    width, height = image.size
+    out_w, out_h = target_size
+    scale = height / out_h
+    margin = math.ceil(_SUPPORT[resample_name] * max(scale, 1.0)) + 2
+    band = max(1, int(rows / scale))  # 每段输出行数
+    strips = iter_png_strips(image, rows)
+    out = Image.new(work_mode, target_size, None)
+    window, window_top = None, 0  # 已水平缩小且仍需要的源行 [window_top, window_top + window.height)
+    peak = 0
+    for out_top in range(0, out_h, band):
+        out_bottom = min(out_h, out_top + band)
+        need_top = max(0, math.floor(out_top * scale) - margin)
+        need_bottom = min(height, math.ceil(out_bottom * scale) + margin)
+        # 丢弃之后不再需要的行
+        if window is not None and need_top > window_top:
+            window = window.crop((0, need_top - window_top, out_w, window.height))
+            window_top = need_top
+        while window is None or window_top + window.height < need_bottom:
+            top, strip = next(strips)
+            peak = max(peak, image_bytes(strip) * 2 + image_bytes(out) + (image_bytes(window) if window else 0))
+            if strip.mode != work_mode:
+                strip = strip.convert(mode).convert(work_mode) if premultiplied else strip.convert(mode)
+            if out_w != width:
+                strip = strip.resize((out_w, strip.height), resample)
+            if window is None:
+                window, window_top = strip, top
+                continue
+            merged = Image.new(work_mode, (out_w, window.height + strip.height), None)
+            merged.paste(window, (0, 0))
+            merged.paste(strip, (0, window.height))
+            window = merged
+        box = (0, out_top * scale - window_top, out_w, out_bottom * scale - window_top)
+        out.paste(window.resize((out_w, out_bottom - out_top), resample, box=box), (0, out_top))
+    strips.close()
+    if stats is not None:
+        stats['peak_bytes'] = peak
+    return out.convert(mode) if premultiplied else out
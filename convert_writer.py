@@ -0,0 +1,193 @@
+import os
+import time
+import queue
+import threading
+from pathlib import Path
+
+# 写出线程数：网络盘/U 盘延迟高时多个线程并行等待设备
+WRITER_THREADS = 2
+# 一批最多提交的文件数和最长等待时间(秒)；队列空闲时立即提交，只在写入跟不上时才凑批
+FSYNC_BATCH = 32
+FSYNC_INTERVAL = 0.5
+# 等待写出的文件数上限，超过时 submit 阻塞，编码随之放慢，内存中的编码结果不会无限堆积
+MAX_PENDING = 64
+
+_STOP = object()
+
+
+def temp_path(path):
+    """同目录下的隐藏临时文件名(同一文件系统，rename 为原子操作)"""
+    path = Path(path)
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def fsync_dir(directory):
+    """目录项落盘(rename 之后)，Windows 不支持打开目录，跳过"""
+    if os.name == 'nt':
+        return
+    fd = os.open(str(directory), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class OutputWriter:
+    """写出阶段：编码结果(内存中的 bytes)由专用线程写入，与编码并行
+
+    每个输出先写入同目录的临时文件，提交时批量 fsync、关闭并设置修改时间后原子重命名为最终文件名，
+    再对涉及的目录各 fsync 一次；中途停止或崩溃只会留下临时文件，不会出现看似完成的半截文件。
+    已创建的输出目录记录在集合中，每个目录只 mkdir 一次。
+    submit(token, writes, times) 提交一个源文件的全部输出，写完后 completed() 产出 (token, 错误信息或 None)。
+    """
+
+    def __init__(self, threads=WRITER_THREADS, fsync=True, batch=FSYNC_BATCH, interval=FSYNC_INTERVAL,
+                 max_pending=MAX_PENDING):
+        self.fsync = fsync
+        self.batch = max(1, batch)
+        self.interval = interval
+        self._queue = queue.Queue(maxsize=max(1, max_pending))
+        self._done = queue.SimpleQueue()
+        self._dirs = set()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._run, name=f"output-writer-{i}", daemon=True)
+                         for i in range(max(1, threads))]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, token, writes, times=None):
+        """writes: [(输出路径, bytes)]；times: (atime, mtime) 时写入后设置修改时间"""
+        self._queue.put((token, writes, times))
+
+    def completed(self):
+        """取出已写完的 (token, 错误信息或 None)，不阻塞"""
+        while True:
+            try:
+                yield self._done.get_nowait()
+            except queue.Empty:
+                return
+
+    def flush(self):
+        """等待已提交的输出全部写完(结果仍由 completed() 取出)"""
+        self._queue.join()
+
+    def close(self):
+        """等待已提交的输出全部写完，结束写出线程(可重复调用)"""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def _ensure_dir(self, directory):
+        if directory not in self._dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._dirs.add(directory)
+
+    def _stage(self, token, writes, times):
+        """写入临时文件(暂不关闭，提交时统一 fsync)
+
+        返回 [token, [(临时文件对象, 临时路径, 最终路径)], 修改时间, 错误]
+        """
+        staged = []
+        try:
+            for path, data in writes:
+                path = Path(path)
+                self._ensure_dir(path.parent)
+                tmp = temp_path(path)
+                f = open(tmp, 'wb')
+                staged.append((f, tmp, path))
+                f.write(data)
+                f.flush()
+            return [token, staged, times, None]
+        except Exception as e:
+            self._discard(staged)
+            return [token, [], None, f"写入 {path} 失败。错误原因: {e}"]
+
+    @staticmethod
+    def _discard(staged):
+        for f, tmp, _ in staged:
+            f.close()
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _rename_all(staged):
+        """临时文件逐个重命名为最终文件；中途失败时删除本次已生成的最终文件后抛出原异常
+
+        覆盖前的旧输出已被替换，无法恢复，删除可避免新旧输出混在一起被当作完整结果。
+        """
+        done = []
+        try:
+            for _, tmp, path in staged:
+                os.replace(tmp, path)
+                done.append(path)
+        except Exception:
+            for path in done:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            raise
+
+    def _commit(self, batch):
+        """批量 fsync → 关闭 → 设置修改时间 → 原子重命名 → 每个目录 fsync 一次，逐个报告结果
+
+        修改时间在关闭之后设置：Windows 关闭写过的句柄时可能再次更新修改时间。
+        一个源文件的多个输出全部就绪后才重命名；其中一个重命名失败时撤销已完成的重命名，
+        不会只留下部分输出。
+        """
+        dirs = set()
+        for entry in batch:
+            token, staged, times, error = entry
+            path = None
+            try:
+                for f, tmp, path in staged:
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                    f.close()
+                    if times is not None:
+                        os.utime(tmp, times)
+                self._rename_all(staged)
+            except Exception as e:
+                self._discard(staged)
+                entry[3] = f"写入 {path} 失败。错误原因: {e}"
+                continue
+            dirs.update(path.parent for _, _, path in staged)
+        if self.fsync:
+            for directory in dirs:
+                try:
+                    fsync_dir(directory)
+                except OSError:
+                    pass
+        for token, _, _, error in batch:
+            self._done.put((token, error))
+            self._queue.task_done()
+
+    def _run(self):
+        batch = []
+        started = 0.0
+        while True:
+            timeout = max(0.0, started + self.interval - time.monotonic()) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            if item is not None:
+                if not batch:
+                    started = time.monotonic()
+                batch.append(self._stage(*item))
+            # 队列空闲、凑满一批或等待超时时提交
+            if batch and (item is None or self._queue.empty() or len(batch) >= self.batch
+                          or time.monotonic() - started >= self.interval):
+                self._commit(batch)
+                batch = []
+        if batch:
+            self._commit(batch)
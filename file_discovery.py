@@ -0,0 +1,111 @@
+import os
+import queue
+import threading
+
+# 支持的输入文件格式
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.webp', '.avif', '.gif')
+
+_END = object()  # 遍历结束标记
+
+
+def iter_image_files(paths, exts=IMAGE_EXTS):
+    """流式产出输入路径下的图片文件(目录用 os.scandir 递归遍历，边遍历边产出)"""
+    for path in paths:
+        if os.path.isdir(path):
+            yield from _walk(path, exts)
+        elif os.path.isfile(path) and path.lower().endswith(exts):
+            yield path
+
+
+def _walk(root, exts):
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            it = os.scandir(current)
+        except OSError:
+            continue  # 无权限、网络断开等，跳过该目录
+        subdirs = []
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(exts):
+                        yield entry.path
+                except OSError:
+                    continue
+        # 逆序压栈，保证按目录顺序深度优先
+        stack.extend(reversed(subdirs))
+
+
+class FileStream:
+    """后台线程遍历输入路径，通过有界队列把文件流式交给消费者
+
+    消费者迭代本对象即可边发现边转换(界面等不能阻塞的消费者定时调用 poll())；
+    discovered 为已发现文件数，done 表示遍历已结束，exhausted 表示消费者已取完全部文件。
+    stop_event 置位或调用 close() 后遍历提前结束。
+    """
+
+    def __init__(self, paths, exts=IMAGE_EXTS, maxsize=1024, stop_event=None):
+        self.paths = list(paths)
+        self.exts = exts
+        self.stop_event = stop_event
+        self.discovered = 0
+        self.done = False
+        self.exhausted = False
+        self._closed = False
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _stopped(self):
+        return self._closed or (self.stop_event is not None and self.stop_event.is_set())
+
+    def _put(self, item):
+        # 队列满时阻塞，但定期检查停止标志，避免消费者退出后遍历线程永远挂起
+        while True:
+            try:
+                self._queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                if self._stopped():
+                    return False
+
+    def _run(self):
+        try:
+            for path in iter_image_files(self.paths, self.exts):
+                if self._stopped() or not self._put(path):
+                    break
+                self.discovered += 1
+        finally:
+            self.done = True
+            self._put(_END)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                self.exhausted = True
+                return
+            yield item
+
+    def poll(self, max_items=None):
+        """不阻塞地取出当前已发现的文件(最多 max_items 个，None 为全部)"""
+        items = []
+        while not self.exhausted and (max_items is None or len(items) < max_items):
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _END:
+                self.exhausted = True
+                break
+            items.append(item)
+        return items
+
+    def close(self):
+        self._closed = True
@@ -1,8 +1,46 @@
 import os
 import sys
+import time
+import logging
 import argparse
-from PIL import Image, ImageEnhance
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import multiprocessing
+import convert_pool
+import convert_engine
+from convert_engine import ConvertJob
+from convert_metrics import MetricsLog
+from convert_manifest import MANIFEST_NAME
+from convert_targets import parse_target, check_targets
+from convert_dedup import DEDUP_MODES
+
+def build_job(img_format="webp", quality=85, width=None, height=None, sharpness=1.0, method=6,
+              speed=4, lossless=False, subsample=None, resample=None, fast_downscale=False,
+              extra_targets=None, output_dir=None, target_bytes=None, target_ssim=None,
+              passthrough=False, tile_pixels=None, max_pixels=None):
+    """命令行参数转换为 ConvertJob(宽高按比例缩小，不放大；保留透明通道)"""
+    return ConvertJob(
+        img_format=img_format,
+        quality=quality,
+        compress=min(quality // 10, 9),
+        height=height or 0,
+        width=width or 0,
+        adjust_height=bool(height),
+        adjust_width=bool(width),
+        sharpness=sharpness,
+        output_dir=output_dir,
+        method=method,
+        speed=speed,
+        preserve_alpha=True,
+        lossless=lossless,
+        subsample=subsample,
+        resample=resample,
+        fast_downscale=fast_downscale,
+        extra_targets=list(extra_targets or []),
+        target_bytes=target_bytes,
+        target_ssim=target_ssim,
+        passthrough=passthrough,
+        tile_pixels=tile_pixels,
+        max_pixels=max_pixels,
+    )
 
 def convert_image(
     input_path,
@@ -12,67 +50,31 @@ def convert_image(
     width=None,
     height=None,
     sharpness=1.0,
-    method=6
+    method=6,
+    fast_downscale=False,
+    extra_targets=None,
+    metrics_path=None
 ):
-    try:
-        # 检查输入文件是否存在
-        if not os.path.exists(input_path):
-            raise FileNotFoundError(f"输入文件 {input_path} 不存在")
-
-        img = Image.open(input_path)
-        
-        # 调整大小（保持比例）
-        if width or height:
-            orig_width, orig_height = img.size
-            if not width: width = orig_width
-            if not height: height = orig_height
-            ratio = min(width/orig_width, height/orig_height)
-            new_size = (int(orig_width*ratio), int(orig_height*ratio))
-            img = img.resize(new_size, Image.LANCZOS)
-        
-        # 处理图像模式转换
-        if img.mode == 'RGBA' and img_format.lower() in ['jpg', 'jpeg']:
-            img = img.convert('RGB')
-        elif img.mode == 'P':
-            print(f"保持调色板图像原模式")
+    """转换单个文件(兼容旧接口)，转换流程见 convert_engine.process_file
 
-        # 锐化处理(跳过调色板图像)
-        if sharpness != 1.0 and img.mode != 'P':
-            enhancer = ImageEnhance.Sharpness(img)
-            img = enhancer.enhance(sharpness)
-        
-        # 确定输出路径
-        if not output_path:
-            # 规范化输入路径的目录和文件名
-            input_dir, input_filename = os.path.split(input_path)
-            input_base = os.path.splitext(input_filename)[0]
-            # 如果输入目录为空，使用当前工作目录
-            output_dir = os.path.normpath(input_dir) if input_dir else os.getcwd()
-            output_path = os.path.join(output_dir, f"{input_base}.{img_format}")
-        
-        # 确保输出目录存在
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # 保存参数
-        save_args = {}
-        if img_format == "webp":
-            save_args.update({
-                "quality": quality,
-                "method": method
-            })
-        elif img_format in ["jpg", "jpeg"]:
-            save_args["quality"] = quality
-        elif img_format == "png":
-            save_args["compress_level"] = min(quality//10, 9)
-        
-        img.save(output_path, **save_args)
-        return {
-            'success': True,
-            'mode': img.mode
-        }
-    except Exception as e:
-        print(f"Error converting {input_path}: {str(e)}", file=sys.stderr)
+    metrics_path: 指标日志路径(.csv 为 CSV，否则 JSON lines)，给出时追加一行分阶段耗时，
+    并在返回值中附带 metrics
+    """
+    if not os.path.exists(input_path):
+        print(f"Error converting {input_path}: 输入文件 {input_path} 不存在", file=sys.stderr)
         return {'success': False}
+    job = build_job(img_format, quality, width, height, sharpness, method,
+                    fast_downscale=fast_downscale, extra_targets=extra_targets)
+    metrics = {} if metrics_path else None
+    start = time.perf_counter()
+    ok, logs = convert_engine.process_file(input_path, job, output_path=output_path, metrics=metrics)
+    if not ok:
+        print(f"Error converting {input_path}: {logs[-1] if logs else '未知错误'}", file=sys.stderr)
+    if metrics is None:
+        return {'success': ok, 'logs': logs}
+    with MetricsLog(metrics_path) as metrics_log:
+        metrics_log.record(input_path, ok, time.perf_counter() - start, metrics)
+    return {'success': ok, 'logs': logs, 'metrics': metrics}
 
 def expand_input_paths(inputs):
     """递归解析输入路径，支持文件列表和嵌套路径"""
@@ -93,110 +95,130 @@ def expand_input_paths(inputs):
             expanded_paths.append(os.path.normpath(path))  # 处理普通路径
     return expanded_paths
 
-def set_low_priority():
-    """将进程/线程优先级设置为较低"""
-    try:
-        if sys.platform.startswith('win'):
-            import psutil
-            p = psutil.Process(os.getpid())
-            p.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
-        else:
-            os.nice(10)
-    except Exception as e:
-        print(f"警告：无法设置低优先级: {e}", file=sys.stderr)
-
-def process_single_image(i, input_file, total, args):
-    set_low_priority()
-    try:
-        input_path = os.path.abspath(input_file)
-        if not os.path.exists(input_path):
-            raise FileNotFoundError(f"输入文件 {input_path} 不存在")
-
-        if args.output:
-            output_dir = os.path.abspath(args.output)
-            filename = f"{os.path.splitext(os.path.basename(input_file))[0]}.{args.format}"
-            output_file = os.path.join(output_dir, filename)
-        else:
-            output_dir = os.path.dirname(input_path) or os.getcwd()
-            filename = f"{os.path.splitext(os.path.basename(input_file))[0]}.{args.format}"
-            output_file = os.path.join(output_dir, filename)
-
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-
-        print(f"[{i}/{total}] {os.path.basename(input_file)} → {os.path.basename(output_file)}")
-
-        result = convert_image(
-            input_path,
-            output_file,
-            args.format,
-            args.quality,
-            args.width,
-            args.height,
-            args.sharpness,
-            args.method
-        )
-        return (input_file, result)
-    except Exception as e:
-        print(f"严重异常：{str(e)}")
-        return (input_file, {'success': False, 'error': str(e)})
-
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包为exe后进程池需要
     parser = argparse.ArgumentParser(description="CLI Image Converter (支持多文件/目录)")
     parser.add_argument("-i", "--input", nargs='+', required=True,
                        help="输入文件、目录或文件列表（支持 @list.txt 格式）")
     parser.add_argument("-o", "--output", help="输出目录")
     parser.add_argument("-f", "--format", default="webp", 
-                       choices=["webp", "jpg", "png", "jpeg"])
+                       choices=["webp", "jpg", "png", "jpeg", "avif"])
     parser.add_argument("-q", "--quality", type=int, default=80)
-    parser.add_argument("-W", "--width", type=int, help="调整宽度（保持比例）")
-    parser.add_argument("-H", "--height", type=int, help="调整高度（保持比例）")
+    parser.add_argument("-W", "--width", type=int, help="限制最大宽度（保持比例，不放大）")
+    parser.add_argument("-H", "--height", type=int, help="限制最大高度（保持比例，不放大）")
     parser.add_argument("-s", "--sharpness", type=float, default=1.0,
                        help="锐化强度（默认 1.0，<1.0 模糊，>1.0 锐化，建议 0.5-2.0）")
     parser.add_argument("-m", "--method", type=int, default=6,
                        help="WebP压缩等级 1-6 默认6 越大压缩越慢越优 原值默认4")
+    parser.add_argument("--speed", type=int, default=4,
+                       help="AVIF编码速度 0-10 默认4 越小压缩越慢越优")
+    parser.add_argument("--target-size", type=int, metavar="KB",
+                       help="目标体积(KB)：AVIF/WebP/JPG 按图搜索不超过该体积的最高质量(-q 不再使用)")
+    parser.add_argument("--target-ssim", type=float, metavar="SSIM",
+                       help="目标 SSIM(如 0.97)：AVIF/WebP/JPG 按图搜索亮度 SSIM 不低于该值的最低质量，需要 numpy，优先于 --target-size")
+    parser.add_argument("--lossless", action="store_true", help="WebP/AVIF 无损")
+    parser.add_argument("--passthrough", action="store_true",
+                       help="源文件已是目标格式且无需缩放/锐化/模式转换时直接复制，不重新编码")
+    parser.add_argument("--subsample", choices=["4:2:0", "4:2:2", "4:4:4"],
+                       help="JPG/AVIF 色彩子采样，默认由编码器决定")
+    parser.add_argument("--resample", default="LANCZOS", choices=["LANCZOS", "BICUBIC", "BILINEAR", "NEAREST"],
+                       help="缩放重采样算法，默认 LANCZOS")
+    parser.add_argument("--fast-downscale", action="store_true",
+                       help="快速缩小：JPEG 缩小解码(draft)，其他格式先整数倍缩小再重采样")
+    parser.add_argument("--target", action="append", type=parse_target, default=[],
+                       help="附加输出(可重复)，每个源文件只解码一次，如 avif:q=60,speed=4,h=768,suffix=_s,dir=small")
     parser.add_argument("--workers", "-w", type=int, default=2,
                        help="并发线程数，默认2")
+    parser.add_argument("--backend", default="thread", choices=convert_pool.BACKENDS,
+                       help="并发后端：thread 线程池(默认)，process 进程池(绕开GIL，多核满载)")
+    parser.add_argument("--incremental", action="store_true",
+                       help="增量转换：跳过源文件和参数都未变化、输出已存在的文件")
+    parser.add_argument("--manifest", default=os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), MANIFEST_NAME),
+                       help="增量转换清单路径(SQLite)，默认与脚本同目录；预扫描用的吞吐量记录也保存在该目录")
+    parser.add_argument("--hash", action="store_true",
+                       help="增量转换时修改时间变化则比较内容哈希，内容未变仍跳过")
+    parser.add_argument("--schedule", default="stream", choices=convert_pool.SCHEDULES,
+                       help="调度策略：stream 边遍历边转换(默认)，largest 读取文件头后大文件优先")
+    parser.add_argument("--tile-above", type=float, metavar="MP",
+                       help="分条处理：源图超过该像素数(百万)且需要缩小时，PNG 分条解码并缩小，JPEG 缩小解码，内存只与输出大小相关")
+    parser.add_argument("--max-pixels", type=float, metavar="MP",
+                       help="源图像素上限(百万)，代替 Pillow 默认的约 179 MP 保护；0 不限制")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                       help="内存预算(MB)：按文件头估算每个任务的峰值内存，同时转换的任务总和不超过预算")
+    parser.add_argument("--metrics", metavar="PATH",
+                       help="指标日志：记录每个文件的分阶段耗时和输入/输出字节数(.csv 为 CSV，否则 JSON lines)，结束时输出汇总")
+    parser.add_argument("--metrics-top", type=int, default=10,
+                       help="汇总中列出最慢的文件数，默认 10")
+    parser.add_argument("--dedup", choices=DEDUP_MODES,
+                       help="内容去重：bytes 按文件内容，pixels 按解码后的像素；相同内容只编码一次，其余复制输出")
+    parser.add_argument("--dedup-cache", metavar="DIR",
+                       help="去重缓存目录：保存编码结果，之后的批次遇到相同内容直接复用(未指定 --dedup 时按 bytes)")
+    parser.add_argument("--sync-write", action="store_true",
+                       help="工作线程/进程直接写输出文件；默认编码到内存，由写出线程写临时文件后原子重命名")
+    parser.add_argument("--no-fsync", action="store_true",
+                       help="写出时不 fsync(更快，但断电时刚写完的输出可能丢失)")
+    parser.add_argument("--server", nargs='?', const="http://127.0.0.1:8765",
+                       help="交给常驻转换服务(convert_server.py)处理，默认 http://127.0.0.1:8765")
+    parser.add_argument("--server-token", metavar="FILE",
+                       help="常驻服务的令牌文件，默认 convert_server.py 同目录的 convert_server.token")
     
     args = parser.parse_args()
+    try:
+        check_targets(args.format, args.target)
+    except ValueError as e:
+        parser.error(str(e))
 
-    set_low_priority()
+    convert_pool.set_low_priority()
 
     # 递归解析输入路径
     expanded_inputs = expand_input_paths(args.input)
 
-    # 收集有效文件
-    inputs = []
+    # 校验输入路径，有效的文件/目录交给后台线程流式遍历，边发现边转换
+    input_exts = (".png", ".jpg", ".jpeg", ".webp", ".gif")
+    valid_inputs = []
     for path in expanded_inputs:
-        if os.path.isfile(path) and path.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
-            inputs.append(path)
-        elif os.path.isdir(path):
-            for root, _, files in os.walk(path):
-                for f in files:
-                    if f.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
-                        inputs.append(os.path.join(root, f))
+        if (os.path.isfile(path) and path.lower().endswith(input_exts)) or os.path.isdir(path):
+            valid_inputs.append(path)
         else:
             print(f"警告：跳过无效路径 {path}", file=sys.stderr)
 
-    if not inputs:
+    # 引擎日志直接输出到控制台
+    log = logging.getLogger("image_converter")
+    log.setLevel(logging.INFO)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    log.addHandler(handler)
+
+    job = build_job(args.format, args.quality, args.width, args.height, args.sharpness, args.method,
+                    args.speed, args.lossless, args.subsample, args.resample, args.fast_downscale,
+                    args.target, os.path.abspath(args.output) if args.output else None,
+                    args.target_size * 1024 if args.target_size else None, args.target_ssim,
+                    args.passthrough,
+                    int(args.tile_above * 1e6) if args.tile_above else None,
+                    int(args.max_pixels * 1e6) if args.max_pixels is not None else None)
+    if args.server:
+        # 常驻服务模式：省去本进程加载 Pillow/插件和创建进程池
+        from convert_server import run_remote, read_token
+        try:
+            token = read_token(args.server_token)
+        except RuntimeError as e:
+            print(f"错误：{e}", file=sys.stderr)
+            sys.exit(1)
+        stats = run_remote(args.server, valid_inputs, job, log, exts=input_exts, token=token)
+    else:
+        stats = convert_engine.run_batch(
+            valid_inputs, job, log, workers=max(1, args.workers), backend=args.backend,
+            schedule=args.schedule, incremental=args.incremental, manifest_path=args.manifest,
+            use_hash=args.hash, exts=input_exts,
+            memory_budget=args.memory_budget * 2**20 if args.memory_budget else None,
+            metrics_path=args.metrics, metrics_top=args.metrics_top,
+            dedup=args.dedup or ("bytes" if args.dedup_cache else None), dedup_cache=args.dedup_cache,
+            async_write=not args.sync_write, fsync=not args.no_fsync)
+
+    if stats['discovered'] == 0:
         print("错误：未找到有效的输入文件", file=sys.stderr)
         sys.exit(1)
 
-    # 多线程批量转换
-    success_count = 0
-    total = len(inputs)
-    max_workers = max(1, args.workers)
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(process_single_image, i+1, input_file, total, args)
-            for i, input_file in enumerate(inputs)
-        ]
-        for future in as_completed(futures):
-            input_file, result = future.result()
-            if result.get('success'):
-                success_count += 1
-            else:
-                print(f"失败：{os.path.basename(input_file)} - {result.get('error', '未知错误')}")
-
-    print(f"\n转换完成: 成功 {success_count}/{len(inputs)}")
-    print(f"失败数量: {len(inputs) - success_count}")
\ No newline at end of file
+    submitted = stats['completed'] + stats['failed']
+    print(f"\n转换完成: 成功 {stats['completed']}/{submitted}")
+    print(f"失败数量: {stats['failed']}")
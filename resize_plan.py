@@ -0,0 +1,208 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _numpy():
+    """延迟导入 numpy(只有预扫描才用到)，未安装时返回 None"""
+    try:
+        import numpy
+        return numpy
+    except ImportError:  # 未安装 numpy 时退回逐个计算
+        return None
+
+
+def read_info(path):
+    """只读取文件头(不解码像素)，返回 (宽, 高, 模式, 格式)，失败返回 None
+
+    不解码像素，不做 Pillow 的解压炸弹检查(解码前的像素上限由 convert_tiles.open_image 检查)。
+    """
+    try:
+        from convert_targets import load_codec
+        from convert_tiles import open_header
+        load_codec(os.path.splitext(str(path))[1])
+        with open_header(path) as image:
+            return image.width, image.height, image.mode, image.format
+    except Exception:
+        return None
+
+
+def read_header(path):
+    """只读取文件头(不解码像素)，返回 (宽, 高, 模式)，失败返回 None"""
+    info = read_info(path)
+    return info[:3] if info else None
+
+
+def probe_headers(paths, workers=8):
+    """并发读取整批文件头(IO 密集，用线程池)"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as probe:
+        return list(probe.map(read_header, paths))
+
+
+def calc_target_size(src_width, src_height, height, width, adjust_height, adjust_width):
+    """计算缩放目标尺寸，保持纵横比，不放大较小的图片；无需缩放时返回 None"""
+    if not ((adjust_height and src_height > height) or (adjust_width and src_width > width)):
+        return None
+    aspect_ratio = src_width / src_height
+    if adjust_height and adjust_width:
+        # 取高宽最低的那个数值为主
+        if height < width / aspect_ratio:
+            new_height = height
+            new_width = round(height * aspect_ratio)
+        else:
+            new_width = width
+            new_height = round(width / aspect_ratio)
+    elif adjust_height:
+        new_height = height
+        new_width = round(height * aspect_ratio)
+    else:
+        new_width = width
+        new_height = round(width / aspect_ratio)
+    return new_width, new_height
+
+
+def plan_sizes(src_widths, src_heights, height, width, adjust_height, adjust_width):
+    """向量化计算整批目标尺寸，规则与逐个计算(calc_target_size)完全一致
+
+    返回 (目标宽列表, 目标高列表, 是否缩放列表)
+    """
+    np = _numpy()
+    if np is None:
+        return _plan_sizes_py(src_widths, src_heights, height, width, adjust_height, adjust_width)
+    w = np.asarray(src_widths, dtype=np.float64)
+    h = np.asarray(src_heights, dtype=np.float64)
+    need = np.zeros(w.shape, dtype=bool)
+    if adjust_height:
+        need |= h > height
+    if adjust_width:
+        need |= w > width
+    aspect = w / np.where(h > 0, h, 1)
+    if adjust_height and adjust_width:
+        # 取高宽最低的那个数值为主
+        by_height = height < width / aspect
+        tw = np.where(by_height, np.round(height * aspect), width)
+        th = np.where(by_height, height, np.round(width / aspect))
+    elif adjust_height:
+        tw, th = np.round(height * aspect), np.full(w.shape, height)
+    elif adjust_width:
+        tw, th = np.full(w.shape, width), np.round(width / aspect)
+    else:
+        tw, th = w, h
+    tw = np.where(need, tw, w).astype(np.int64)
+    th = np.where(need, th, h).astype(np.int64)
+    return tw.tolist(), th.tolist(), need.tolist()
+
+
+def _plan_sizes_py(src_widths, src_heights, height, width, adjust_height, adjust_width):
+    tws, ths, needs = [], [], []
+    for w, h in zip(src_widths, src_heights):
+        size = calc_target_size(w, h, height, width, adjust_height, adjust_width)
+        tws.append(size[0] if size else w)
+        ths.append(size[1] if size else h)
+        needs.append(size is not None)
+    return tws, ths, needs
+
+
+def needs_mode_change(mode, img_format, preserve_alpha):
+    """按 process_file 的规则判断是否需要模式转换"""
+    fmt = img_format.lower()
+    if mode in ('1', 'P'):
+        return True
+    if fmt in ('jpg', 'jpeg'):
+        return mode != 'RGB'
+    return not preserve_alpha and fmt in ('png', 'webp', 'avif') and mode in ('RGBA', 'LA')
+
+
+# Pillow 各模式每像素占用的字节数，RGB/CMYK/LA 等多通道模式按 4 字节存储
+_MODE_BYTES = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'I;16L': 2, 'I;16B': 2, 'I;16N': 2}
+
+
+def mode_bytes(mode):
+    return _MODE_BYTES.get(mode, 4)
+
+
+def image_bytes(image):
+    """图像像素缓冲区大小(字节)"""
+    return image.width * image.height * mode_bytes(image.mode)
+
+
+def estimate_peak_bytes(src_size, mode, target_size, img_format, preserve_alpha=False, sharpness=1.0):
+    """按 process_file 的处理步骤估算单个任务的像素缓冲区峰值(偏保守的上界)
+
+    原图 + 模式转换副本 + 缩放结果 + 锐化结果 + 编码器工作区(按一份输出计)
+    """
+    src = src_size[0] * src_size[1]
+    out = target_size[0] * target_size[1] if target_size else src
+    peak = src * mode_bytes(mode)
+    if needs_mode_change(mode, img_format, preserve_alpha):
+        peak += src * 4
+    if target_size:
+        peak += out * 4
+    if sharpness != 1.0:
+        peak += out * 4
+    return peak + out * 4
+
+
+# 各格式在默认质量下每个输出像素的大致字节数(照片类内容的经验值)和对应的默认质量
+_BYTES_PER_PIXEL = {'jpg': (0.30, 90), 'jpeg': (0.30, 90), 'webp': (0.15, 80), 'avif': (0.10, 63), 'png': (1.5, None)}
+
+
+def estimate_output_bytes(out_pixels, img_format, quality=None):
+    """按输出像素数粗略预估编码后的字节数(只用于列表显示，不做试编码)
+
+    有损格式质量每偏离默认值 10，体积约变化一倍；PNG 与质量无关。
+    """
+    bpp, default_quality = _BYTES_PER_PIXEL.get(img_format.lower(), (0.3, None))
+    if default_quality is not None and quality is not None:
+        bpp *= 2 ** ((quality - default_quality) / 10)
+    return int(out_pixels * bpp)
+
+
+class ResizePlan:
+    """整批预扫描结果
+
+    entries: 每个可读文件一项 dict(path, src_size, mode, target_size, resize, mode_change, cost, peak_bytes)，
+    target_size 为 None 表示无需缩放(工作线程直接使用，不再计算)。
+    unreadable: 文件头读取失败的文件，仍交给工作线程处理以便记录错误。
+    """
+
+    def __init__(self, entries, unreadable):
+        self.entries = entries
+        self.unreadable = unreadable
+        self.source_pixels = sum(e['src_size'][0] * e['src_size'][1] for e in entries)
+        self.output_pixels = sum(e['out_pixels'] for e in entries)
+
+    def largest_first(self):
+        return sorted(self.entries, key=lambda e: e['cost'], reverse=True)
+
+
+def build_plan(files, height, width, adjust_height, adjust_width, img_format,
+               preserve_alpha=False, sharpness=1.0, workers=8, tile_pixels=None):
+    """只读文件头，为整批文件一次性算出缩放计划和预计输出像素总数
+
+    tile_pixels: 分条处理阈值(见 convert_tiles)，超过阈值且需要缩小的文件按分条模式估算峰值内存
+    """
+    from convert_tiles import task_peak_bytes
+    files = list(files)
+    headers = probe_headers(files, workers)
+    readable = [(f, hd) for f, hd in zip(files, headers) if hd is not None]
+    unreadable = [f for f, hd in zip(files, headers) if hd is None]
+    tws, ths, needs = plan_sizes([hd[0] for _, hd in readable], [hd[1] for _, hd in readable],
+                                 height, width, adjust_height, adjust_width)
+    entries = []
+    for (path, (w, h, mode)), tw, th, need in zip(readable, tws, ths, needs):
+        mode_change = needs_mode_change(mode, img_format, preserve_alpha)
+        out_pixels = tw * th
+        entries.append(dict(
+            path=path,
+            src_size=(w, h),
+            mode=mode,
+            target_size=(tw, th) if need else None,
+            resize=need,
+            mode_change=mode_change,
+            out_pixels=out_pixels,
+            # 解码按源像素计，编码(尤其 AVIF)每像素代价约为解码数倍
+            cost=w * h + 4 * out_pixels,
+            peak_bytes=task_peak_bytes((w, h), mode, (tw, th) if need else None,
+                                       img_format, preserve_alpha, sharpness, tile_pixels),
+        ))
+    return ResizePlan(entries, unreadable)
@@ -0,0 +1,66 @@
+import os
+import logging
+
+from PIL import Image
+
+import convert_engine
+from convert_engine import ConvertJob
+
+DURATIONS = [40, 120, 70, 200]
+
+
+def make_frames():
+    return [Image.new('RGB', (48, 32), (i * 60, 80, 200 - i * 40)) for i in range(len(DURATIONS))]
+
+
+def read_timing(path):
+    durations = []
+    with Image.open(path) as image:
+        for index in range(image.n_frames):
+            image.seek(index)
+            image.load()
+            durations.append(image.info['duration'])
+        return durations, image.info.get('loop')
+
+
+def convert(src, tmp_path):
+    out = tmp_path / "out"
+    ok, logs = convert_engine.process_file(str(src), ConvertJob(img_format='webp', output_dir=str(out)))
+    assert ok, logs
+    return out / (src.stem + ".webp")
+
+
+def test_gif_to_webp_keeps_timing(tmp_path):
+    src = tmp_path / "anim.gif"
+    frames = make_frames()
+    frames[0].save(src, save_all=True, append_images=frames[1:], duration=DURATIONS, loop=0)
+    assert read_timing(convert(src, tmp_path)) == (DURATIONS, 0)
+
+
+def test_webp_to_webp_keeps_timing(tmp_path):
+    src = tmp_path / "anim.webp"
+    frames = make_frames()
+    frames[0].save(src, save_all=True, append_images=frames[1:], duration=DURATIONS, loop=3, lossless=True)
+    assert read_timing(src) == (DURATIONS, 3)
+    assert read_timing(convert(src, tmp_path)) == (DURATIONS, 3)
+
+
+def test_batch_uses_no_frame_threads_when_pool_fills_cores(tmp_path, monkeypatch):
+    """工作数已占满各核时，每个动画只用 1 个帧线程"""
+    src = tmp_path / "in"
+    src.mkdir()
+    frames = make_frames()
+    frames[0].save(src / "anim.gif", save_all=True, append_images=frames[1:], duration=DURATIONS, loop=0)
+    seen = []
+    save_animation = convert_engine.save_animation
+
+    def record(image, path, job, *args, **kwargs):
+        seen.append(job.frame_workers)
+        return save_animation(image, path, job, *args, **kwargs)
+
+    monkeypatch.setattr(convert_engine, 'save_animation', record)
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    stats = convert_engine.run_batch([str(src)], ConvertJob(img_format='webp', output_dir=str(tmp_path / "out")),
+                                     logging.getLogger("test_animation"), workers=4)
+    assert stats['completed'] == 1 and seen == [1]
+    assert read_timing(tmp_path / "out" / "anim.webp")[0] == DURATIONS
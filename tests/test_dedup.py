@@ -0,0 +1,87 @@
+import time
+import logging
+import shutil
+from pathlib import Path
+
+from PIL import Image
+
+import convert_engine
+from convert_engine import ConvertJob
+from convert_dedup import Deduplicator
+
+
+def test_duplicates_served_from_cache_on_second_run(tmp_path):
+    """缓存命中的首个文件也要放行批内同内容的文件"""
+    src = tmp_path / "in"
+    src.mkdir()
+    Image.new('RGB', (64, 48), (9, 9, 9)).save(src / "a.jpg")
+    Image.new('RGB', (64, 48), (200, 9, 9)).save(src / "b.jpg")
+    shutil.copy(src / "a.jpg", src / "dup.jpg")
+    cache = tmp_path / "cache"
+    log = logging.getLogger("test_dedup")
+
+    for _ in range(2):
+        out = tmp_path / "out"
+        shutil.rmtree(out, ignore_errors=True)
+        job = ConvertJob(img_format='webp', output_dir=str(out))
+        stats = convert_engine.run_batch([str(src)], job, log, workers=2, dedup='bytes', dedup_cache=str(cache))
+        assert stats['completed'] == 3 and stats['failed'] == 0
+        assert sorted(p.name for p in out.iterdir()) == ['a.webp', 'b.webp', 'dup.webp']
+
+
+def test_duplicates_of_failed_leader_are_converted(tmp_path, monkeypatch):
+    """首个文件转换失败后，等待它的和之后到达的同内容文件都要各自转换"""
+    src = tmp_path / "in"
+    src.mkdir()
+    Image.new('RGB', (64, 48), (9, 9, 9)).save(src / "a.jpg")
+    for name in ("dup1.jpg", "dup2.jpg"):
+        shutil.copy(src / "a.jpg", src / name)
+    Image.new('RGB', (64, 48), (200, 9, 9)).save(src / "b.jpg")
+    process_file = convert_engine.process_file
+    failed = []
+
+    def fail_first_duplicate(file, job, **kwargs):
+        if not failed and 'b.jpg' not in str(file):
+            failed.append(file)
+            time.sleep(0.3)  # 其余同内容文件在此期间到达并等待
+            return False, [f"转换 {file} 失败。错误原因: 测试"]
+        return process_file(file, job, **kwargs)
+
+    monkeypatch.setattr(convert_engine, 'process_file', fail_first_duplicate)
+    for async_write in (False, True):
+        out = tmp_path / f"out{async_write}"
+        failed.clear()
+        job = ConvertJob(img_format='webp', output_dir=str(out))
+        stats = convert_engine.run_batch([str(src)], job, logging.getLogger("test_dedup"), workers=2,
+                                         dedup='bytes', async_write=async_write)
+        assert stats['completed'] == 3 and stats['failed'] == 1
+        written = {p.stem for p in out.iterdir()}
+        assert written == {'a', 'b', 'dup1', 'dup2'} - {Path(failed[0]).stem}
+
+
+def test_duplicate_of_failed_unique_file_is_not_parked(tmp_path):
+    """首个文件在唯一时就已失败，之后到达的同内容文件不能再等它"""
+    a = tmp_path / "a.bin"
+    a.write_bytes(b"x" * 10)
+    b = tmp_path / "b.bin"
+    b.write_bytes(b"x" * 10)
+    deduper = Deduplicator('bytes', 'fp', 'webp')
+    assert deduper.classify(str(a)) == ('encode', None)
+    assert deduper.failed(str(a)) == []
+    assert deduper.classify(str(b)) == ('encode', None)
+
+
+def test_cached_output_is_never_hardlinked(tmp_path):
+    """不保留修改时间时批内复制可用硬链接，但复用缓存文件不能，以免改写输出时损坏缓存"""
+    src = tmp_path / "in"
+    src.mkdir()
+    Image.new('RGB', (64, 48), (9, 9, 9)).save(src / "a.jpg")
+    cache = tmp_path / "cache"
+    job = ConvertJob(img_format='webp', output_dir=str(tmp_path / "out"), preserve_metadata=False)
+    log = logging.getLogger("test_dedup")
+    for _ in range(2):
+        shutil.rmtree(tmp_path / "out", ignore_errors=True)
+        convert_engine.run_batch([str(src)], job, log, workers=1, dedup='bytes', dedup_cache=str(cache))
+    cached = next(cache.rglob("*.webp"))
+    assert cached.stat().st_nlink == 1
+    assert (tmp_path / "out" / "a.webp").read_bytes() == cached.read_bytes()
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+from PIL import Image
+
+import convert_engine
+import convert_tiles
+from convert_engine import ConvertJob
+from convert_tiles import open_image, pillow_unlimited
+
+
+@pytest.fixture
+def small_limits(monkeypatch):
+    """把 Pillow 和默认像素上限都调到 1000 像素，用小图模拟超大图"""
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 500)
+    monkeypatch.setattr(convert_tiles, 'DEFAULT_MAX_PIXELS', 1000)
+
+
+def test_tiling_lifts_default_limit(tmp_path, small_limits):
+    """未指定上限时，分条处理的图像不受默认上限限制，不分条的仍报错"""
+    path = tmp_path / "big.png"
+    Image.new('RGB', (120, 100), (1, 2, 3)).save(path)
+    tiled = ConvertJob(img_format='webp', height=20, adjust_height=True, tile_pixels=5000)
+    with open_image(str(path), tiled) as image:
+        assert image.size == (120, 100)
+    with pytest.raises(ValueError):
+        open_image(str(path), ConvertJob(img_format='webp', height=20, adjust_height=True))
+    with pytest.raises(ValueError):
+        open_image(str(path), ConvertJob(img_format='webp', tile_pixels=5000))  # 无需缩小，不分条
+
+    ok, logs = convert_engine.process_file(str(path), tiled, output_path=str(tmp_path / "big.webp"))
+    assert ok is True, logs
+    with Image.open(tmp_path / "big.webp") as out:
+        assert out.size == (24, 20)
+    assert Image.MAX_IMAGE_PIXELS == 500
+
+
+def test_unlimited_is_per_thread(tmp_path, small_limits):
+    """一个线程跳过检查时，其他线程打开图像仍受 Pillow 保护"""
+    path = tmp_path / "big.png"
+    Image.new('L', (120, 100)).save(path)
+    inside = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with pillow_unlimited():
+            with Image.open(path):
+                inside.set()
+                release.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    try:
+        assert inside.wait(5)
+        with pytest.raises(Image.DecompressionBombError):
+            Image.open(path)
+    finally:
+        release.set()
+        thread.join()
@@ -0,0 +1,36 @@
+import pytest
+from PIL import Image
+
+from convert_tiles import resize_strips
+
+np = pytest.importorskip("numpy")  # numpy 为可选依赖
+
+
+def noise(mode, size, seed):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    data = rng.integers(0, 256, (height, width, len(mode)), dtype=np.uint8)
+    if 'A' in mode:
+        data[..., -1] = rng.integers(0, 64, (height, width))  # 大量低透明度像素
+    return Image.fromarray(data.squeeze(), mode)
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'LA', 'RGBA'])
+@pytest.mark.parametrize('resample', ['LANCZOS', 'BICUBIC', 'BILINEAR'])
+@pytest.mark.parametrize('target', [(247, 371), (333, 500), (123, 191)])
+def test_strips_match_whole_image_resize(tmp_path, mode, resample, target):
+    """非整数倍缩小：颜色差不超过 1 级，带透明通道时按预乘后的颜色比较"""
+    path = tmp_path / "src.png"
+    noise(mode, (600, 900), seed=len(mode)).save(path)
+    with Image.open(path) as image:
+        expected = np.asarray(image.resize(target, getattr(Image.Resampling, resample)), dtype=float)
+    with Image.open(path) as image:
+        actual = np.asarray(resize_strips(image, target, mode, resample, rows=64), dtype=float)
+    if 'A' in mode:
+        assert np.abs(actual[..., -1] - expected[..., -1]).max() <= 1
+        actual = actual[..., :-1] * actual[..., -1:] / 255
+        expected = expected[..., :-1] * expected[..., -1:] / 255
+        # 预乘颜色 = 颜色 × 透明度，两者各差 1 时最多差约 1 + 颜色/255
+        assert np.abs(actual - expected).max() <= 2
+    else:
+        assert np.abs(actual - expected).max() <= 1
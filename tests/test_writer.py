@@ -0,0 +1,18 @@
+from convert_writer import OutputWriter
+
+
+def test_failed_rename_rolls_back_other_outputs(tmp_path):
+    """一个源文件的多个输出中有一个无法重命名时，其余输出也不留下，临时文件全部清理"""
+    first = tmp_path / "a.webp"
+    blocked = tmp_path / "small" / "a.png"
+    blocked.mkdir(parents=True)
+    (blocked / "keep").write_bytes(b"")  # 非空目录，重命名到此处会失败
+    writer = OutputWriter(threads=1, fsync=False)
+    writer.submit('a', [(first, b"main"), (blocked, b"extra")])
+    writer.submit('b', [(tmp_path / "b.webp", b"other")])
+    writer.close()
+    results = dict(writer.completed())
+    assert results['a'] is not None and results['b'] is None
+    assert not first.exists()
+    assert (tmp_path / "b.webp").read_bytes() == b"other"
+    assert not list(tmp_path.rglob("*.tmp"))